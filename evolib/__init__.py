@@ -0,0 +1,4 @@
+"""
+Supporting modules for EvoLife: simulation backends and tools around them.
+
+"""
@@ -0,0 +1,181 @@
+"""
+CPU backend stepping only the active regions of the torus.
+
+Field is split into tiles. A cell's next state depends only on the cells
+within 2 of it (neighbours, and children of neighbours charging BIRTH_COST)
+and on its own RNG seed, so if nothing changed around a tile on the last
+step, the tile won't change on this one either. The counter-based crossover
+RNG has no seeds, but draws new numbers on each step, so tiles where cells
+were born are stepped again, just like tiles with changed seeds. Tiles changed on the last
+step, grown by one tile each way, are stepped with `evolib.cpu` routines,
+others are skipped. Empty board and static patterns cost next to nothing,
+while output is bit-identical to the dense step.
+
+Colors fade for a while after the field settles, so tiles with `img`
+still changing are flushed as well.
+
+State is tracked between calls for the usual double buffering, when each
+`ca_step(fld, fld_new, ...)` gets the previous `fld_new` as `fld`. Any
+other call pattern starts over from the whole field. Call `reset()` after
+changing arrays in place between steps.
+
+"""
+
+import numpy as np
+
+from evolib import cpu
+
+# step the whole field at once if this share of tiles is active
+DENSE_SHARE = 0.75
+
+
+def tile_size(length, tile):
+    """
+    Largest divisor of `length` not over `tile`, but at least 2 cells,
+    or the whole `length` if there is none.
+
+    """
+    for size in range(min(tile, length), 1, -1):
+        if length % size == 0:
+            return size
+    return length
+
+
+def grow(tiles, radius):
+    """
+    Add tiles within (rx, ry) `radius` to marked ones, on a torus.
+
+    """
+    res = tiles.copy()
+    for dx in range(-radius[0], radius[0] + 1):
+        for dy in range(-radius[1], radius[1] + 1):
+            res |= np.roll(tiles, (dx, dy), axis=(0, 1))
+    return res
+
+
+class ActiveBackend(object):
+    """
+    Same `ca_step` / `ca_flush` interface as `evolib.cpu`, with tiles
+    of about `tile` x `tile` cells. Single world only.
+
+    """
+
+    def __init__(self, tile=16):
+        self.tile = tile
+        self.reset()
+
+    def reset(self):
+        self.grid = None
+        self.last = None
+
+    def to_device(self, arr):
+        self.reset()
+        return np.array(arr)
+
+    def from_device(self, arr):
+        return np.asarray(arr)
+
+    def census(self, fld, w, h):
+        return cpu.census(fld, w, h)
+
+    def viewport(self, img, w, h, size, offset=(0, 0), zoom=1, factor=1):
+        return cpu.viewport(img, w, h, size, offset, zoom, factor)
+
+    def _setup(self, w, h):
+        tw, th = tile_size(w, self.tile), tile_size(h, self.tile)
+        self.grid = (w, h, tw, th)
+        self.shape = (w // tw, h // th)
+        # tiles far enough to be affected by a change 2 cells away
+        self.radius = (-(-2 // tw), -(-2 // th))
+        self.changed = np.ones(self.shape, dtype=bool)
+        self.img_changed = np.ones(self.shape, dtype=bool)
+
+    def tiles_any(self, mask):
+        """
+        Per-tile `any` of a field-sized boolean array.
+
+        """
+        w, h, tw, th = self.grid
+        return mask.reshape(w // tw, tw, h // th, th).any(axis=(1, 3))
+
+    def cells(self, tiles, halo=0):
+        """
+        Field (x, y) indices of cells in marked tiles, as (tiles, tw, th)
+        arrays, with `halo` extra cells around each tile.
+
+        """
+        w, h, tw, th = self.grid
+        tx, ty = np.nonzero(tiles)
+        xs = (tx[:, None] * tw + np.arange(-halo, tw + halo)) % w
+        ys = (ty[:, None] * th + np.arange(-halo, th + halo)) % h
+        return xs[:, :, None], ys[:, None, :]
+
+    def ca_step(self, fld, fld_new, seeds, bufs, img, w, h, death_speed, birth_cost, max_genes, rng=None):
+        if self.grid is None or self.grid[:2] != (w, h):
+            self._setup(w, h)
+        elif self.last is None or self.last[0] is not fld_new or self.last[1] is not fld:
+            self.changed[...] = True
+            self.img_changed[...] = True
+        active = grow(self.changed, self.radius)
+        if active.mean() > DENSE_SHARE and rng is not None:
+            births = np.zeros((w, h), dtype=bool)
+            res, charges = cpu.step_block(fld, None, death_speed, birth_cost, max_genes, rng=rng, births=births)
+            fld_new.view(np.uint32)[...] = res
+            if charges is not None:
+                bufs.view(np.uint32)[...] += charges
+            self.seeds_changed = self.tiles_any(births)
+            active[...] = True
+        elif active.mean() > DENSE_SHARE:
+            seeds_u = seeds.view(np.uint32)
+            old_seeds = seeds_u.copy()
+            cpu.ca_step(fld, fld_new, seeds, bufs, img, w, h, death_speed, birth_cost, max_genes)
+            self.seeds_changed = self.tiles_any(seeds_u != old_seeds)
+            active[...] = True
+        else:
+            xs, ys = self.cells(active, halo=1)
+            inner = xs[:, 1:-1], ys[:, :, 1:-1]
+            if rng is not None:
+                births = np.zeros((len(xs),) + self.grid[2:], dtype=bool)
+                res, charges = cpu.step_block(fld[xs, ys], None, death_speed, birth_cost, max_genes,
+                                              halo=1, halo_y=1, rng=rng, cell_ids=inner[0] * h + inner[1],
+                                              births=births)
+                changed = births.any(axis=(1, 2))
+            else:
+                seeds_u = seeds.view(np.uint32)
+                block_seeds = seeds_u[inner]
+                old_seeds = block_seeds.copy()
+                res, charges = cpu.step_block(fld[xs, ys], block_seeds, death_speed, birth_cost, max_genes,
+                                              halo=1, halo_y=1)
+                seeds_u[inner] = block_seeds
+                changed = (block_seeds != old_seeds).any(axis=(1, 2))
+            fld_new.view(np.uint32)[inner] = res
+            self.seeds_changed = np.zeros(self.shape, dtype=bool)
+            self.seeds_changed[active] = changed
+            if charges is not None:
+                charged = charges != 0
+                xs, ys = np.broadcast_arrays(xs, ys)
+                np.add.at(bufs.view(np.uint32), (xs[charged], ys[charged]), charges[charged])
+        self.active = active
+        self.last = (fld, fld_new)
+
+    def ca_flush(self, fld_new, bufs, img, w, h, fade_in, fade_out):
+        fld = self.last[0]
+        # charges land up to one cell away from stepped tiles
+        tiles = grow(self.active, (1, 1)) | self.img_changed
+        f_new, img_u = fld_new.view(np.uint32), img.view(np.uint32)
+        if tiles.mean() > DENSE_SHARE:
+            old_img = img_u.copy()
+            cpu.ca_flush(fld_new, bufs, img, w, h, fade_in, fade_out)
+            self.img_changed = self.tiles_any(img_u != old_img)
+            self.changed = self.tiles_any(f_new != fld.view(np.uint32))
+        else:
+            cells = self.cells(tiles)
+            block_fld, block_bufs, block_img = f_new[cells], bufs.view(np.uint32)[cells], img_u[cells]
+            old_img = block_img.copy()
+            cpu.ca_flush(block_fld, block_bufs, block_img, w, h, fade_in, fade_out)
+            f_new[cells], bufs.view(np.uint32)[cells], img_u[cells] = block_fld, block_bufs, block_img
+            self.img_changed = np.zeros(self.shape, dtype=bool)
+            self.img_changed[tiles] = (block_img != old_img).any(axis=(1, 2))
+            self.changed = np.zeros(self.shape, dtype=bool)
+            self.changed[tiles] = (block_fld != fld.view(np.uint32)[cells]).any(axis=(1, 2))
+        self.changed |= self.seeds_changed
@@ -0,0 +1,241 @@
+"""
+Throughput benchmark of presets on all available backends.
+
+Each case (preset, backend, field size) runs in a fresh process, so peak
+memory is its own and backends don't share caches. Fields are built with
+RANDOM_SEED=1, so every run starts from the same board. After `warmup`
+steps (CUDA compiles kernels on the first one), each step is timed by
+phase:
+- `ca_step` and `ca_flush`, the simulation itself;
+- `census`, species count as done for charts;
+- `frame`, full-field viewport rendered and copied to host, as the viewer does.
+Phases are synchronized with the device, so on CUDA their sum is slower
+than free-running steps.
+
+Cases run with the preset's crossover RNG unless `--crossover-rngs` lists
+others, see `evolib.world`. With `--metrics off on`, each case also runs
+with step counters streamed to a temporary `evolib.metrics` directory
+(CUDA and NumPy backends), the ring being drained after timed steps,
+and reports the overhead against the same case without them.
+
+Results are appended to a JSON lines file, with the commit and machine
+they were measured on; `--baseline` compares with an earlier file.
+
+Usage:
+    python -m evolib.bench [--presets bliamba conway] [--backends numpy active] \\
+        [--sizes 640x360 1280x720] [--crossover-rngs lcg counter] [--metrics off on] [--steps 20] \\
+        [--out bench.jsonl] [--baseline old.jsonl]
+
+"""
+
+import os, sys, json, time, shutil, tempfile, platform, argparse, resource, subprocess
+
+import numpy as np
+
+from evolib import world, metrics as step_metrics
+
+PHASES = ("ca_step", "ca_flush", "census", "frame")
+PRESETS = ("big_bang", "bliamba", "coexistence", "conway", "conway_mutated", "crossbreeding",
+           "primordinal_soup", "tutorial")
+METRICS_BACKENDS = ("cuda", "numpy")
+
+
+def available_backends():
+    names = ["numpy", "tiled", "active"]
+    try:
+        from evolib import cuda
+        names.insert(0, "cuda")
+    except ImportError:
+        pass
+    return names
+
+
+def commit():
+    """
+    Current git commit of the tree, None if it's not a git checkout.
+
+    """
+    try:
+        with open(os.devnull, "w") as null:
+            out = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=null,
+                                          cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process or any of its workers, in bytes.
+
+    """
+    usage = [resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    # kilobytes on Linux, bytes on macOS
+    return max(usage) * (1 if sys.platform == "darwin" else 1024)
+
+
+def run_case(preset, backend, width=None, height=None, steps=20, warmup=1, crossover_rng=None, metrics=False):
+    """
+    Time `steps` of `preset` on `backend` (by name), in this process,
+    with step `metrics` counted if set.
+    Return a result dict, phase times are in seconds per step.
+
+    """
+    overrides = dict(RANDOM_SEED=1)
+    if width and height:
+        overrides.update(FIELD_WIDTH=width, FIELD_HEIGHT=height)
+    if crossover_rng:
+        overrides.update(CROSSOVER_RNG=crossover_rng)
+    be = world.make_backend(backend)
+    w = world.World(world.load_preset(preset, **overrides), be)
+    p = w.preset
+    sync = getattr(be, "synchronize", lambda: None)
+    times = dict((phase, 0.0) for phase in PHASES)
+    directory = tempfile.mkdtemp(prefix="bench-metrics-") if metrics else None
+    stream = step_metrics.MetricsStream(be, directory, capacity=warmup + steps) if metrics else None
+    for i in range(warmup + steps):
+        options = {} if w.rng_key is None else {"rng": (w.rng_key, w.t + 1)}
+        flush_options = {}
+        stamps = [time.time()]
+        if stream:
+            flush_options = {"stats": stream.slot(w.t + 1)}
+            options.update(flush_options)
+        be.ca_step(w.fld, w.fld_new, w.seeds, w.bufs, w.img, w.width, w.height,
+                   p["DEATH_SPEED"], p["BIRTH_COST"], p["MAX_GENES"], **options)
+        sync()
+        stamps.append(time.time())
+        be.ca_flush(w.fld_new, w.bufs, w.img, w.width, w.height, p["FADE_IN"], p["FADE_OUT"], **flush_options)
+        sync()
+        stamps.append(time.time())
+        w.fld, w.fld_new = w.fld_new, w.fld
+        w.t += 1
+        be.census(w.fld, w.width, w.height)
+        stamps.append(time.time())
+        be.from_device(be.viewport(w.img, w.width, w.height, (w.width, w.height)))
+        stamps.append(time.time())
+        if i >= warmup:
+            for phase, start, end in zip(PHASES, stamps, stamps[1:]):
+                times[phase] += end - start
+    if stream:
+        stream.close()
+        shutil.rmtree(directory)
+    step_time = (times["ca_step"] + times["ca_flush"]) / steps
+    result = {
+        "preset": preset, "backend": backend, "width": w.width, "height": w.height, "steps": steps,
+        "crossover_rng": p["CROSSOVER_RNG"], "metrics": bool(metrics),
+        "steps_per_s": 1 / step_time if step_time else None,
+        "cells_per_s": w.width * w.height / step_time if step_time else None,
+        "phases": dict((phase, times[phase] / steps) for phase in PHASES),
+        "peak_rss": peak_rss(),
+    }
+    if hasattr(be, "memory_used"):
+        result["device_memory"] = be.memory_used()
+    if hasattr(be, "close"):
+        be.close()
+    return result
+
+
+def run_isolated(case):
+    """
+    `run_case` in a child process, return its result or an error dict.
+
+    """
+    cmd = [sys.executable, "-m", "evolib.bench", "--case", json.dumps(case)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    if proc.returncode:
+        return dict(case, error=err.decode("utf-8", "replace").strip().splitlines()[-1:])
+    return json.loads(out.decode("utf-8").strip().splitlines()[-1])
+
+
+def case_key(row):
+    return (row["preset"], row["backend"], row["width"], row["height"], row.get("crossover_rng", "lcg"),
+            row.get("metrics", False))
+
+
+def load_results(path):
+    """
+    Latest result of each (preset, backend, width, height, crossover RNG, metrics) in a results file.
+
+    """
+    results = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                if "error" not in row:
+                    results[case_key(row)] = row
+    return results
+
+
+def report(row, baseline=None, without_metrics=None):
+    """
+    Print a result row, compared with the same case in `baseline` results
+    and, for a metrics case, with the `without_metrics` row.
+
+    """
+    if "error" in row:
+        print("%-16s %-7s failed: %s" % (row["preset"], row["backend"], " ".join(row["error"])))
+        return
+    ph = row["phases"]
+    line = "%-16s %-7s %-7s %-7s %5dx%-5d %8.2f steps/s %9.3g cells/s | step %7.1f flush %7.1f census %7.1f frame %7.1f ms | %5d MB" % (
+        row["preset"], row["backend"], row.get("crossover_rng", "lcg"),
+        "metrics" if row.get("metrics") else "-", row["width"], row["height"],
+        row["steps_per_s"], row["cells_per_s"],
+        ph["ca_step"] * 1000, ph["ca_flush"] * 1000, ph["census"] * 1000, ph["frame"] * 1000,
+        row["peak_rss"] // (1 << 20))
+    old = (baseline or {}).get(case_key(row))
+    if old:
+        line += " | %+.1f%% vs %s" % ((row["steps_per_s"] / old["steps_per_s"] - 1) * 100, old.get("commit"))
+    if row.get("metrics") and without_metrics and "error" not in without_metrics:
+        line += " | metrics %+.1f%%" % ((row["steps_per_s"] / without_metrics["steps_per_s"] - 1) * 100)
+    print(line)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="EvoLife throughput benchmark.")
+    parser.add_argument("--presets", nargs="+", default=list(PRESETS))
+    parser.add_argument("--backends", nargs="+", default=None,
+                        help="backends to run (default: all available)")
+    parser.add_argument("--sizes", nargs="+", default=[None], metavar="WxH",
+                        help="field sizes (default: preset's own)")
+    parser.add_argument("--crossover-rngs", nargs="+", default=[None], choices=list(world.CROSSOVER_RNGS),
+                        help="crossover RNGs to run (default: preset's own)")
+    parser.add_argument("--metrics", nargs="+", default=["off"], choices=["off", "on"],
+                        help="run with step metrics counted, on %s backends (default: off)" %
+                             " and ".join(METRICS_BACKENDS))
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--out", default="bench.jsonl", help="results file, appended (default: bench.jsonl)")
+    parser.add_argument("--baseline", metavar="FILE", help="earlier results file to compare with")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.case:
+        print(json.dumps(run_case(**json.loads(args.case))))
+        return
+    baseline = load_results(args.baseline) if args.baseline else None
+    info = {"commit": commit(), "time": int(time.time()), "host": platform.node(),
+            "machine": platform.machine(), "python": platform.python_version(), "numpy": np.__version__}
+    sizes = [tuple(int(v) for v in size.split("x")) if size else (None, None) for size in args.sizes]
+    with open(args.out, "a") as f:
+        for preset in args.presets:
+            for width, height in sizes:
+                for backend in args.backends or available_backends():
+                    for crossover_rng in args.crossover_rngs:
+                        without_metrics = None
+                        for metrics in args.metrics:
+                            if metrics == "on" and backend not in METRICS_BACKENDS:
+                                continue
+                            case = dict(preset=preset, backend=backend, width=width, height=height,
+                                        steps=args.steps, warmup=args.warmup, crossover_rng=crossover_rng,
+                                        metrics=metrics == "on")
+                            row = dict(info, **run_isolated(case))
+                            report(row, baseline, without_metrics)
+                            if metrics == "off":
+                                without_metrics = row
+                            f.write(json.dumps(row, sort_keys=True) + "\n")
+                            f.flush()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
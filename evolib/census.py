@@ -0,0 +1,40 @@
+"""
+Species census over the genome space.
+
+Genome is only 17 bits, so a census is a 2 ** 17 bins histogram, counted
+by backends' `census(fld, w, h)` on the simulation side. Only the bins
+are transferred, never the field, and everything here is O(2 ** 17)
+whatever the field size, cheap enough to run every step.
+
+"""
+
+import numpy as np
+
+
+def species(counts):
+    """
+    Return (genomes, counts) of living species, most abundant first,
+    ties in genome order.
+
+    """
+    genomes = np.flatnonzero(counts[1:]) + 1
+    order = np.argsort(-counts[genomes], kind="mergesort")
+    return genomes[order], counts[genomes][order]
+
+
+def summary(counts):
+    """
+    Per-world summary of a (worlds, 2 ** 17) census, as a dict of arrays:
+    'population', 'species' (number of living genomes), 'dominant'
+    (most abundant genome, 0 if extinct) and 'dominant_count'.
+
+    """
+    living = counts[:, 1:]
+    dominant = np.argmax(living, axis=1)
+    dominant_count = living[np.arange(len(living)), dominant]
+    return {
+        "population": living.sum(axis=1),
+        "species": np.count_nonzero(living, axis=1),
+        "dominant": np.where(dominant_count > 0, dominant + 1, 0),
+        "dominant_count": dominant_count,
+    }
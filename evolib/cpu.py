@@ -0,0 +1,527 @@
+"""
+NumPy implementation of the `ca_step` / `ca_flush` CUDA kernels.
+
+Whole-field operations only: neighbours are fetched with torus `np.roll`,
+birth search and crossover are done with bit masks over the arrays.
+Field output is bit-identical to the CUDA kernels for the same `seeds`,
+or the same `rng` key and step with the counter-based crossover RNG.
+Image colors are computed in float32 too, but nvcc may contract some of
+`hsv2rgb` multiplications into FMA, so `img` could differ by one unit
+in rare cases. Image is for display only and is never fed back.
+
+All arrays are (width, height) C-ordered, like on the GPU side.
+They may be either int32 or uint32, and are updated in place.
+A batch of same-sized worlds may be stepped at once as (worlds, width, height)
+arrays, with constants given either as scalars or as per-world arrays.
+
+Birth search benchmark, time per step and its share spent searching for
+births, with kernel's loop and with lookup tables:
+    python -m evolib.cpu [steps [preset ...]]
+
+"""
+
+import sys, time
+
+import numpy as np
+
+from evolib.metrics import METRICS
+
+# neighbours offsets (dx, dy), in the same order as f1..f8 in `ca_step`
+NEIGHBOURS = ((-1, -1), (0, -1), (1, -1),
+              (-1, 0), (1, 0),
+              (-1, 1), (0, 1), (1, 1))
+
+GENOME_MASK = 0x1ffff
+NUM_GENES = 17
+
+
+def to_device(arr):
+    return np.array(arr)
+
+
+def from_device(arr):
+    return np.asarray(arr)
+
+
+def lcg(seed):
+    """
+    Crossover RNG, uint32 arithmetic just like in the kernel.
+
+    """
+    return ((seed * 58321 + 11113) & 0xffffffff) % 65535
+
+
+def mix32(x):
+    """
+    Murmur3 finalizer of uint32 values, held in uint64 arrays.
+
+    """
+    x = np.asarray(x, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        x = x ^ (x >> np.uint64(16))
+        x = (x * np.uint64(0x85ebca6b)) & np.uint64(0xffffffff)
+        x = x ^ (x >> np.uint64(13))
+        x = (x * np.uint64(0xc2b2ae35)) & np.uint64(0xffffffff)
+        return x ^ (x >> np.uint64(16))
+
+
+def counter_seed(key, step, cell):
+    """
+    Counter-based crossover RNG state of `cell` (index in its world)
+    on `step` of a run keyed by `key`. Nothing is stored between steps.
+
+    """
+    key = np.asarray(key, dtype=np.int64) & 0xffffffff
+    base = mix32(mix32(np.int64(step) & 0xffffffff) ^ key.astype(np.uint64))
+    return mix32(base ^ np.asarray(cell, dtype=np.uint64))
+
+
+def counter_rng(seed, gene):
+    """
+    Counter-based crossover RNG value for `gene`, in [0, 65535) like `lcg`.
+
+    """
+    with np.errstate(over="ignore"):
+        x = (seed + np.uint64(gene) * np.uint64(0x9e3779b9)) & np.uint64(0xffffffff)
+    return (mix32(x) % np.uint64(65535)).astype(np.int64)
+
+
+def neighbours(fld):
+    """
+    List of 8 arrays, k-th one holding k-th neighbour of each cell.
+
+    """
+    return [np.roll(fld, (-dx, -dy), axis=(-2, -1)) for dx, dy in NEIGHBOURS]
+
+
+# expected 4-bit neighbour counts of the 8 birth rule lanes, bit by bit:
+# lane j is born from exactly j + 1 neighbours with its bit set
+BIRTH_COUNTS = tuple(sum((((j + 1) >> i) & 1) << j for j in range(8)) for i in range(4))
+
+# highest set bit of a birth mask, i.e. winning number of parents
+BIRTH_N = np.array([m.bit_length() for m in range(256)], dtype=np.uint8)
+
+
+def birth_mask(nbrs):
+    """
+    Bit mask of N each cell could be born from: bit N - 1 is set if exactly
+    N neighbours have birth rule bit N - 1. Birth rule bytes of neighbours
+    are summed lane-wise by bit-sliced adders into 4 counter planes, so all
+    8 rules are checked at once. `nbrs` may be any iterable of planes,
+    like a generator rolling them one at a time.
+
+    """
+    counts = None
+    for nb in nbrs:
+        bits = (nb & 0xff).astype(np.uint8)
+        if counts is None:
+            counts = [np.zeros_like(bits) for i in range(4)]
+        for i in range(3):
+            carry = counts[i] & bits
+            counts[i] ^= bits
+            bits = carry
+        counts[3] |= bits
+    mask = np.full(counts[0].shape, 0xff, dtype=np.uint8)
+    for c, expected in zip(counts, BIRTH_COUNTS):
+        mask &= ~(c ^ np.uint8(expected))
+    return mask
+
+
+def birth_search(f0, nbrs):
+    """
+    Return number of neighbours N (0 if none) each cell would be born from.
+    Larger N is winning, like in `for (int ni = 8; ni > 0; ni--)` loop.
+
+    """
+    return BIRTH_N[birth_mask(nbrs)]
+
+
+def birth_search_loop(f0, nbrs):
+    """
+    `birth_search` as a straight port of the kernel's loop, up to 64 bit
+    tests per cell. Reference for benchmarks.
+
+    """
+    birth_n = np.zeros(f0.shape, dtype=np.uint8)
+    for ni in range(8, 0, -1):
+        fits = sum(((nb >> (ni - 1)) & 1).astype(np.uint8) for nb in nbrs)
+        birth_n[(birth_n == 0) & (fits == ni)] = ni
+    return birth_n
+
+
+def per_world(param, ndim):
+    """
+    Shape a scalar or per-world constant to broadcast over `ndim`-D fields.
+
+    """
+    param = np.asarray(param, dtype=np.int64)
+    if param.ndim:
+        param = param.reshape(param.shape + (1,) * (ndim - param.ndim))
+    return param
+
+
+def crossover(parents, ni, seed, max_genes, birth_cost, counter=False):
+    """
+    Breed new genomes for born cells.
+
+    `parents` is a list of 8 int64 arrays with neighbours of born cells,
+    `ni` is a number of parents and `seed` is cells' RNG state, LCG one
+    or, with `counter`, from `counter_seed`.
+    `max_genes` is either a scalar or an array for each born cell.
+    Return (genomes, owed), where `owed` is a list of 8 arrays with
+    a number of genes passed by each parent (None if birth is free).
+
+    """
+    fits = [(p >> (ni - 1)) & 1 for p in parents]
+    child = np.zeros(len(ni), dtype=np.int64)
+    genes_num = np.zeros(len(ni), dtype=np.int64)
+    owed = [np.zeros(len(ni), dtype=np.int64) for _ in parents] if np.any(birth_cost) else None
+    for gene in range(NUM_GENES):
+        rng = counter_rng(seed, gene) if counter else lcg(seed + gene)
+        fgs = [(p >> gene) & ff for p, ff in zip(parents, fits)]
+        passed = ((sum(fgs) * 65535) // ni > rng).astype(np.int64)
+        child |= passed << gene
+        genes_num += passed
+        if owed is not None:
+            for k, fg in enumerate(fgs):
+                owed[k] += fg & passed
+    child[genes_num > max_genes] = 0
+    return child, owed
+
+
+def parents_charges(shape, born, owed, birth_cost):
+    """
+    BIRTH_COST energy owed by each parent, as a plane of `bufs` increments.
+    This is an equivalent of kernel's `atomicAdd`s.
+    `birth_cost` is either a scalar or an array for each born cell.
+
+    """
+    w, h = shape[-2:]
+    base = born - born % (w * h)
+    x, y = born % (w * h) // h, born % h
+    targets = []
+    for (dx, dy) in NEIGHBOURS:
+        targets.append(base + ((x + dx) % w) * h + (y + dy) % h)
+    weights = np.concatenate([genes * birth_cost for genes in owed])
+    charges = np.bincount(np.concatenate(targets), weights, int(np.prod(shape)))
+    charges = (charges.astype(np.int64) << 17) & 0xffffffff
+    return charges.astype(np.uint32).reshape(shape)
+
+
+def gather_charges(shape, cells, owed, birth_cost):
+    """
+    Same as `parents_charges`, but each cell sums energy owed to its
+    neighbours, as the kernel's `gather` mode does.
+
+    """
+    charges = np.zeros(shape, dtype=np.int64)
+    for (dx, dy), genes in zip(NEIGHBOURS, owed):
+        plane = np.zeros(shape, dtype=np.int64)
+        plane[cells] = genes * birth_cost
+        charges += np.roll(plane, (dx, dy), axis=(-2, -1))
+    return ((charges << 17) & 0xffffffff).astype(np.uint32)
+
+
+def world_sums(values):
+    """
+    Sums of (..., w, h) `values` over each world's cells.
+
+    """
+    return values.reshape(values.shape[:-2] + (-1,)).sum(axis=-1, dtype=np.uint64)
+
+
+def add_stats(stats, **values):
+    for name, value in values.items():
+        stats[..., METRICS.index(name)] += value
+
+
+def lineage_keys(parents, ni, child, worlds, step):
+    """
+    Keys of parent -> child edges for crossover births, as the kernel's
+    `lineage_add` makes them: step, world, parent and child genomes packed
+    in 64 bits. Births of a genome one of its parents already has are
+    skipped, each distinct parent genome is counted once per birth.
+
+    """
+    fits = [((p >> (ni - 1)) & 1) == 1 for p in parents]
+    genomes = [p & GENOME_MASK for p in parents]
+    novel = child != 0
+    for ff, g in zip(fits, genomes):
+        novel &= ~ff | (g != child)
+    tag = (np.uint64(step) << np.uint64(54)) | (worlds.astype(np.uint64) << np.uint64(34))
+    keys = []
+    for m, (ff, g) in enumerate(zip(fits, genomes)):
+        first = novel & ff
+        for j in range(m):
+            first &= ~fits[j] | (genomes[j] != g)
+        keys.append((tag | (g.astype(np.uint64) << np.uint64(17)) | child.astype(np.uint64))[first])
+    return np.concatenate(keys)
+
+
+def edge_add(keys, counts, new):
+    """
+    Count `new` keys in a (keys, counts) lineage table, filled from its start
+    here and kept sorted. As in the kernel's hash table, keys already in
+    a full table go on counting, and last counter is for events of other
+    keys, dropped.
+
+    """
+    used = np.count_nonzero(keys)
+    slots = len(keys)
+    uniq, n = np.unique(new, return_counts=True)
+    idx = np.searchsorted(keys[:used], uniq)
+    found = idx < used
+    found[found] = keys[idx[found]] == uniq[found]
+    counts[idx[found]] += n[found].astype(counts.dtype)
+    kept = min(np.count_nonzero(~found), slots - used)
+    merged = np.concatenate([keys[:used], uniq[~found][:kept]])
+    total = np.concatenate([counts[:used], n[~found][:kept]])
+    order = np.argsort(merged, kind="mergesort")
+    keys[:len(merged)] = merged[order]
+    counts[:len(merged)] = total[order]
+    counts[slots] += int(n[~found][kept:].sum())
+
+
+def step_block(fld, seeds, death_speed, birth_cost, max_genes, halo=0, halo_y=0, gather=False, stats=None,
+               lineage=None, rng=None, cell_ids=None, births=None):
+    """
+    Step a (w, h) block of the field, wrapped as a torus,
+    or a batch of them as a (worlds, w, h) array.
+
+    First and last `halo` rows (and `halo_y` columns) are neighbours
+    context only, they are neither stepped nor breeding. `seeds` are for
+    inner cells and updated in place. Return (fld_new, charges): new inner
+    cells as uint32 array and BIRTH_COST increments for `bufs` over the
+    whole block, including halo (None if birth is free).
+    With `rng` (key, step), crossover uses the counter-based RNG instead
+    and `seeds` is not used: inner cells are numbered by `cell_ids`, their
+    indices in the whole field, by default x * h + y in the block itself.
+    `births`, a bool array of inner cells, is set where cells were born.
+    With `gather`, charges are added to new cells instead, for whole
+    fields only. Step counters are added to `stats`, see `evolib.metrics`,
+    and crossover events to `lineage` (keys, counts, step) table, see
+    `evolib.lineage`, for whole fields only too.
+
+    """
+    if gather and (halo or halo_y):
+        raise ValueError("Gathered charges need the whole field.")
+    f0 = fld.view(np.uint32)
+    w, h = f0.shape[-2:]
+    nbrs = neighbours(f0)
+    n = sum((nb != 0).astype(np.uint8) for nb in nbrs)
+    dying = (f0 >> 17 >= 0xff) | (n == 0) | ((f0 != 0) & (((f0 >> 8) >> n) & 1 == 0))
+    birth_n = birth_search(f0, nbrs)
+    birth_n[dying] = 0
+    if halo:
+        birth_n[..., :halo, :] = 0
+        birth_n[..., w - halo:, :] = 0
+    if halo_y:
+        birth_n[..., :halo_y] = 0
+        birth_n[..., h - halo_y:] = 0
+    res = f0.copy()
+    charges = None
+    cost = 0
+    born = np.flatnonzero(birth_n)
+    if len(born):
+        cells = np.unravel_index(born, f0.shape)
+        per_birth = lambda param: np.broadcast_to(per_world(param, f0.ndim), f0.shape)[cells]
+        ni = birth_n[cells].astype(np.int64)
+        parents = [nb[cells].astype(np.int64) for nb in nbrs]
+        seeds_cells = cells[:-2] + (cells[-2] - halo, cells[-1] - halo_y)
+        if rng is not None:
+            key, step = rng
+            ids = born % (w * h) if cell_ids is None else cell_ids[seeds_cells]
+            seed = counter_seed(per_birth(key), step, ids)
+        else:
+            seeds_u = seeds.view(np.uint32)
+            seed = seeds_u[seeds_cells].astype(np.int64)
+        costs = per_birth(birth_cost)
+        child, owed = crossover(parents, ni, seed, per_birth(max_genes), costs, counter=rng is not None)
+        res[cells] = child
+        if rng is None:
+            seeds_u[seeds_cells] = lcg(seed)
+        if births is not None:
+            births[seeds_cells] = True
+        if lineage is not None:
+            keys, counts, step = lineage
+            worlds = cells[0] if f0.ndim > 2 else np.zeros(len(born), dtype=np.int64)
+            edge_add(keys, counts, lineage_keys(parents, ni, child, worlds, step))
+        if owed is not None and stats is not None:
+            worlds = cells[0] if f0.ndim > 2 else np.zeros(len(born), dtype=np.int64)
+            cost = np.bincount(worlds, sum(owed) * costs, int(np.prod(f0.shape[:-2])))
+            cost = cost.astype(np.uint64).reshape(f0.shape[:-2])
+        if owed is not None and gather:
+            charges = gather_charges(f0.shape, cells, owed, costs)
+        elif owed is not None:
+            charges = parents_charges(f0.shape, born, owed, costs)
+    # same genome (no birth or re-occupation with the same genes) is aging
+    same = (res & GENOME_MASK) == (f0 & GENOME_MASK)
+    aged = f0 + ((per_world(death_speed, f0.ndim) << 17) & 0xffffffff).astype(np.uint32)
+    res = np.where(same, np.where(f0 != 0, aged, f0), res)
+    res[dying] = 0
+    if stats is not None:
+        g0, g1 = f0 & GENOME_MASK, res & GENOME_MASK
+        starved = f0 >> 17 >= 0xff
+        add_stats(stats, births=world_sums((g1 != 0) & (g0 == 0)),
+                  reoccupations=world_sums((g1 != 0) & (g0 != 0) & (g1 != g0)),
+                  deaths_starvation=world_sums(dying & (g0 != 0) & starved),
+                  deaths_sustain=world_sums(dying & (g0 != 0) & ~starved), birth_cost=cost)
+    if gather:
+        return res + charges if charges is not None else res, None
+    return res[..., halo:w - halo, halo_y:h - halo_y], charges
+
+
+def ca_step(fld, fld_new, seeds, bufs, img, w, h, death_speed, birth_cost, max_genes, gather=False, stats=None,
+            lineage=None, rng=None):
+    """
+    One step of the automaton, from `fld` into `fld_new`.
+    BIRTH_COST energy is accumulated in `bufs`, apply it with `ca_flush`,
+    or added to `fld_new` right away with `gather`.
+    With `rng` (key, step), key being a scalar or per-world, crossover uses
+    the counter-based RNG and `seeds` may be None.
+    `img` is not touched, it is here to mirror the kernel's signature.
+
+    """
+    res, charges = step_block(fld, seeds, death_speed, birth_cost, max_genes, gather=gather, stats=stats,
+                              lineage=lineage, rng=rng)
+    fld_new.view(np.uint32)[...] = res
+    if charges is not None:
+        bufs.view(np.uint32)[...] += charges
+
+
+def hsv2rgb(hue, sat, val):
+    """
+    Vectorized float32 port of the kernel's `hsv2rgb`.
+
+    """
+    one = np.float32(1)
+    h = hue.astype(np.float32)
+    s = np.minimum(np.float32(255), sat.astype(np.float32)) / np.float32(255)
+    v = np.float32(min(255, val))
+    f = h / np.float32(60)
+    hi = np.floor(f)
+    f = f - hi
+    p = (v * (one - s)).astype(np.int64)
+    q = (v * (one - s * f)).astype(np.int64)
+    t = (v * (one - s * (one - f))).astype(np.int64)
+    v = np.full(h.shape, int(v), dtype=np.int64)
+    sectors = [(hi == 0) | (hi == 6), hi == 1, hi == 2, hi == 3, hi == 4]
+    r = np.select(sectors, [v, q, p, p, t], v)
+    g = np.select(sectors, [t, v, v, q, p], p)
+    b = np.select(sectors, [p, p, t, v, v], q)
+    return b + (g << 8) + (r << 16)
+
+
+def ca_flush(fld_new, bufs, img, w, h, fade_in, fade_out, gather=False, stats=None):
+    """
+    Apply accumulated `bufs` energy (unless `gather`ed by `ca_step`), kill
+    exhausted cells, clear `bufs` and fade `img` colors towards the new
+    field state. Counters of the final field are added to `stats`.
+
+    """
+    f0 = fld_new.view(np.uint32)
+    if not gather:
+        b = bufs.view(np.uint32)
+        f0 += b
+        b[...] = 0
+    energy = f0 >> 17
+    if stats is not None:
+        alive = (f0 & GENOME_MASK) != 0
+        starved = alive & (energy > 0xff)
+        alive &= ~starved
+        add_stats(stats, deaths_starvation=world_sums(starved), live=world_sums(alive),
+                  energy=world_sums(np.where(alive, energy, 0)))
+    f0[energy > 0xff] = 0
+    energy = np.minimum(energy, 0xff)
+    tc = hsv2rgb((f0 & GENOME_MASK) % 360, 0xff - energy, 255)
+    tc[f0 == 0] = 0
+    img0 = img.view(np.uint32).astype(np.int64)
+    fade_in, fade_out = per_world(fade_in, f0.ndim), per_world(fade_out, f0.ndim)
+    res = 0
+    for shift in (16, 8, 0):
+        tv = (tc >> shift) & 0xff
+        cv = (img0 >> shift) & 0xff
+        cv = np.maximum(np.minimum(tv, cv + fade_in), cv - fade_out)
+        res = res + (cv << shift)
+    img.view(np.uint32)[...] = res
+
+
+def rgb_bytes(pixels):
+    """
+    (..., 3) uint8 view of r, g, b bytes of 0xrrggbb pixels array.
+
+    """
+    pixels = np.ascontiguousarray(pixels).astype("<u4", copy=False)
+    return pixels.view(np.uint8).reshape(pixels.shape + (4,))[..., 2::-1]
+
+
+def viewport(img, w, h, size, offset=(0, 0), zoom=1, factor=1):
+    """
+    Screen image of `size` (width, height) as (width, height, 3) uint8 RGB
+    array. Field is shifted by `offset` cells on the torus, magnified `zoom`
+    times, then shrunk `factor` times with a box filter. Only pixels shown
+    are sampled, so temporaries are screen-sized whatever the field size.
+
+    """
+    sw, sh = size
+    xs = (np.arange(sw * factor) // zoom - offset[0]) % w
+    ys = (np.arange(sh * factor) // zoom - offset[1]) % h
+    u = img.view(np.uint32)
+    if factor == 1:
+        return rgb_bytes(u[xs[:, None], ys[None, :]]).copy()
+    # box filter, one screen-sized sample of each block at a time
+    rgb = np.zeros((sw, sh, 3), dtype=np.uint32)
+    for i in range(factor):
+        for j in range(factor):
+            rgb += rgb_bytes(u[xs[i::factor, None], ys[None, j::factor]])
+    rgb //= factor * factor
+    return rgb.astype(np.uint8)
+
+
+def census(fld, w, h):
+    """
+    Number of cells of each genome, as (2 ** 17,) int64 array,
+    or (worlds, 2 ** 17) for a batch. Bin 0 counts empty cells.
+
+    """
+    genomes = fld.view(np.uint32) & GENOME_MASK
+    lead = genomes.shape[:-2]
+    size = int(np.prod(lead))
+    offsets = (np.arange(size, dtype=np.int64) << NUM_GENES).reshape(lead + (1, 1))
+    counts = np.bincount((genomes + offsets).ravel(), minlength=size << NUM_GENES)
+    return counts.reshape(lead + (1 << NUM_GENES,))
+
+
+def benchmark(presets=("bliamba", "big_bang"), steps=20):
+    """
+    Run presets on this backend, timing both birth search variants on
+    each step's field. Return a list of (preset, step time, loop search
+    time, table search time) tuples, in seconds per step. Steps use tables,
+    time of a step with the loop is step - table + loop.
+
+    """
+    from evolib import world
+    results = []
+    for name in presets:
+        w = world.World(world.load_preset(name, RANDOM_SEED=1))
+        times = np.zeros(3)
+        for i in range(steps):
+            f0 = w.fld.view(np.uint32)
+            nbrs = neighbours(f0)
+            for k, search in ((1, birth_search_loop), (2, birth_search)):
+                start_time = time.time()
+                search(f0, nbrs)
+                times[k] += time.time() - start_time
+            start_time = time.time()
+            w.step()
+            times[0] += time.time() - start_time
+        results.append((name,) + tuple(times / steps))
+    return results
+
+
+if __name__ == '__main__':
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for name, step, loop, table in benchmark(sys.argv[2:] or ("bliamba", "big_bang"), steps):
+        before = step - table + loop
+        print("%-10s loop: %6.1f ms/step, %4.1f%% search   tables: %6.1f ms/step, %4.1f%% search" % (
+            name, before * 1000, loop / before * 100, step * 1000, table / step * 100))
@@ -0,0 +1,680 @@
+"""
+CUDA backend, `ca_step` / `ca_flush` ElementwiseKernels.
+
+Kernel constants (DEATH_SPEED, BIRTH_COST, MAX_GENES, FADE_IN, FADE_OUT)
+are passed as kernel arguments, so a single compiled kernel serves any
+configuration, and many configurations may run in one process.
+Arrays may hold a batch of same-sized worlds, (worlds, width, height),
+with constants given per world: each world is a separate torus.
+Compiled kernels are cached per process, keyed by source hash. PyCUDA also
+keeps binaries in its on-disk cache, so nvcc runs once per kernel source.
+
+BIRTH_COST is either scattered to `bufs` with `atomicAdd`s, or, with
+`gather`, charged by each parent re-evaluating births around it. Benchmark
+of both on a preset, checking they give the same field:
+    python -m evolib.cuda [preset [steps]]
+
+"""
+
+import sys, time, hashlib, collections
+
+import numpy as np
+import pycuda.autoinit
+import pycuda.driver as drv
+import pycuda.gpuarray as gpuarray
+from pycuda.elementwise import ElementwiseKernel
+
+from evolib import metrics
+
+STEP_ARGS = "unsigned int *fld, unsigned int *fld_new, unsigned int *seeds, unsigned int *bufs, unsigned int *img, int w, int h, int *death_speeds, int *birth_costs, int *max_genes_k"
+
+STEP_SOURCE = """
+    // world in a batch and its constants
+    int k = i / (w * h);
+    int base = k * w * h;
+    int death_speed = death_speeds[k];
+    int birth_cost = birth_costs[k];
+    int max_genes = max_genes_k[k];
+    int x = (i - base) / h;
+    int y = (i - base) % h;
+    // torus topology emulation
+    int xm1 = x - 1; if (xm1 < 0) xm1 = w + xm1;
+    int xp1 = x + 1; if (xp1 >= w) xp1 = xp1 - w;
+    int ym1 = y - 1; if (ym1 < 0) ym1 = h + ym1;
+    int yp1 = y + 1; if (yp1 >= h) yp1 = yp1 - h;
+    // cache neighbours values
+    uint f0 = fld[i];
+    uint f1 = fld[base + xm1 * h + ym1];
+    uint f2 = fld[base + x * h + ym1];
+    uint f3 = fld[base + xp1 * h + ym1];
+    uint f4 = fld[base + xm1 * h + y];
+    uint f5 = fld[base + xp1 * h + y];
+    uint f6 = fld[base + xm1 * h + yp1];
+    uint f7 = fld[base + x * h + yp1];
+    uint f8 = fld[base + xp1 * h + yp1];
+    uint energy = (f0 >> 17);
+    // counter-based crossover RNG state of the step, hashed with cell index
+    uint rng_base = 0;
+#if COUNTER_RNG
+    rng_base = mix32(mix32(rng_step) ^ (uint) rng_keys[k]);
+#endif
+    // BIRTH_COST energy owed for neighbours born on this step
+    uint charges = 0;
+    // step counters, see evolib.metrics
+    uint m_born = 0, m_reocc = 0, m_starved = 0, m_sustain = 0, m_cost = 0;
+#if GATHER
+    if (birth_cost) charges = owed_charges(fld, seeds, rng_base, base, x, y, w, h, birth_cost);
+#endif
+    // total number of neighbours
+    int N = EXISTS(f1) + EXISTS(f2) + EXISTS(f3) + EXISTS(f4) +
+            EXISTS(f5) + EXISTS(f6) + EXISTS(f7) + EXISTS(f8);
+    if (energy >= 0xff || N == 0 || f0 > 0 && (((f0 >> 8) & (1 << N)) == 0)) {
+        // cell is dying
+        fld_new[i] = charges;
+        if (f0 & 0x1ffff) {
+            if (energy >= 0xff) m_starved = 1; else m_sustain = 1;
+        }
+        //img[i] = fadeout(img0, 5);
+    } else {
+        uint f00 = f0;
+        // birth rule bytes of neighbours summed lane-wise into 4-bit counters,
+        // bit N-1 of `births` is set if exactly N neighbours have rule bit N-1
+        uint c0 = 0, c1 = 0, c2 = 0, c3 = 0;
+        ADD_LANES(f1); ADD_LANES(f2); ADD_LANES(f3); ADD_LANES(f4);
+        ADD_LANES(f5); ADD_LANES(f6); ADD_LANES(f7); ADD_LANES(f8);
+        uint births = ~(c0 ^ 0x55) & ~(c1 ^ 0x66) & ~(c2 ^ 0x78) & ~(c3 ^ 0x80) & 0xff;
+        // larger number of parents is winning
+        int ni = 32 - __clz(births);
+        if (ni > 0) {
+            // cache neighbours breeding fitnesses 
+            int ff1 = FIT(f1, ni);
+            int ff2 = FIT(f2, ni);
+            int ff3 = FIT(f3, ni);
+            int ff4 = FIT(f4, ni);
+            int ff5 = FIT(f5, ni);
+            int ff6 = FIT(f6, ni);
+            int ff7 = FIT(f7, ni);
+            int ff8 = FIT(f8, ni);
+            // neighbours able to breed, cell is born
+            f0 = 0;
+            uint gene_num = 0;
+            //int genes_count = max_genes;
+            //int gene;
+            uint nit = (int) (ni / 2);
+            uint seed = CELL_SEED(i - base);
+            uint nonzero_genes_num = 0;
+            while (gene_num < 17) {
+                // pseudorandom cross breeding
+                uint rng = CROSSOVER_RNG(seed, gene_num);
+                uint fg1 = (f1 >> gene_num) & ff1;
+                uint fg2 = (f2 >> gene_num) & ff2;
+                uint fg3 = (f3 >> gene_num) & ff3;
+                uint fg4 = (f4 >> gene_num) & ff4;
+                uint fg5 = (f5 >> gene_num) & ff5;
+                uint fg6 = (f6 >> gene_num) & ff6;
+                uint fg7 = (f7 >> gene_num) & ff7;
+                uint fg8 = (f8 >> gene_num) & ff8;
+                int n1 = fg1 + fg2 + fg3 + fg4 + fg5 + fg6 + fg7 + fg8;
+
+                //if ((int) (n1 * 65535 / ni) < 65535 && (int) (n1 * 65535 / ni) > 0)
+                //    printf("%d %d | ", rng, (int) (n1 * 65535 / ni));
+                //if (n1 > nit) {
+                if ((int) (n1 * 65535 / ni) > rng) {
+                    f0 += 1 << gene_num;
+                    nonzero_genes_num += 1;
+                    m_cost += n1;
+                    if (birth_cost && !GATHER) {
+                        if (fg1) atomicAdd(&bufs[base + xm1 * h + ym1], (uint) (birth_cost << 17));
+                        if (fg2) atomicAdd(&bufs[base + x * h + ym1], (uint) (birth_cost << 17));
+                        if (fg3) atomicAdd(&bufs[base + xp1 * h + ym1], (uint) (birth_cost << 17));
+                        if (fg4) atomicAdd(&bufs[base + xm1 * h + y], (uint) (birth_cost << 17));
+                        if (fg5) atomicAdd(&bufs[base + xp1 * h + y], (uint) (birth_cost << 17));
+                        if (fg6) atomicAdd(&bufs[base + xm1 * h + yp1], (uint) (birth_cost << 17));
+                        if (fg7) atomicAdd(&bufs[base + x * h + yp1], (uint) (birth_cost << 17));
+                        if (fg8) atomicAdd(&bufs[base + xp1 * h + yp1], (uint) (birth_cost << 17));
+                    }
+                }
+                gene_num++;
+            }
+            if (nonzero_genes_num > max_genes) f0 = 0;
+#if LINEAGE
+            if (f0) {
+                uint nb[8] = {f1, f2, f3, f4, f5, f6, f7, f8};
+                lineage_add(lineage_keys, lineage_counts, lineage_slots,
+                            ((unsigned long long) lineage_step << 54) | ((unsigned long long) k << 34), f0, nb, ni);
+            }
+#endif
+#if COUNTER_RNG
+            // nothing to commit, next step hashes its own state
+#elif GATHER
+            // neighbours still read the old seed, new one is committed after the step
+            bufs[i] = (((seed * 58321) + 11113)) % 65535 + 1;
+#else
+            seeds[i] = (((seed * 58321) + 11113)) % 65535;
+#endif
+            //if (f0 != 3076 && f0 != 31820) printf("%d ", f0);
+        }
+        if ((f00 & 0x1ffff) == (f0 & 0x1ffff)) {
+            f0 = f00;
+            if (f0 != 0) {
+                f0 += (death_speed << 17);
+            }
+        } else if (f0 & 0x1ffff) {
+            if (f00 & 0x1ffff) m_reocc = 1; else m_born = 1;
+        }
+        fld_new[i] = f0 + charges;
+
+    }
+#if METRICS
+    stat_add(stats, k, M_BIRTHS, m_born);
+    stat_add(stats, k, M_REOCCUPATIONS, m_reocc);
+    stat_add(stats, k, M_DEATHS_STARVATION, m_starved);
+    stat_add(stats, k, M_DEATHS_SUSTAIN, m_sustain);
+    stat_add(stats, k, M_BIRTH_COST, m_cost * birth_cost);
+#endif
+"""
+
+STEP_PREAMBLE = """
+#include <stdio.h>
+#define EXISTS(x) (x > 0 ? 1 : 0)
+//#define FIT(x, n) ((n == 0 || (x & (1 << (n - 1))) == 0) ? 0 : 1)
+#define FIT(x, n) ((x >> (n - 1)) & 1)
+// ripple-carry add of birth rule byte of `x` to lane counters c0..c3
+#define ADD_LANES(x) { uint b = x & 0xff, carry; \
+    carry = c0 & b; c0 ^= b; b = carry; \
+    carry = c1 & b; c1 ^= b; b = carry; \
+    carry = c2 & b; c2 ^= b; c3 |= carry; }
+
+// BIRTH_COST charged by re-evaluating births around the cell instead of atomicAdd
+#ifndef GATHER
+#define GATHER 0
+#endif
+#ifndef METRICS
+#define METRICS 0
+#endif
+#ifndef LINEAGE
+#define LINEAGE 0
+#endif
+#ifndef COUNTER_RNG
+#define COUNTER_RNG 0
+#endif
+
+// murmur3 finalizer
+__device__ uint mix32(uint x) {
+    x ^= x >> 16; x *= 0x85ebca6b;
+    x ^= x >> 13; x *= 0xc2b2ae35;
+    return x ^ (x >> 16);
+}
+
+// crossover RNG state of cell `j` of the world, and its value for a gene:
+// stateless hash of (key, step, cell, gene), or per-cell LCG in `seeds`
+#if COUNTER_RNG
+#define CELL_SEED(j) mix32(rng_base ^ (uint) (j))
+#define CROSSOVER_RNG(s, gene) (mix32((s) + (gene) * 0x9e3779b9) % 65535)
+#else
+#define CELL_SEED(j) seeds[base + (j)]
+#define CROSSOVER_RNG(s, gene) (((((s) + (gene)) * 58321) + 11113) % 65535)
+#endif
+
+#if LINEAGE
+// count `key` in the open addressing table, last counter is for events
+// dropped when the table is too full
+__device__ void edge_add(unsigned long long *keys, uint *counts, uint slots, unsigned long long key) {
+    // murmur3 finalizer, keys differ in a few scattered bits
+    unsigned long long x = key;
+    x ^= x >> 33; x *= 0xff51afd7ed558ccdULL;
+    x ^= x >> 33; x *= 0xc4ceb9fe1a85ec53ULL;
+    x ^= x >> 33;
+    uint slot = (uint) x & (slots - 1);
+    for (int probe = 0; probe < 32; probe++) {
+        unsigned long long old = atomicCAS(&keys[slot], 0ULL, key);
+        if (old == 0 || old == key) {
+            atomicAdd(&counts[slot], 1);
+            return;
+        }
+        slot = (slot + 1) & (slots - 1);
+    }
+    atomicAdd(&counts[slots], 1);
+}
+
+// parent -> child edges of a birth, if the child genome is new to its parents
+__device__ void lineage_add(unsigned long long *keys, uint *counts, uint slots, unsigned long long tag,
+                            uint child, uint *nb, int ni) {
+    for (int m = 0; m < 8; m++)
+        if (FIT(nb[m], ni) && (nb[m] & 0x1ffff) == child) return;
+    for (int m = 0; m < 8; m++) {
+        if (!FIT(nb[m], ni)) continue;
+        uint g = nb[m] & 0x1ffff;
+        int seen = 0;
+        for (int j = 0; j < m; j++)
+            if (FIT(nb[j], ni) && (nb[j] & 0x1ffff) == g) seen = 1;
+        if (!seen) edge_add(keys, counts, slots, tag | ((unsigned long long) g << 17) | child);
+    }
+}
+#endif
+
+#if GATHER
+__constant__ int DX[8] = {-1, 0, 1, -1, 1, -1, 0, 1};
+__constant__ int DY[8] = {-1, -1, -1, 0, 0, 1, 1, 1};
+
+// number of genes neighbour `pk` of cell `c` (with neighbours `nb`) passes to it on birth
+__device__ uint genes_owed(uint c, uint *nb, uint s, int pk) {
+    int N = 0;
+    for (int m = 0; m < 8; m++) N += EXISTS(nb[m]);
+    if ((c >> 17) >= 0xff || N == 0 || c > 0 && (((c >> 8) & (1 << N)) == 0)) return 0;
+    uint c0 = 0, c1 = 0, c2 = 0, c3 = 0;
+    for (int m = 0; m < 8; m++) ADD_LANES(nb[m]);
+    uint births = ~(c0 ^ 0x55) & ~(c1 ^ 0x66) & ~(c2 ^ 0x78) & ~(c3 ^ 0x80) & 0xff;
+    int ni = 32 - __clz(births);
+    if (ni == 0 || FIT(nb[pk], ni) == 0) return 0;
+    uint owed = 0;
+    for (uint gene_num = 0; gene_num < 17; gene_num++) {
+        if (((nb[pk] >> gene_num) & 1) == 0) continue;
+        uint rng = CROSSOVER_RNG(s, gene_num);
+        int n1 = 0;
+        for (int m = 0; m < 8; m++) n1 += (nb[m] >> gene_num) & FIT(nb[m], ni);
+        if ((int) (n1 * 65535 / ni) > rng) owed++;
+    }
+    return owed;
+}
+
+// energy owed by cell (x, y) as a parent, from the 5x5 window around it
+__device__ uint owed_charges(uint *fld, uint *seeds, uint rng_base, int base, int x, int y, int w, int h,
+                             int birth_cost) {
+    int xs[5], ys[5];
+    for (int a = 0; a < 5; a++) {
+        xs[a] = ((x + a - 2) % w + w) % w;
+        ys[a] = ((y + a - 2) % h + h) % h;
+    }
+    uint win[5][5];
+    for (int a = 0; a < 5; a++)
+        for (int b = 0; b < 5; b++)
+            win[a][b] = fld[base + xs[a] * h + ys[b]];
+    uint owed = 0;
+    for (int k = 0; k < 8; k++) {
+        // k-th neighbour has this cell as its (7 - k)-th one
+        int cx = DX[k] + 2, cy = DY[k] + 2;
+        uint nb[8];
+        for (int m = 0; m < 8; m++) nb[m] = win[cx + DX[m]][cy + DY[m]];
+        owed += genes_owed(win[cx][cy], nb, CELL_SEED(xs[cx] * h + ys[cy]), 7 - k);
+    }
+    return owed * (uint) (birth_cost << 17);
+}
+#endif
+
+__device__ uint fadeout(int val, int step) {
+    uint red   = (val & 0x00ff0000) >> 16;
+    if (red > step-1) red -= step; else red = 0;
+    uint green = (val & 0x0000ff00) >> 8;
+    if (green > step-1) green -= step; else green = 0;
+    uint blue  = (val & 0x000000ff);
+    if (blue > step-1) blue -= step; else blue = 0;
+    return blue + (green << 8) + (red << 16);
+}
+
+"""
+
+FLUSH_ARGS = "unsigned int *fld_new, unsigned int *bufs, unsigned int *img, int w, int h, int *fade_ins, int *fade_outs"
+
+FLUSH_SOURCE = """
+    int k = i / (w * h);
+    int fade_in = fade_ins[k];
+    int fade_out = fade_outs[k];
+    uint f0 = fld_new[i];
+#if !GATHER
+    f0 += bufs[i];
+#endif
+    uint energy = (f0 >> 17);
+    uint m_starved = 0;
+    if (energy > 0xff) {
+        m_starved = (f0 & 0x1ffff) != 0;
+        energy = 0xff;
+        f0 = 0;
+    }
+    fld_new[i] = f0;
+#if METRICS
+    uint m_live = (f0 & 0x1ffff) != 0;
+    stat_add(stats, k, M_LIVE, m_live);
+    stat_add(stats, k, M_ENERGY, m_live ? energy : 0);
+    stat_add(stats, k, M_DEATHS_STARVATION, m_starved);
+#endif
+#if !GATHER
+    bufs[i] = 0;
+#endif
+    uint img0 = img[i];
+    uint tc = hsv2rgb((f0 & 0x1ffff) % 360, 0xff - energy, 255);
+    if (f0 == 0) tc = 0;
+    int tr = (tc >> 16) & 0xff;
+    int tg = (tc >> 8) & 0xff;
+    int tb = tc & 0xff;
+    int cr = (img0 >> 16) & 0xff;
+    int cg = (img0 >> 8) & 0xff;
+    int cb = img0 & 0xff;
+    cr = max(min(tr, cr + fade_in), cr - fade_out);
+    cg = max(min(tg, cg + fade_in), cg - fade_out);
+    cb = max(min(tb, cb + fade_in), cb - fade_out);
+    img[i] = ((uint) cr << 16) + ((uint) cg << 8) + (uint) cb;
+"""
+
+FLUSH_PREAMBLE = """
+#include <stdio.h>
+#ifndef GATHER
+#define GATHER 0
+#endif
+#ifndef METRICS
+#define METRICS 0
+#endif
+
+__device__ uint hsv2rgb(int hue, int sat, int val) {
+	float r, g, b;
+	float h, s, v;
+	
+	h = hue;
+	s = fmin(255, (float) sat);
+        s /= 255;
+	v = fmin(255, (float) val);
+	
+	float f = ((float) h) / 60.0f;
+	float hi = floorf(f);
+	f = f - hi;
+	int p = (int) (v * (1 - s));
+	int q = (int) (v * (1 - s * f));
+	int t = (int) (v * (1 - s * (1 - f)));
+	
+	if(hi == 0.0f || hi == 6.0f) {
+		r = v; g = t; b = p;
+	} else if (hi == 1.0f) {
+		r = q; g = v; b = p;
+	} else if (hi == 2.0f) {
+		r = p; g = v; b = t;
+	} else if (hi == 3.0f) {
+		r = p; g = q; b = v;
+	} else if (hi == 4.0f) {
+		r = t; g = p; b = v;
+	} else {
+		r = v; g = p; b = q;
+	}
+	
+	unsigned int color = b + g * 256 + r * 256 * 256;
+	return color;
+}
+"""
+
+CENSUS_ARGS = "unsigned int *fld, unsigned int *bins, int w, int h"
+
+CENSUS_SOURCE = """
+    // empty cells are not counted, too much contention on a single bin
+    uint g = fld[i] & 0x1ffff;
+    if (g != 0) atomicAdd(&bins[(i / (w * h)) * 0x20000 + g], 1);
+"""
+
+SEEDS_ARGS = "unsigned int *bufs, unsigned int *seeds"
+
+SEEDS_SOURCE = """
+    // new seeds of born cells, passed in `bufs` as seed + 1
+    uint b = bufs[i];
+    if (b) {
+        seeds[i] = b - 1;
+        bufs[i] = 0;
+    }
+"""
+
+GATHER_DEFINE = "#define GATHER 1\n"
+
+LINEAGE_ARGS = ", unsigned long long *lineage_keys, unsigned int *lineage_counts, unsigned int lineage_slots, unsigned int lineage_step"
+
+LINEAGE_DEFINE = "#define LINEAGE 1\n"
+
+RNG_ARGS = ", int *rng_keys, unsigned int rng_step"
+
+RNG_DEFINE = "#define COUNTER_RNG 1\n"
+
+METRICS_ARGS = ", unsigned long long *stats"
+
+METRICS_DEFINE = "#define METRICS 1\n" + "".join(
+    "#define M_%s %d\n" % (name.upper(), j) for j, name in enumerate(metrics.METRICS)) + """
+#define METRICS_NUM %d
+
+// add `v` to counter `j` of world `k`, with a single atomic per warp
+// when the whole warp is active and in one world
+__device__ void stat_add(unsigned long long *stats, int k, int j, uint v) {
+    uint mask = __activemask();
+    if (mask == 0xffffffff && __all_sync(mask, k == __shfl_sync(mask, k, 0))) {
+        for (int o = 16; o > 0; o >>= 1) v += __shfl_down_sync(mask, v, o);
+        if ((threadIdx.x & 31) == 0 && v) atomicAdd(&stats[k * METRICS_NUM + j], (unsigned long long) v);
+    } else if (v) {
+        atomicAdd(&stats[k * METRICS_NUM + j], (unsigned long long) v);
+    }
+}
+""" % len(metrics.METRICS)
+
+VIEWPORT_ARGS = "unsigned char *rgb, unsigned int *img, int w, int h, int screen_h, int offset_x, int offset_y, int zoom, int factor"
+
+VIEWPORT_SOURCE = """
+    // one screen pixel, averaged over factor x factor zoomed field samples
+    int sx = i / screen_h;
+    int sy = i % screen_h;
+    uint r = 0, g = 0, b = 0;
+    for (int j = 0; j < factor; j++) {
+        int x = ((sx * factor + j) / zoom - offset_x) % w;
+        if (x < 0) x += w;
+        for (int k = 0; k < factor; k++) {
+            int y = ((sy * factor + k) / zoom - offset_y) % h;
+            if (y < 0) y += h;
+            uint c = img[x * h + y];
+            r += (c >> 16) & 0xff;
+            g += (c >> 8) & 0xff;
+            b += c & 0xff;
+        }
+    }
+    int n = factor * factor;
+    rgb[i * 3] = r / n;
+    rgb[i * 3 + 1] = g / n;
+    rgb[i * 3 + 2] = b / n;
+"""
+
+_kernels = {}
+
+
+def kernel(arguments, operation, name, preamble=""):
+    """
+    ElementwiseKernel for given source, compiled once per process.
+
+    """
+    key = hashlib.md5("\0".join((arguments, operation, name, preamble)).encode("utf-8")).hexdigest()
+    if key not in _kernels:
+        _kernels[key] = ElementwiseKernel(arguments, operation, name, preamble=preamble)
+    return _kernels[key]
+
+
+# uploaded constants kept for reuse, most recently used last
+MAX_PARAMS = 64
+_params = collections.OrderedDict()
+
+
+def params(*values):
+    """
+    Per-world constants as an int32 device array, for scalars or sequences.
+    Last MAX_PARAMS sets of arrays are kept for reuse, so constant
+    parameters are uploaded once.
+
+    """
+    values = np.broadcast_arrays(*[np.asarray(v, dtype=np.int32) for v in values])
+    arr = np.stack(values).reshape(len(values), -1)
+    key = (arr.shape, arr.dtype.str, arr.tobytes())
+    res = _params.pop(key, None)
+    if res is None:
+        res = [gpuarray.to_gpu(np.ascontiguousarray(a)) for a in arr]
+        while len(_params) >= MAX_PARAMS:
+            _params.popitem(last=False)
+    _params[key] = res
+    return res
+
+
+_bins = {}
+
+
+def to_device(arr):
+    return gpuarray.to_gpu(arr)
+
+
+def from_device(arr):
+    return arr.get()
+
+
+def synchronize():
+    """
+    Wait for all launched kernels and copies, for timing.
+
+    """
+    drv.Context.synchronize()
+
+
+def memory_used():
+    free, total = drv.mem_get_info()
+    return total - free
+
+
+def host_empty(shape, dtype=np.int32):
+    """
+    Page-locked host array, for asynchronous copies.
+
+    """
+    return drv.pagelocked_empty(shape, dtype)
+
+
+_stream = []
+
+
+def copy_async(arr, out):
+    """
+    Start copying `arr` into page-locked host array `out` without blocking
+    the host. Return a function telling whether the copy is finished.
+    The copy is ordered after kernels already launched, and kernels launched
+    later wait for it, as the side stream syncs with the default one.
+
+    """
+    if not _stream:
+        _stream.append(drv.Stream())
+    arr.get_async(stream=_stream[0], ary=out)
+    done = drv.Event()
+    done.record(_stream[0])
+    return done.query
+
+
+def ca_step(fld, fld_new, seeds, bufs, img, w, h, death_speed, birth_cost, max_genes, gather=False, stats=None,
+            lineage=None, rng=None):
+    """
+    With `gather`, each parent adds BIRTH_COST it owes to its own new value,
+    re-evaluating births of its neighbours, instead of `atomicAdd`s to `bufs`.
+    `bufs` then only passes new seeds, and `ca_flush` must get `gather` too.
+    Step counters are added to `stats` device array, see `evolib.metrics`.
+    Crossover events are counted in `lineage` (keys, counts, step) table,
+    see `evolib.lineage`.
+    With `rng` (key, step), crossover uses the counter-based RNG of
+    `evolib.cpu.counter_seed`, and `seeds` is neither read nor written.
+
+    """
+    preamble = GATHER_DEFINE + STEP_PREAMBLE if gather else STEP_PREAMBLE
+    args, extra = STEP_ARGS, []
+    if stats is not None:
+        preamble, args, extra = METRICS_DEFINE + preamble, args + METRICS_ARGS, [stats]
+    if lineage is not None:
+        keys, counts, step = lineage
+        preamble, args = LINEAGE_DEFINE + preamble, args + LINEAGE_ARGS
+        extra = extra + [keys, counts, np.uint32(len(keys)), np.uint32(step)]
+    if rng is not None:
+        key, step = rng
+        preamble, args = RNG_DEFINE + preamble, args + RNG_ARGS
+        keys = (np.asarray(key, dtype=np.int64) & 0xffffffff).astype(np.uint32).view(np.int32)
+        extra = extra + [params(keys)[0], np.uint32(step & 0xffffffff)]
+        # kernel argument only, never dereferenced
+        seeds = bufs if seeds is None else seeds
+    step = kernel(args, STEP_SOURCE, "ca_step", preamble)
+    step(fld, fld_new, seeds, bufs, img, np.int32(w), np.int32(h),
+         *(params(death_speed, birth_cost, max_genes) + extra))
+    if gather and rng is None:
+        kernel(SEEDS_ARGS, SEEDS_SOURCE, "commit_seeds")(bufs, seeds)
+
+
+def ca_flush(fld_new, bufs, img, w, h, fade_in, fade_out, gather=False, stats=None):
+    preamble = GATHER_DEFINE + FLUSH_PREAMBLE if gather else FLUSH_PREAMBLE
+    args, extra = FLUSH_ARGS, []
+    if stats is not None:
+        preamble, args, extra = METRICS_DEFINE + preamble, args + METRICS_ARGS, [stats]
+    flush = kernel(args, FLUSH_SOURCE, "ca_flush", preamble)
+    flush(fld_new, bufs, img, np.int32(w), np.int32(h), *(params(fade_in, fade_out) + extra))
+
+
+_screens = {}
+
+
+def viewport(img, w, h, size, offset=(0, 0), zoom=1, factor=1):
+    """
+    Screen image rendered on device, see `evolib.cpu.viewport`.
+    Result is a (width, height, 3) uint8 device array, reused by next calls.
+
+    """
+    sw, sh = size
+    shape = (sw, sh, 3)
+    if shape not in _screens:
+        _screens[shape] = gpuarray.empty(shape, dtype=np.uint8)
+    rgb = _screens[shape]
+    render = kernel(VIEWPORT_ARGS, VIEWPORT_SOURCE, "viewport")
+    render(rgb, img, np.int32(w), np.int32(h), np.int32(sh), np.int32(offset[0] % w), np.int32(offset[1] % h),
+           np.int32(zoom), np.int32(factor), range=slice(0, sw * sh))
+    return rgb
+
+
+def census(fld, w, h):
+    """
+    Number of cells of each genome, counted on device. Only the bins,
+    (2 ** 17,) or (worlds, 2 ** 17) for a batch, are copied back.
+
+    """
+    lead = fld.shape[:-2]
+    if lead not in _bins:
+        _bins[lead] = gpuarray.zeros(lead + (0x20000,), dtype=np.uint32)
+    bins = _bins[lead]
+    bins.fill(0)
+    count = kernel(CENSUS_ARGS, CENSUS_SOURCE, "census")
+    count(fld, bins, np.int32(w), np.int32(h))
+    counts = bins.get().astype(np.int64)
+    counts[..., 0] = w * h - counts.sum(axis=-1)
+    return counts
+
+
+def benchmark(preset="coexistence", steps=100):
+    """
+    Run `preset` for `steps` with both BIRTH_COST modes, from the same
+    state. Return ([(mode, steps/s), ...], whether fields are identical).
+
+    """
+    from evolib import world
+    w = world.World(world.load_preset(preset, RANDOM_SEED=1))
+    p = w.preset
+    results, fields = [], []
+    for gather in (False, True):
+        fld, fld_new, seeds, bufs, img = [to_device(a) for a in (w.fld, w.fld_new, w.seeds, w.bufs, w.img)]
+        for i in range(steps + 1):
+            if i == 1:
+                # first step compiles kernels
+                drv.Context.synchronize()
+                start_time = time.time()
+            ca_step(fld, fld_new, seeds, bufs, img, w.width, w.height,
+                    p["DEATH_SPEED"], p["BIRTH_COST"], p["MAX_GENES"], gather=gather)
+            ca_flush(fld_new, bufs, img, w.width, w.height, p["FADE_IN"], p["FADE_OUT"], gather=gather)
+            fld, fld_new = fld_new, fld
+        drv.Context.synchronize()
+        results.append(("gather" if gather else "atomicAdd", steps / (time.time() - start_time)))
+        fields.append((from_device(fld), from_device(seeds)))
+    identical = all((a == b).all() for a, b in zip(*fields))
+    return results, identical
+
+
+if __name__ == '__main__':
+    preset = sys.argv[1] if len(sys.argv) > 1 else "coexistence"
+    results, identical = benchmark(preset, *[int(a) for a in sys.argv[2:3]])
+    for mode, speed in results:
+        print("%-9s %8.1f steps/s" % (mode, speed))
+    print("Fields are identical." if identical else "Fields differ!")
@@ -0,0 +1,105 @@
+"""
+Viewer frame pipeline, copying frames while the simulation keeps stepping.
+
+Frames are rendered to screen pixels by the backend (see `viewport`), so
+only their copy to the host is left. It goes to a host buffer, on CUDA
+to page-locked memory asynchronously, so the host never waits for it.
+Finished frames are copied out of the buffer when polled, and a new
+frame due while the previous copy is still running is dropped, unless
+dropping is disabled for movie recording.
+
+Example:
+
+    pipeline = FramePipeline(backend, (width, height, 3), np.uint8)
+    while True:
+        step()
+        pipeline.submit(backend.viewport(img, w, h, (width, height)))
+        for frame in pipeline.poll():
+            pygame.surfarray.blit_array(srf, frame)
+
+"""
+
+import time
+
+import numpy as np
+
+
+def host_empty(backend, shape, dtype=np.int32):
+    if hasattr(backend, "host_empty"):
+        return backend.host_empty(shape, dtype)
+    return np.empty(shape, dtype=dtype)
+
+
+def copy_frame(backend, img, out):
+    """
+    Start copying `img` into host array `out`, return a function
+    telling whether the copy is finished.
+
+    """
+    if hasattr(backend, "copy_async"):
+        return backend.copy_async(img, out)
+    out[...] = backend.from_device(img)
+    return lambda: True
+
+
+class FramePipeline(object):
+    """
+    Frames of `shape` and `dtype` from `backend` arrays. With `drop` off,
+    `submit` waits for the previous copy instead, so every submitted frame
+    is shown.
+
+    """
+
+    def __init__(self, backend, shape, dtype=np.int32, drop=True):
+        self.backend = backend
+        self.drop = drop
+        self.buffer = host_empty(backend, shape, dtype)
+        self.pending = None
+        self.ready = []
+        self.dropped = 0
+
+    def _collect(self, block=False):
+        """
+        Take the frame out of the buffer once its copy is finished.
+
+        """
+        if self.pending is None:
+            return
+        while not self.pending():
+            if not block:
+                return
+            time.sleep(0.001)
+        self.pending = None
+        if self.drop and self.ready:
+            # display fell behind, only the latest frame is shown
+            self.dropped += len(self.ready)
+            self.ready = []
+        self.ready.append(self.buffer.copy())
+
+    def submit(self, img):
+        """
+        Start the next frame from `img`. Return False if it was dropped.
+
+        """
+        self._collect(block=not self.drop)
+        if self.pending is not None:
+            self.dropped += 1
+            return False
+        self.pending = copy_frame(self.backend, img, self.buffer)
+        return True
+
+    def poll(self):
+        """
+        List of frames finished since the last call, oldest first.
+
+        """
+        self._collect()
+        frames, self.ready = self.ready, []
+        return frames
+
+    def close(self):
+        """
+        Finish the frame being copied.
+
+        """
+        self._collect(block=True)
@@ -0,0 +1,125 @@
+"""
+Genome codec. Genome is 17 bits of a cell: bits 0..7 are birth rule
+for 1..8 neighbours, bits 8..16 are sustain rule for 0..8 neighbours.
+String form is B/S notation without letters, like "3/23" for Conway;
+standard notation with letters, like "B3/S23" (or "S23/B3"), is read
+too, and written with `letters=True`.
+
+Whole arrays of genomes are converted at once with `genomes2strs` and
+`strs2genomes`. Strings of all 2 ** 17 genomes are built once, on first
+use, and looked up after that.
+
+"""
+
+import numpy as np
+
+NUM_GENOMES = 1 << 17
+# birth digits, slash, sustain digits, with room for letters
+MAX_LENGTH = 20
+
+_tables = {}
+
+# str and unicode on Python 2
+string_types = basestring if str is bytes else str
+
+# kinds and digit values of ASCII characters, anything else is taken as 127
+NUL, DIGIT, SLASH, LETTER_B, LETTER_S, OTHER = range(6)
+CHAR_KINDS = np.full(128, OTHER, dtype=np.int8)
+CHAR_KINDS[0] = NUL
+CHAR_KINDS[ord("0"):ord("9") + 1] = DIGIT
+CHAR_KINDS[ord("/")] = SLASH
+CHAR_KINDS[[ord("B"), ord("b")]] = LETTER_B
+CHAR_KINDS[[ord("S"), ord("s")]] = LETTER_S
+CHAR_VALUES = np.maximum(np.arange(128) - ord("0"), 0).astype(np.int32)
+
+
+def table(letters=False):
+    """
+    Strings of all genomes, as (2 ** 17,) bytes array indexed by genome.
+
+    """
+    if letters not in _tables:
+        g = np.arange(NUM_GENOMES)
+        columns = [np.full(NUM_GENOMES, ord("B"))] if letters else []
+        columns += [np.where(g & (1 << i), ord("1") + i, 0) for i in range(8)]
+        columns.append(np.full(NUM_GENOMES, ord("/")))
+        columns += [np.full(NUM_GENOMES, ord("S"))] if letters else []
+        columns += [np.where(g & (1 << (i + 8)), ord("0") + i, 0) for i in range(9)]
+        chars = np.stack(columns, axis=1).astype(np.uint8)
+        # move characters of each row to its front, NUL padded strings end on the first NUL
+        order = np.argsort(chars == 0, axis=1, kind="mergesort")
+        chars = chars[np.arange(NUM_GENOMES)[:, None], order]
+        padded = np.zeros((NUM_GENOMES, MAX_LENGTH), dtype=np.uint8)
+        padded[:, :chars.shape[1]] = chars
+        _tables[letters] = padded.view("S%d" % MAX_LENGTH).ravel()
+    return _tables[letters]
+
+
+def genome2str(g, letters=False):
+    s = table(letters)[g & (NUM_GENOMES - 1)]
+    return str(s) if str is bytes else s.decode("ascii")
+
+
+def genomes2strs(genomes, letters=False):
+    """
+    Strings of an array of genomes, as an array of the same shape.
+
+    """
+    strs = table(letters)[np.asarray(genomes) & (NUM_GENOMES - 1)]
+    return strs if str is bytes else strs.astype(str)
+
+
+def str2genome(s):
+    g = 0
+    b, s = s.upper().split("/")
+    if b.startswith("S"):
+        b, s = s, b
+    # a letter may only lead its part
+    if b.startswith("B"):
+        b = b[1:]
+    if s.startswith("S"):
+        s = s[1:]
+    for i in b:
+        if not "1" <= i <= "8":
+            raise ValueError("Invalid birth rule digit: %r." % i)
+        g |= (1 << (int(i)-1))
+    for i in s:
+        if not "0" <= i <= "8":
+            raise ValueError("Invalid sustain rule digit: %r." % i)
+        g |= (1 << (int(i)+8))
+    return g
+
+
+def strs2genomes(strs):
+    """
+    Genomes of an array of strings, as uint32 array of the same shape.
+
+    """
+    strs = np.asarray(strs)
+    if strs.dtype.kind not in "SU":
+        strs = strs.astype(str)
+    flat = np.ascontiguousarray(strs.ravel())
+    # character codes, bytes or UCS4
+    codes = flat.view(np.uint8 if flat.dtype.kind == "S" else np.uint32)
+    codes = np.minimum(codes.reshape(len(flat), -1), 127).astype(np.intp)
+    kinds = CHAR_KINDS[codes]
+    slashes = kinds == SLASH
+    if not (slashes.sum(axis=1) == 1).all():
+        raise ValueError("Genome strings must have exactly one '/'.")
+    # sustain part: after the slash, or before it if the string starts with S
+    sustain = (np.cumsum(slashes, axis=1) > 0) != (kinds[:, :1] == LETTER_S)
+    # letters may only lead their own part, like in `str2genome`
+    starts = np.zeros_like(slashes)
+    starts[:, 0] = True
+    starts[:, 1:] = slashes[:, :-1]
+    letters = (kinds == LETTER_B) | (kinds == LETTER_S)
+    leading = starts & ((kinds == LETTER_S) == sustain)
+    values = CHAR_VALUES[codes]
+    digits = kinds == DIGIT
+    bad = (kinds == OTHER) | letters & ~leading | digits & ((values == 9) | (values == 0) & ~sustain)
+    if bad.any():
+        raise ValueError("Invalid genome strings: %s." % ", ".join(repr(s) for s in flat[bad.any(axis=1)][:3]))
+    bits = np.where(digits, np.left_shift(1, np.where(sustain, values + 8, np.maximum(values - 1, 0))), 0)
+    # repeated digits count once
+    genomes = np.bitwise_or.reduce(bits, axis=1).astype(np.uint32)
+    return genomes.reshape(strs.shape)
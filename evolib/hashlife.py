@@ -0,0 +1,604 @@
+"""
+Memoized quadtree engine (Hashlife) for DEATH_SPEED = BIRTH_COST = 0.
+
+Without aging and birth cost, a region holding a single genome is just
+a Life-like automaton: crossover of identical parents always gives the
+parent genome back (or an empty cell over MAX_GENES), whatever the seeds.
+Such regions are advanced 2^k generations at once with Hashlife, over
+canonical quadtree nodes labelled with full cell values. Nodes and step
+results are kept in bounded LRU caches, so repeating patterns (still
+lifes, oscillators, gliders) cost next to nothing after the first time.
+
+Anything within reach of another genome during a jump is stepped densely
+with `evolib.cpu` instead, as a batch of tiles with a margin as wide as
+the jump. Crossover seeds are kept exact too: Hashlife counts births
+per cell and seeds are advanced by that many LCG steps, while the
+counter-based RNG only needs step numbers of dense tiles. So the result
+is bit-identical to stepping the field generation by generation, apart
+from `img`, which is not rendered during jumps. Jumps are only taken
+while they cost less per generation than dense steps, see `Pacer`.
+
+Example, a million generations of Conway soup:
+
+    w = world.World(world.load_preset("conway", RANDOM_SEED=1))
+    hashlife.advance(w, 1000000)
+
+"""
+
+import collections, time
+
+import numpy as np
+
+from evolib import cpu, active
+
+# leaves are 2^LEAF x 2^LEAF cells
+LEAF = 4
+# shortest jump worth building quadtrees, in generations
+MIN_JUMP = 16
+# more species apart from each other are stepped densely
+MAX_SPECIES = 8
+# tile size for dense regions
+DENSE_TILE = 64
+
+
+class LRU(object):
+    """
+    Mapping keeping most recently used items up to total `capacity` weight.
+
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.items = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        item = self.items.pop(key, None)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items[key] = item
+        return item[0]
+
+    def put(self, key, value, weight=1):
+        self.items[key] = (value, weight)
+        self.size += weight
+        while self.size > self.capacity:
+            self.size -= self.items.popitem(last=False)[1][1]
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Node(object):
+    """
+    Square of 2^level cells. Leaves hold `cells` array, others hold
+    `children` as (x0y0, x0y1, x1y0, x1y1) quadrants, x being the first axis.
+
+    """
+    __slots__ = ("level", "children", "cells", "empty")
+
+    def __init__(self, level, children=None, cells=None, empty=False):
+        self.level = level
+        self.children = children
+        self.cells = cells
+        self.empty = empty
+
+
+def rule(genome, max_genes):
+    """
+    (born, survive, child) of a single-species region: born and survive
+    are tables by number of neighbours, child is a newborn cell value.
+
+    """
+    born = np.array([False] + [bool(genome >> (n - 1) & 1) for n in range(1, 9)])
+    survive = np.array([bool(genome >> (8 + n) & 1) for n in range(9)])
+    child = genome if bin(genome).count("1") <= max_genes else 0
+    return born, survive, child
+
+
+def life_step(cells, rule):
+    """
+    One generation of a single-species block, wrapped as a torus,
+    exactly as `ca_step` with DEATH_SPEED = BIRTH_COST = 0 does it.
+    Return (cells, births), births are cells which RNG seed is used.
+
+    """
+    born, survive, child = rule
+    alive = cells != 0
+    n = sum(nb.astype(np.uint8) for nb in cpu.neighbours(alive))
+    dying = (cells >> 17 >= 0xff) | (n == 0) | (alive & ~survive[n])
+    births = born[n] & ~dying
+    res = np.where(births & ((cells & cpu.GENOME_MASK) != child), np.uint32(child), cells)
+    res[dying] = 0
+    return res, births
+
+
+def lcg_power(seeds, counts):
+    """
+    Seeds after `counts` crossover LCG steps each.
+
+    """
+    seeds = seeds.astype(np.int64)
+    counts = counts.astype(np.int64)
+    # below 65535, LCG is a plain affine map mod 65535, without uint32 wrapping
+    first = (seeds >= 65535) & (counts > 0)
+    seeds[first] = cpu.lcg(seeds[first])
+    counts[first] -= 1
+    a, c = 58321, 11113
+    while counts.any():
+        odd = (counts & 1) != 0
+        seeds[odd] = (seeds[odd] * a + c) % 65535
+        counts >>= 1
+        a, c = a * a % 65535, (a * c + c) % 65535
+    return seeds
+
+
+def window(arr, radius, op):
+    """
+    `op` (np.maximum or np.minimum) of `arr` over (2 * radius + 1)^2
+    squares around each cell, on a torus.
+
+    """
+    for axis in (0, 1):
+        res, span = arr, 1
+        while span < 2 * radius + 1:
+            shift = min(span, 2 * radius + 1 - span)
+            res = op(res, np.roll(res, -shift, axis=axis))
+            span += shift
+        arr = np.roll(res, radius, axis=axis)
+    return arr
+
+
+class HashLife(object):
+    """
+    Hashlife over a single-species rule, given as `genome` and MAX_GENES.
+    Up to `nodes` canonical nodes and `cache` bytes of step results
+    (birth counts mostly) are kept.
+
+    """
+
+    def __init__(self, genome, max_genes, nodes=1 << 20, cache=256 << 20):
+        self.rule = rule(genome, max_genes)
+        self.nodes = LRU(nodes)
+        self.results = LRU(cache)
+        self.empties = {}
+
+    def leaf(self, cells):
+        key = cells.tobytes()
+        node = self.nodes.get(key)
+        if node is None:
+            cells.flags.writeable = False
+            node = Node(LEAF, cells=cells, empty=not cells.any())
+            self.nodes.put(key, node)
+        return node
+
+    def join(self, c00, c01, c10, c11):
+        key = (c00, c01, c10, c11)
+        node = self.nodes.get(key)
+        if node is None:
+            empty = c00.empty and c01.empty and c10.empty and c11.empty
+            node = Node(c00.level + 1, children=key, empty=empty)
+            self.nodes.put(key, node)
+        return node
+
+    def empty(self, level):
+        if level not in self.empties:
+            if level == LEAF:
+                self.empties[level] = self.leaf(np.zeros((1 << LEAF, 1 << LEAF), dtype=np.uint32))
+            else:
+                self.empties[level] = self.join(*[self.empty(level - 1)] * 4)
+        return self.empties[level]
+
+    def to_array(self, node):
+        if node.cells is not None:
+            return node.cells
+        c00, c01, c10, c11 = [self.to_array(c) for c in node.children]
+        return np.vstack([np.hstack([c00, c01]), np.hstack([c10, c11])])
+
+    def from_blocks(self, blocks, ids):
+        """
+        Node for a square 2^k grid of leaves: `ids` are indices
+        in `blocks`, array of leaf cells. Built a whole level at a time.
+
+        """
+        flat = np.ascontiguousarray(blocks).reshape(len(blocks), -1)
+        keys = flat.view(np.dtype((np.void, flat.shape[1] * flat.itemsize))).ravel()
+        uniq, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        nodes = [self.leaf(np.array(blocks[i])) for i in index]
+        ids = inverse[ids]
+        n = ids.shape[0]
+        while n > 1:
+            quads = np.stack([ids[0::2, 0::2], ids[0::2, 1::2], ids[1::2, 0::2], ids[1::2, 1::2]], axis=-1)
+            n //= 2
+            uniq, inverse = np.unique(quads.reshape(n * n, 4), axis=0, return_inverse=True)
+            nodes = [self.join(*[nodes[c] for c in row]) for row in uniq]
+            ids = inverse.reshape(n, n)
+        return nodes[ids[0, 0]]
+
+    def from_array(self, arr):
+        """
+        Node for a 2^level square array.
+
+        """
+        side = 1 << LEAF
+        n = arr.shape[0] >> LEAF
+        blocks = arr.reshape(n, side, n, side).swapaxes(1, 2).reshape(n * n, side, side)
+        return self.from_blocks(blocks, np.arange(n * n).reshape(n, n))
+
+    def from_torus(self, fld, level):
+        """
+        Node for a 2^level square tiled with a (w, h) torus, so that
+        torus origin is at the corner of its central part. Leaves are cut
+        only at distinct torus offsets, much fewer than square's cells.
+
+        """
+        w, h = fld.shape
+        side = 1 << LEAF
+        origins = np.arange(0, 1 << level, side) - (1 << (level - 2))
+        ux, ix = np.unique(origins % w, return_inverse=True)
+        uy, iy = np.unique(origins % h, return_inverse=True)
+        xs = (ux[:, None] + np.arange(side)) % w
+        ys = (uy[:, None] + np.arange(side)) % h
+        blocks = fld[xs[:, None, :, None], ys[None, :, None, :]]
+        ids = ix[:, None] * len(uy) + iy[None, :]
+        return self.from_blocks(blocks.reshape(-1, side, side), ids)
+
+    def fill(self, node, out, x=0, y=0):
+        """
+        Write node's cells into `out` at (x, y), clipped to its shape.
+
+        """
+        if node.empty or x >= out.shape[0] or y >= out.shape[1]:
+            return
+        if node.cells is not None:
+            dest = out[x:x + node.cells.shape[0], y:y + node.cells.shape[1]]
+            dest[...] = node.cells[:dest.shape[0], :dest.shape[1]]
+            return
+        half = 1 << (node.level - 1)
+        for i, child in enumerate(node.children):
+            self.fill(child, out, x + (i >> 1) * half, y + (i & 1) * half)
+
+    def center(self, node):
+        if node.level == LEAF + 1:
+            q = 1 << (LEAF - 1)
+            return self.leaf(np.ascontiguousarray(self.to_array(node)[q:3 * q, q:3 * q]))
+        c00, c01, c10, c11 = node.children
+        return self.join(c00.children[3], c01.children[2], c10.children[1], c11.children[0])
+
+    def step(self, node, j):
+        """
+        Return (node, counts): central half of `node` after 2^j generations,
+        j <= level - 2, and number of births in each of its cells (None if
+        there were none).
+
+        """
+        if node.empty:
+            return self.empty(node.level - 1), None
+        key = (node, j)
+        res = self.results.get(key)
+        if res is not None:
+            return res
+        k = node.level
+        q = 1 << (k - 2)
+        if k == LEAF + 1:
+            cells, births = self.to_array(node), 0
+            for i in range(1 << j):
+                cells, born = life_step(cells, self.rule)
+                births = births + born
+            counts = births[q:3 * q, q:3 * q].astype(np.uint16)
+            res = self.leaf(np.ascontiguousarray(cells[q:3 * q, q:3 * q])), counts if counts.any() else None
+        else:
+            g = [[None] * 4 for i in range(4)]
+            for i, child in enumerate(node.children):
+                for p, grandchild in enumerate(child.children):
+                    g[(i >> 1) * 2 + (p >> 1)][(i & 1) * 2 + (p & 1)] = grandchild
+            subs = [[self.join(g[a][b], g[a][b + 1], g[a + 1][b], g[a + 1][b + 1]) for b in range(3)]
+                    for a in range(3)]
+            if j == k - 2:
+                # full speed: two half-jumps, each through overlapping subsquares
+                first = [[self.step(s, j - 1) for s in row] for row in subs]
+                j -= 1
+            else:
+                first = [[(self.center(s), None) for s in row] for row in subs]
+            r = [[node_counts[0] for node_counts in row] for row in first]
+            second = [[self.step(self.join(r[a][b], r[a][b + 1], r[a + 1][b], r[a + 1][b + 1]), j)
+                       for b in range(2)] for a in range(2)]
+            result = self.join(second[0][0][0], second[0][1][0], second[1][0][0], second[1][1][0])
+            counts = assemble(second, q)
+            early = assemble(first, q)
+            if early is not None:
+                early = early[q // 2:q // 2 + 2 * q, q // 2:q // 2 + 2 * q]
+                counts = early if counts is None else counts + early
+            res = result, counts
+        weight = 64 if res[1] is None else 64 + res[1].nbytes
+        self.results.put(key, res, weight)
+        return res
+
+    def advance(self, fld, j):
+        """
+        Jump a (w, h) torus of this rule's species 2^j generations,
+        up to `max_jump`. Return (fld, counts) like `step` does.
+
+        """
+        w, h = fld.shape
+        root = self.from_torus(fld, canvas_level(w, h))
+        node, counts = self.step(root, j)
+        res = np.zeros((w, h), dtype=np.uint32)
+        self.fill(node, res)
+        return res, None if counts is None else counts[:w, :h]
+
+
+def canvas_level(w, h):
+    """
+    Level of a square holding a torus tiled around its (w, h) central part.
+
+    """
+    return max(LEAF + 1, int(np.ceil(np.log2(max(w, h)))) + 1)
+
+
+def max_jump(w, h):
+    """
+    Longest jump on a (w, h) torus, in generations.
+
+    """
+    return 1 << (canvas_level(w, h) - 2)
+
+
+def assemble(parts, size):
+    """
+    Join a square grid of (node, counts) step results into a single
+    counts array, None if there were no births at all.
+
+    """
+    if all(counts is None for row in parts for node, counts in row):
+        return None
+    zeros = np.zeros((size, size), dtype=np.uint16)
+    return np.vstack([np.hstack([zeros if counts is None else counts for node, counts in row])
+                      for row in parts])
+
+
+_engines = LRU(16)
+
+
+def engine(genome, max_genes):
+    """
+    HashLife engine for a rule, kept between jumps.
+
+    """
+    key = (genome, max_genes)
+    eng = _engines.get(key)
+    if eng is None:
+        eng = HashLife(genome, max_genes)
+        _engines.put(key, eng)
+    return eng
+
+
+def cache_counts():
+    """
+    (hits, lookups) of step results caches of all engines so far.
+
+    """
+    caches = [eng.results for eng, weight in _engines.items.values()]
+    hits = sum(c.hits for c in caches)
+    return hits, hits + sum(c.misses for c in caches)
+
+
+class Pacer(object):
+    """
+    Choice between jumps and dense stepping by their measured cost, in
+    seconds per generation. On unsettled fields jumps are much slower
+    than dense steps, as nothing repeats yet. A jump that cost more than
+    dense steps would have is retried after stepping densely for
+    `overhead` times the time it lost, so slow retries take about
+    1 / `overhead` of the run, and jumps take over once they pay off.
+    Jumps start at MIN_JUMP generations, growing twice after each one
+    that paid off and shrinking back after each one that did not.
+
+    """
+
+    def __init__(self, overhead=10, clock=time.time):
+        self.overhead = overhead
+        self.clock = clock
+        # seconds per generation, None until measured
+        self.dense_cost = None
+        self.jump_cost = None
+        # generations to step densely before the next jump, longest jump
+        self.skip = 0
+        self.size = MIN_JUMP
+        self.generations = {"jump": 0, "dense": 0}
+        self.seconds = {"jump": 0.0, "dense": 0.0}
+        self.hits = self.lookups = 0
+
+    def jumping(self):
+        return self.dense_cost is not None and self.skip <= 0
+
+    def stepped(self, generations, seconds):
+        """
+        Account `generations` stepped densely in `seconds`.
+
+        """
+        self.generations["dense"] += generations
+        self.seconds["dense"] += seconds
+        # clock ticks may be coarser than a few steps
+        cost = max(seconds, 1e-6) / generations
+        self.dense_cost = cost if self.dense_cost is None else (self.dense_cost + cost) / 2
+        self.skip -= generations
+
+    def jumped(self, generations, seconds, hits, lookups):
+        """
+        Account a jump attempt of `generations` (0 if none was possible)
+        taking `seconds`, with `hits` out of `lookups` of cached results.
+
+        """
+        self.generations["jump"] += generations
+        self.seconds["jump"] += seconds
+        self.hits += hits
+        self.lookups += lookups
+        self.jump_cost = seconds / generations if generations else None
+        lost = 0 if self.dense_cost is None else seconds - generations * self.dense_cost
+        self.skip = int(self.overhead * lost / self.dense_cost) if lost > 0 else 0
+        self.size = MIN_JUMP if lost > 0 else self.size * 2
+
+    def summary(self):
+        total = self.generations["jump"] + self.generations["dense"]
+        return "%.0f%% of generations jumped, %.0f%% cache hits" % (
+            100.0 * self.generations["jump"] / max(total, 1), 100.0 * self.hits / max(self.lookups, 1))
+
+
+_pacers = LRU(16)
+
+
+def field_pacer(w, h, max_genes):
+    """
+    Pacer for jumps on a (w, h) torus, kept between calls.
+
+    """
+    key = (w, h, max_genes)
+    res = _pacers.get(key)
+    if res is None:
+        res = Pacer()
+        _pacers.put(key, res)
+    return res
+
+
+def plan(fld, generations, tile=DENSE_TILE):
+    """
+    Split a jump into Hashlife and dense parts. Return (species, dense):
+    genome which alone may reach each cell within `generations`
+    (0 if none), and a tiles mask of cells reachable by several.
+
+    """
+    w, h = fld.shape
+    genomes = fld & cpu.GENOME_MASK
+    hi = window(genomes, generations, np.maximum)
+    lo = window(np.where(genomes == 0, cpu.GENOME_MASK + 1, genomes), generations, np.minimum)
+    mixed = (hi != 0) & (lo != hi)
+    tw, th = active.tile_size(w, tile), active.tile_size(h, tile)
+    dense = mixed.reshape(w // tw, tw, h // th, th).any(axis=(1, 3))
+    return hi, dense
+
+
+def step_dense(fld, seeds, tiles, generations, max_genes, rng=None):
+    """
+    Step marked tiles `generations` times, each as a block with
+    a margin of `generations` cells, in place. With `rng` (key, t),
+    crossover uses the counter-based RNG from step t, without `seeds`.
+
+    """
+    w, h = fld.shape
+    tw, th = w // tiles.shape[0], h // tiles.shape[1]
+    tx, ty = np.nonzero(tiles)
+    xs = (tx[:, None] * tw + np.arange(-generations, tw + generations)) % w
+    ys = (ty[:, None] * th + np.arange(-generations, th + generations)) % h
+    cells = xs[:, :, None], ys[:, None, :]
+    block = fld[cells]
+    if rng is not None:
+        key, t = rng
+        cell_ids = cells[0] * h + cells[1]
+        for i in range(generations):
+            block = cpu.step_block(block, None, 0, 0, max_genes, rng=(key, t + i + 1), cell_ids=cell_ids)[0]
+    else:
+        block_seeds = seeds[cells]
+        for i in range(generations):
+            block = cpu.step_block(block, block_seeds, 0, 0, max_genes)[0]
+    inner = (slice(None), slice(generations, generations + tw), slice(generations, generations + th))
+    fld[xs[:, generations:generations + tw, None], ys[:, None, generations:generations + th]] = block[inner]
+    if rng is None:
+        seeds[xs[:, generations:generations + tw, None], ys[:, None, generations:generations + th]] = block_seeds[inner]
+
+
+def jump(fld, seeds, generations, max_genes, rng=None):
+    """
+    Advance uint32 `fld` and `seeds` by `generations` (a power of two)
+    in place, if Hashlife is worth it. Return False otherwise.
+    With `rng` (key, t), `fld` is at step t and `seeds` is not used.
+
+    """
+    w, h = fld.shape
+    species, dense = plan(fld, generations)
+    tw, th = w // dense.shape[0], h // dense.shape[1]
+    if dense.sum() * (tw + 2 * generations) * (th + 2 * generations) > w * h:
+        return False
+    dense_cells = np.repeat(np.repeat(dense, tw, axis=0), th, axis=1)
+    genomes = np.unique(species[~dense_cells])
+    genomes = genomes[genomes != 0]
+    if len(genomes) > MAX_SPECIES:
+        return False
+    j = int(np.log2(generations))
+    results = []
+    for genome in genomes:
+        cells = np.where((fld & cpu.GENOME_MASK) == genome, fld, 0).astype(np.uint32)
+        res, counts = engine(int(genome), max_genes).advance(cells, j)
+        results.append(((species == genome) & ~dense_cells, res, counts))
+    if dense.any():
+        step_dense(fld, seeds, dense, generations, max_genes, rng)
+    for mask, res, counts in results:
+        fld[mask] = res[mask]
+        if counts is not None and rng is None:
+            seeds[mask] = lcg_power(seeds[mask], counts[mask])
+    return True
+
+
+def advance_arrays(fld, seeds, steps, max_genes, rng=None, pacer=None):
+    """
+    Advance (w, h) host `fld` and `seeds` arrays by `steps` generations,
+    with DEATH_SPEED = BIRTH_COST = 0. Return new (fld, seeds) as int32.
+    With `rng` (key, t), the counter-based RNG is used from step t on,
+    and `seeds` is None. Jumps are tried when `pacer` (by default, the
+    one of this field size) finds them worth it, see `Pacer`.
+
+    """
+    w, h = fld.shape
+    pacer = pacer or field_pacer(w, h, max_genes)
+    fld = np.array(fld).view(np.uint32)
+    if rng is None:
+        seeds = np.array(seeds).view(np.uint32)
+    done = 0
+    while done < steps:
+        generations = 0
+        if steps - done >= MIN_JUMP and pacer.jumping():
+            at = None if rng is None else (rng[0], rng[1] + done)
+            generations = min(1 << int(np.log2(steps - done)), max_jump(w, h), pacer.size)
+            start, (hits, lookups) = pacer.clock(), cache_counts()
+            while generations >= MIN_JUMP and not jump(fld, seeds, generations, max_genes, at):
+                generations //= 2
+            if generations < MIN_JUMP:
+                generations = 0
+            hits_after, lookups_after = cache_counts()
+            pacer.jumped(generations, pacer.clock() - start, hits_after - hits, lookups_after - lookups)
+        if not generations:
+            generations = min(MIN_JUMP, steps - done)
+            start = pacer.clock()
+            for i in range(generations):
+                step_rng = None if rng is None else (rng[0], rng[1] + done + i + 1)
+                fld = cpu.step_block(fld, seeds, 0, 0, max_genes, rng=step_rng)[0]
+            pacer.stepped(generations, pacer.clock() - start)
+        done += generations
+    return fld.view(np.int32), None if seeds is None else seeds.view(np.int32)
+
+
+def advance(world, steps):
+    """
+    Step `world` (an `evolib.world.World`) by `steps` generations,
+    jumping with Hashlife where possible. Worlds with aging or birth
+    cost are just stepped as usual.
+
+    """
+    p = world.preset
+    if p["DEATH_SPEED"] or p["BIRTH_COST"]:
+        world.step(steps)
+        return
+    backend = world.backend
+    if world.rng_key is not None:
+        fld, seeds = advance_arrays(backend.from_device(world.fld), None, steps, p["MAX_GENES"],
+                                    rng=(world.rng_key, world.t))
+    else:
+        fld, seeds = advance_arrays(backend.from_device(world.fld), backend.from_device(world.seeds),
+                                    steps, p["MAX_GENES"])
+        world.seeds = backend.to_device(seeds)
+    world.fld = backend.to_device(fld)
+    world.fld_new = backend.to_device(fld)
+    world.t += steps
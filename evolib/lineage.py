@@ -0,0 +1,255 @@
+"""
+Genealogy of genomes, from crossover events counted by the step kernels.
+
+With a `lineage` table passed to `ca_step` (CUDA and NumPy backends),
+each birth giving a genome none of its parents has adds a parent -> child
+edge for each distinct parent genome. Edges are counted on the device in
+an open addressing hash table, keyed by step (relative to the last drain),
+world, parent and child genomes, so nothing is copied per birth.
+
+`LineageTracker` drains the table every `every` steps into a `Genealogy`
+per world: edges with birth counts and the step they first happened,
+and genomes with the step they were first seen and their abundance
+(peak and last census counts, taken at each drain). It's saved as
+a single .npz file and queried after the run:
+
+    g = Genealogy.load("runs/crossbreeding.lineage.npz")
+    for parent, count, first in g.parents(genome.str2genome("3/23")):
+        ...
+
+Ancestry from the command line:
+    python -m evolib.lineage runs/crossbreeding.lineage.npz 3/23 [depth]
+
+"""
+
+import sys
+
+import numpy as np
+
+from evolib import genome
+
+# key layout, from the top: 10 bits of step, 20 of world, 17 of parent and 17 of child
+STEP_SHIFT, WORLD_SHIFT, GENOME_BITS = 54, 34, 17
+MAX_EVERY = 1 << 10
+
+
+def unpack(keys):
+    """
+    Return (step, world, parent, child) arrays of packed edge keys.
+
+    """
+    keys = keys.astype(np.uint64)
+    mask = np.uint64((1 << GENOME_BITS) - 1)
+    return ((keys >> np.uint64(STEP_SHIFT)).astype(np.int64),
+            ((keys >> np.uint64(WORLD_SHIFT)) & np.uint64(0xfffff)).astype(np.int64),
+            ((keys >> np.uint64(GENOME_BITS)) & mask).astype(np.int64),
+            (keys & mask).astype(np.int64))
+
+
+class Genealogy(object):
+    """
+    Incremental parent -> child graph of genomes, kept in sorted arrays.
+
+    """
+
+    def __init__(self):
+        # edges by (parent << 17 | child)
+        self.edges = np.zeros(0, dtype=np.int64)
+        self.edge_counts = np.zeros(0, dtype=np.int64)
+        self.edge_first = np.zeros(0, dtype=np.int64)
+        # genomes, first seen step and abundance
+        self.genomes = np.zeros(0, dtype=np.int64)
+        self.first_seen = np.zeros(0, dtype=np.int64)
+        self.peak = np.zeros(0, dtype=np.int64)
+        self.peak_step = np.zeros(0, dtype=np.int64)
+        self.last = np.zeros(0, dtype=np.int64)
+
+    def add_edges(self, steps, parents, children, counts):
+        """
+        Merge birth events, children are first seen on their earliest one.
+
+        """
+        edges = np.concatenate([self.edges, (parents << GENOME_BITS) | children])
+        counts = np.concatenate([self.edge_counts, counts])
+        first = np.concatenate([self.edge_first, steps])
+        self.edges, inverse = np.unique(edges, return_inverse=True)
+        self.edge_counts = np.bincount(inverse, counts).astype(np.int64)
+        self.edge_first = np.full(len(self.edges), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(self.edge_first, inverse, first)
+        self.add_genomes(children, steps)
+
+    def add_genomes(self, genomes, steps):
+        """
+        Merge genomes seen at `steps`, keeping the earliest step of each.
+
+        """
+        known = np.concatenate([self.genomes, genomes])
+        seen = np.concatenate([self.first_seen, steps])
+        merged, inverse = np.unique(known, return_inverse=True)
+        first = np.full(len(merged), np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, inverse, seen)
+        old = np.searchsorted(merged, self.genomes)
+        for name in ("peak", "peak_step", "last"):
+            values = np.zeros(len(merged), dtype=np.int64)
+            values[old] = getattr(self, name)
+            setattr(self, name, values)
+        self.genomes, self.first_seen = merged, first
+
+    def observe(self, t, counts):
+        """
+        Update abundance from a census, (2 ** 17,) counts of each genome.
+
+        """
+        alive = np.flatnonzero(counts[1:]) + 1
+        self.add_genomes(alive, np.full(len(alive), t, dtype=np.int64))
+        idx = np.searchsorted(self.genomes, alive)
+        self.last[:] = 0
+        self.last[idx] = counts[alive]
+        higher = self.last > self.peak
+        self.peak[higher] = self.last[higher]
+        self.peak_step[higher] = t
+
+    def info(self, g):
+        """
+        Dict of first seen step, peak and last abundance of genome `g`, None if never seen.
+
+        """
+        i = np.searchsorted(self.genomes, g)
+        if i == len(self.genomes) or self.genomes[i] != g:
+            return None
+        return {"first_seen": int(self.first_seen[i]), "peak": int(self.peak[i]),
+                "peak_step": int(self.peak_step[i]), "last": int(self.last[i])}
+
+    def parents(self, g):
+        """
+        List of (parent genome, births, first step) of genome `g`, most births first.
+
+        """
+        sel = np.flatnonzero((self.edges & ((1 << GENOME_BITS) - 1)) == g)
+        res = [(int(self.edges[i] >> GENOME_BITS), int(self.edge_counts[i]), int(self.edge_first[i])) for i in sel]
+        return sorted(res, key=lambda r: -r[1])
+
+    def children(self, g):
+        """
+        List of (child genome, births, first step) of genome `g`, most births first.
+
+        """
+        lo = np.searchsorted(self.edges, g << GENOME_BITS)
+        hi = np.searchsorted(self.edges, (g + 1) << GENOME_BITS)
+        res = [(int(self.edges[i] & ((1 << GENOME_BITS) - 1)), int(self.edge_counts[i]), int(self.edge_first[i]))
+               for i in range(lo, hi)]
+        return sorted(res, key=lambda r: -r[1])
+
+    def origin(self, g):
+        """
+        Parents on the births that first produced genome `g`.
+
+        """
+        info = self.info(g)
+        if info is None:
+            return []
+        return [p for p, count, first in self.parents(g) if first == info["first_seen"]]
+
+    def ancestry(self, g, depth=None):
+        """
+        {genome: generation} of `g` ancestors through `origin` edges,
+        only following parents seen before their children.
+
+        """
+        res, front, gen = {g: 0}, [g], 0
+        while front and (depth is None or gen < depth):
+            gen += 1
+            nxt = []
+            for child in front:
+                born = self.info(child)["first_seen"]
+                for p in self.origin(child):
+                    seen = self.info(p)
+                    if p not in res and seen and seen["first_seen"] < born:
+                        res[p] = gen
+                        nxt.append(p)
+            front = nxt
+        return res
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **dict((name, getattr(self, name)) for name in self.__dict__))
+
+    @classmethod
+    def load(cls, path):
+        self = cls()
+        with np.load(path) as data:
+            for name in self.__dict__:
+                setattr(self, name, data[name])
+        return self
+
+
+class LineageTracker(object):
+    """
+    Device lineage table of `slots` (power of 2) entries for `backend`,
+    drained into `genealogies` every `every` steps, with a census of
+    each world. Each step takes its table with `table`.
+
+    """
+
+    def __init__(self, backend, worlds=None, slots=1 << 20, every=64):
+        if slots & (slots - 1) or not 0 < every <= MAX_EVERY:
+            raise ValueError("Slots must be a power of 2 and drains at most %d steps apart." % MAX_EVERY)
+        self.backend = backend
+        self.worlds = worlds
+        self.every = every
+        self.keys = backend.to_device(np.zeros(slots, dtype=np.uint64))
+        self.counts = backend.to_device(np.zeros(slots + 1, dtype=np.uint32))
+        self.genealogies = [Genealogy() for k in range(worlds or 1)]
+        self.start = None
+        self.dropped = 0
+
+    def table(self, t):
+        """
+        (keys, counts, step) lineage argument of `ca_step` for step `t`.
+
+        """
+        if self.start is None:
+            self.start = t
+        return self.keys, self.counts, t - self.start
+
+    def due(self, t):
+        """
+        Whether tables of steps up to `t` are to be drained.
+
+        """
+        return self.start is not None and t - self.start >= self.every - 1
+
+    def drain(self, t, fld, w, h):
+        """
+        Merge counted events into genealogies and take a census of `fld`
+        at step `t`. Call it on the initial field too, to know its genomes.
+
+        """
+        if self.start is not None:
+            keys = np.asarray(self.backend.from_device(self.keys))
+            counts = np.asarray(self.backend.from_device(self.counts)).astype(np.int64)
+            used = np.flatnonzero(keys)
+            steps, worlds, parents, children = unpack(keys[used])
+            for k, g in enumerate(self.genealogies):
+                sel = worlds == k
+                g.add_edges(steps[sel] + self.start, parents[sel], children[sel], counts[used][sel])
+            self.dropped += int(counts[-1])
+            self.keys.fill(0)
+            self.counts.fill(0)
+            self.start = None
+        census = self.backend.census(fld, w, h)
+        for k, g in enumerate(self.genealogies):
+            g.observe(t, census[k] if self.worlds else census)
+
+
+def print_ancestry(g, target, depth=None):
+    for p, gen in sorted(g.ancestry(target, depth).items(), key=lambda item: item[1]):
+        info = g.info(p)
+        print("%s%s: first seen at step %s, peak %s at step %s, from %s" % (
+            "  " * gen, genome.genome2str(p), info["first_seen"], info["peak"], info["peak_step"],
+            ", ".join(genome.genome2str(o) for o in g.origin(p)) or "initial field"))
+
+
+if __name__ == '__main__':
+    print_ancestry(Genealogy.load(sys.argv[1]), genome.str2genome(sys.argv[2]),
+                   int(sys.argv[3]) if len(sys.argv) > 3 else None)
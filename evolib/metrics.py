@@ -0,0 +1,142 @@
+"""
+Per-step ecological counters, computed by the step kernels themselves.
+
+With a `stats` array passed to `ca_step` and `ca_flush` (CUDA and NumPy
+backends), each step adds to it, per world:
+- `live`, cells with a genome after the step;
+- `births`, empty cells getting a genome;
+- `reoccupations`, living cells taken over by a different genome;
+  a child over MAX_GENES empties the cell, it's neither that nor a death;
+- `deaths_starvation`, living cells killed by running out of energy, on
+  aging or on BIRTH_COST charges;
+- `deaths_sustain`, living cells killed by their sustain rule (isolated
+  cells included);
+- `energy`, total energy counter of living cells, mean is `energy / live`;
+- `birth_cost`, BIRTH_COST energy charged to parents.
+Kernels sum them with one atomic per warp, so counting costs next to
+nothing, and nothing is copied back on each step.
+
+`MetricsStream` keeps a ring of such rows on the device, one per step,
+and drains it to the host once full. Rows are written from a background
+thread as chunks of columns, `chunk_<first step>.npz` files in a
+directory, read back with `load`.
+
+Example:
+
+    stream = MetricsStream(backend, "runs/bliamba.metrics")
+    backend.ca_step(..., stats=stream.slot(t + 1))
+    backend.ca_flush(..., stats=stream.slot(t + 1))
+    stream.close()
+    columns = load("runs/bliamba.metrics")
+
+"""
+
+import os, glob, threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+METRICS = ("live", "births", "reoccupations", "deaths_starvation", "deaths_sustain", "energy", "birth_cost")
+
+
+def empty(worlds=None):
+    """
+    Zeroed host `stats` array, for one world or a batch of `worlds`.
+
+    """
+    return np.zeros(((worlds,) if worlds else ()) + (len(METRICS),), dtype=np.uint64)
+
+
+class MetricsStream(object):
+    """
+    Ring of `capacity` device `stats` rows of `backend`, drained to
+    `directory`. Each step takes its row with `slot`.
+
+    """
+
+    def __init__(self, backend, directory, worlds=None, capacity=1024):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.backend = backend
+        self.directory = directory
+        self.ring = backend.to_device(np.array([empty(worlds)] * capacity))
+        self.steps = []
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def slot(self, t):
+        """
+        `stats` row for step `t`, both kernels of a step add to the same one.
+
+        """
+        if not self.steps or self.steps[-1] != t:
+            if len(self.steps) == len(self.ring):
+                self.drain()
+            self.steps.append(t)
+        return self.ring[len(self.steps) - 1]
+
+    def drain(self):
+        """
+        Copy filled rows to host and queue them for writing.
+
+        """
+        if self.error:
+            raise self.error
+        if not self.steps:
+            return
+        rows = np.array(self.backend.from_device(self.ring)[:len(self.steps)])
+        self.ring.fill(0)
+        self.queue.put((np.array(self.steps, dtype=np.int64), rows))
+        self.steps = []
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, steps, rows):
+        path = os.path.join(self.directory, "chunk_%012d.npz" % steps[0])
+        columns = dict((name, rows[..., j]) for j, name in enumerate(METRICS))
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, step=steps, **columns)
+        os.rename(path + ".tmp", path)
+
+    def close(self):
+        """
+        Drain the ring and wait for all chunks to be written.
+
+        """
+        self.drain()
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+
+def load(directory):
+    """
+    All chunks in `directory` as a dict of columns, `step` and METRICS,
+    with `mean_energy` of living cells added.
+
+    """
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(directory, "chunk_*.npz"))):
+        with np.load(path) as data:
+            chunks.append(dict((name, data[name]) for name in ("step",) + METRICS))
+    if not chunks:
+        raise ValueError("No metrics in %s." % directory)
+    columns = dict((name, np.concatenate([c[name] for c in chunks])) for name in chunks[0])
+    columns["mean_energy"] = columns["energy"] / np.maximum(columns["live"], 1).astype(np.float64)
+    return columns
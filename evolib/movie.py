@@ -0,0 +1,151 @@
+"""
+Movie writers for viewer frames, keeping up with the simulation.
+
+Frames are (width, height, 3) uint8 RGB arrays, as blitted with
+`pygame.surfarray`. Two ways to write them:
+- `PNGWriter`, numbered PNG files encoded by a pool of processes;
+- `PipeWriter`, raw RGB frames piped to a video encoder process,
+  fed from a background thread.
+
+Both accept frames as long as fewer than `backlog` are waiting, then
+`write` blocks until the oldest one is done, so memory stays bounded
+and no frame is ever lost or reordered.
+
+Example:
+
+    movie = PNGWriter("movie")
+    movie.write(frame)
+    movie.close()
+
+    cmd = "ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {width}x{height} -r 30 -i - movie.mp4"
+    movie = PipeWriter(cmd, (width, height))
+
+"""
+
+import os, zlib, struct, shlex, threading, subprocess, multiprocessing
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+def png_bytes(frame, level=6):
+    """
+    PNG file contents for a (width, height, 3) uint8 frame.
+
+    """
+    rows = np.ascontiguousarray(np.asarray(frame, dtype=np.uint8).transpose(1, 0, 2))
+    height, width = rows.shape[:2]
+    # filter type 0 (none) before each row
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rows.reshape(height, -1)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header) +
+            png_chunk(b"IDAT", zlib.compress(raw.tobytes(), level)) + png_chunk(b"IEND", b""))
+
+
+def save_png(path, frame, level):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(png_bytes(frame, level))
+    os.rename(tmp, path)
+
+
+class PNGWriter(object):
+    """
+    Write frames to `directory` as `pattern` % frame number, from `start`,
+    encoded on `workers` processes (all CPU cores by default).
+
+    """
+
+    def __init__(self, directory="movie", pattern="frame%08d.png", start=0, workers=None, backlog=8, level=6):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.pattern = pattern
+        self.count = start
+        self.backlog = backlog
+        self.level = level
+        self.pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+        self.pending = []
+
+    def write(self, frame):
+        while len(self.pending) >= self.backlog:
+            # re-raises encoding errors too
+            self.pending.pop(0).get()
+        path = os.path.join(self.directory, self.pattern % self.count)
+        self.pending.append(self.pool.apply_async(save_png, (path, np.array(frame), self.level)))
+        self.count += 1
+
+    def close(self):
+        """
+        Wait for all frames to be written and stop the workers.
+
+        """
+        try:
+            for result in self.pending:
+                result.get()
+        finally:
+            self.pending = []
+            self.pool.close()
+            self.pool.join()
+
+
+class PipeWriter(object):
+    """
+    Pipe raw RGB frames of `size` (width, height) to the standard input of
+    encoder `command`; `{width}` and `{height}` in it are replaced
+    with the frame size.
+
+    """
+
+    def __init__(self, command, size, backlog=8):
+        self.size = tuple(size)
+        args = shlex.split(command.format(width=size[0], height=size[1]))
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE)
+        self.queue = queue.Queue(backlog)
+        self.error = None
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, frame):
+        if self.error:
+            raise self.error
+        if frame.shape[:2] != self.size:
+            raise ValueError("Frame of %sx%s, while movie is %sx%s." % (frame.shape[:2] + self.size))
+        # rows of pixels, as encoders expect them
+        self.queue.put(np.ascontiguousarray(np.asarray(frame, dtype=np.uint8).transpose(1, 0, 2)))
+
+    def _work(self):
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                break
+            if self.error:
+                continue
+            try:
+                self.process.stdin.write(rows.tobytes())
+            except (IOError, OSError) as e:
+                self.error = e
+
+    def close(self):
+        """
+        Write all queued frames and wait for the encoder to finish.
+
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.process.stdin.close()
+        code = self.process.wait()
+        if self.error:
+            raise self.error
+        if code:
+            raise RuntimeError("Movie encoder exited with code %s." % code)
@@ -0,0 +1,218 @@
+"""
+Run history as a stream of compressed field snapshots.
+
+A recording file holds a JSON header (field size and run parameters) and a
+sequence of records, each compressed with zlib on its own:
+- keyframe, genome plane as is;
+- delta, genome plane XOR-ed with the previous snapshot's, run-length
+  encoded as (zero run, value) pairs, as only a small share of cells
+  changes between snapshots.
+Each record also holds the energy plane, as uint8 (flushed fields never
+have more). A keyframe is written every `keyframe_every` snapshots, so
+any step is decoded from at most that many records.
+
+Encoding, compression and writing happen on a background thread; the
+caller only copies the field from the backend.
+
+Example:
+
+    rec = Recorder("runs/bliamba.evr", w, h, params={"preset": "bliamba"})
+    rec.record(t, backend.from_device(fld))
+    rec.close()
+    fld = Recording("runs/bliamba.evr").field(1000)
+
+Info and extraction:
+    python -m evolib.recorder runs/bliamba.evr [step out.npy]
+
+"""
+
+import sys, json, zlib, struct, threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+MAGIC = b"EVOREC1\n"
+# kind, step, genome and energy payload lengths
+RECORD = struct.Struct("<cqII")
+KEYFRAME, DELTA = b"K", b"D"
+
+
+def rle_encode(diff):
+    """
+    Bytes of (zeros before, value) uint32 pairs for non-zero items of `diff`.
+
+    """
+    nz = np.flatnonzero(diff)
+    runs = np.diff(np.concatenate([[-1], nz])) - 1
+    pairs = np.empty((len(nz), 2), dtype="<u4")
+    pairs[:, 0] = runs
+    pairs[:, 1] = diff[nz]
+    return pairs.tobytes()
+
+
+def rle_decode(data, size):
+    pairs = np.frombuffer(data, dtype="<u4").reshape(-1, 2)
+    diff = np.zeros(size, dtype=np.uint32)
+    diff[np.cumsum(pairs[:, 0].astype(np.int64) + 1) - 1] = pairs[:, 1]
+    return diff
+
+
+class Recorder(object):
+    """
+    Write snapshots of a (width, height) field to `path`. `params` are
+    stored in the header as is. Up to `backlog` snapshots wait for the
+    writing thread, `record` blocks only if it falls that much behind.
+
+    """
+
+    def __init__(self, path, width, height, params=None, keyframe_every=50, level=6, backlog=16):
+        self.shape = (width, height)
+        self.keyframe_every = keyframe_every
+        self.level = level
+        self.count = 0
+        self.last = None
+        self.file = open(path, "wb")
+        header = json.dumps({"width": width, "height": height, "keyframe_every": keyframe_every,
+                             "params": params or {}}, sort_keys=True).encode("utf-8")
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.queue = queue.Queue(backlog)
+        self.error = None
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, step, fld):
+        """
+        Queue a snapshot of host array `fld` at `step`. It's copied, so
+        the caller may reuse `fld` right away.
+
+        """
+        if self.error:
+            raise self.error
+        fld = np.array(fld, dtype=np.int32).reshape(self.shape)
+        self.queue.put((step, fld))
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.error = e
+
+    def _write(self, step, fld):
+        f0 = fld.view(np.uint32).ravel()
+        genomes = f0 & 0x1ffff
+        energy = f0 >> 17
+        if (energy > 0xff).any():
+            raise ValueError("Snapshot at step %d is not flushed." % step)
+        if self.count % self.keyframe_every == 0:
+            kind, data = KEYFRAME, genomes.astype("<u4").tobytes()
+        else:
+            kind, data = DELTA, rle_encode(genomes ^ self.last)
+        self.last = genomes
+        self.count += 1
+        data = zlib.compress(data, self.level)
+        energy = zlib.compress(energy.astype(np.uint8).tobytes(), self.level)
+        self.file.write(RECORD.pack(kind, step, len(data), len(energy)) + data + energy)
+
+    def close(self):
+        """
+        Write all queued snapshots and close the file.
+
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error:
+            raise self.error
+
+
+class Recording(object):
+    """
+    Random access to snapshots in a recording file. Only record headers
+    are read on opening.
+
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not an EvoLife recording." % path)
+        size, = struct.unpack("<I", self.file.read(4))
+        self.header = json.loads(self.file.read(size).decode("utf-8"))
+        self.shape = (self.header["width"], self.header["height"])
+        self.params = self.header["params"]
+        offset = self.file.tell()
+        self.file.seek(0, 2)
+        end = self.file.tell()
+        self.records = []
+        while offset + RECORD.size <= end:
+            self.file.seek(offset)
+            kind, step, glen, elen = RECORD.unpack(self.file.read(RECORD.size))
+            if offset + RECORD.size + glen + elen > end:
+                # record cut by an interrupted run
+                break
+            self.records.append((step, kind, offset + RECORD.size, glen, elen))
+            offset += RECORD.size + glen + elen
+        self.steps = [r[0] for r in self.records]
+        self._cache = None
+
+    def _payload(self, i, energy=False):
+        step, kind, offset, glen, elen = self.records[i]
+        self.file.seek(offset + glen if energy else offset)
+        return kind, zlib.decompress(self.file.read(elen if energy else glen))
+
+    def genomes(self, i):
+        """
+        Genome plane of `i`-th snapshot, as flat uint32 array.
+
+        """
+        key = i
+        while self.records[key][1] != KEYFRAME:
+            key -= 1
+        start, genomes = key, None
+        # last decoded snapshot saves replaying from the keyframe
+        if self._cache and key <= self._cache[0] <= i:
+            start, genomes = self._cache[0] + 1, self._cache[1]
+        size = self.shape[0] * self.shape[1]
+        for j in range(start, i + 1):
+            kind, data = self._payload(j)
+            if kind == KEYFRAME:
+                genomes = np.frombuffer(data, dtype="<u4").astype(np.uint32)
+            else:
+                genomes = genomes ^ rle_decode(data, size)
+        self._cache = (i, genomes)
+        return genomes
+
+    def energy(self, i):
+        return np.frombuffer(self._payload(i, energy=True)[1], dtype=np.uint8)
+
+    def field(self, step):
+        """
+        Field at a recorded `step`, as int32 (width, height) array.
+
+        """
+        if step not in self.steps:
+            raise KeyError("Step %s is not recorded." % step)
+        i = self.steps.index(step)
+        fld = self.genomes(i) | (self.energy(i).astype(np.uint32) << 17)
+        return fld.view(np.int32).reshape(self.shape)
+
+    def close(self):
+        self.file.close()
+
+
+if __name__ == '__main__':
+    rec = Recording(sys.argv[1])
+    print("%dx%d, %d snapshots, steps %s..%s, params: %s" % (
+        rec.shape + (len(rec.steps), rec.steps[0] if rec.steps else None,
+                     rec.steps[-1] if rec.steps else None, json.dumps(rec.params, sort_keys=True))))
+    if len(sys.argv) > 3:
+        np.save(sys.argv[3], rec.field(int(sys.argv[2])))
@@ -0,0 +1,143 @@
+"""
+Spatial index of species over the field, for queries without rescanning it.
+
+The field is split into `tile` x `tile` cells squares (edge tiles may be
+smaller). Built once from a field snapshot, the index holds:
+- sparse per-tile histograms, (tile, genome, count) triples, sorted both
+  by tile and by genome;
+- bounding box of each genome, in cells (not wrapped around the torus);
+- the genome plane itself, so queries over partly covered tiles only
+  look at those tiles' cells.
+
+Genomes may be given as ints or in B/S notation, like "3/23".
+
+Example:
+
+    index = SpatialIndex(backend.from_device(fld), t=1000)
+    tiles, counts = index.where("3/23")
+    genomes, counts = index.species_in((0, 0, 200, 100))
+
+"""
+
+import numpy as np
+
+from evolib import cpu, genome
+
+
+def as_genome(g):
+    return genome.str2genome(g) if isinstance(g, genome.string_types) else int(g)
+
+
+class SpatialIndex(object):
+    """
+    Index of (w, h) host field `fld` at step `t`.
+
+    """
+
+    def __init__(self, fld, t=0, tile=64):
+        self.t = t
+        self.tile = tile
+        self.genomes = np.asarray(fld).view(np.uint32) & cpu.GENOME_MASK
+        w, h = self.genomes.shape
+        self.shape = (-(-w // tile), -(-h // tile))
+        x, y = np.nonzero(self.genomes)
+        g = self.genomes[x, y].astype(np.int64)
+        tiles = (x // tile) * self.shape[1] + y // tile
+        # histograms, sorted by (tile, genome)
+        keys, self.counts = np.unique((tiles << cpu.NUM_GENES) | g, return_counts=True)
+        self.tiles, self.species = keys >> cpu.NUM_GENES, keys & cpu.GENOME_MASK
+        self.by_genome = np.lexsort((self.tiles, self.species))
+        # bounding boxes, by genome
+        self.boxes = {}
+        if len(g):
+            order = np.argsort(g, kind="mergesort")
+            starts = np.flatnonzero(np.diff(np.concatenate([[-1], g[order]])))
+            for name, values in (("x0", x), ("y0", y)):
+                self.boxes[name] = np.minimum.reduceat(values[order], starts)
+            for name, values in (("x1", x), ("y1", y)):
+                self.boxes[name] = np.maximum.reduceat(values[order], starts) + 1
+            self.boxes["genome"] = g[order][starts]
+
+    def _rows(self, g):
+        """
+        Histogram rows of genome `g`, in tile order.
+
+        """
+        species = self.species[self.by_genome]
+        lo, hi = np.searchsorted(species, g), np.searchsorted(species, g, side="right")
+        return self.by_genome[lo:hi]
+
+    def where(self, g):
+        """
+        Return (tiles, counts) of genome `g`: (n, 2) tile coordinates and cells in each.
+
+        """
+        rows = self._rows(as_genome(g))
+        tiles = self.tiles[rows]
+        return np.stack([tiles // self.shape[1], tiles % self.shape[1]], axis=1), self.counts[rows]
+
+    def bbox(self, g):
+        """
+        Bounding box (x0, y0, x1, y1) of genome `g` cells, None if it's not on the field.
+
+        """
+        if not self.boxes:
+            return None
+        g = as_genome(g)
+        i = np.searchsorted(self.boxes["genome"], g)
+        if i == len(self.boxes["genome"]) or self.boxes["genome"][i] != g:
+            return None
+        return tuple(int(self.boxes[name][i]) for name in ("x0", "y0", "x1", "y1"))
+
+    def densest(self, g):
+        """
+        Mean (x, y) of genome `g` cells in the tile holding most of them, None if there's none.
+
+        """
+        tiles, counts = self.where(g)
+        if not len(counts):
+            return None
+        x0, y0 = tiles[np.argmax(counts)] * self.tile
+        x, y = np.nonzero(self.genomes[x0:x0 + self.tile, y0:y0 + self.tile] == as_genome(g))
+        return int(x0 + x.mean()), int(y0 + y.mean())
+
+    def count_by_tile(self, g=None):
+        """
+        Cells of genome `g` (all living cells if None) in each tile, as a
+        (tiles along x, tiles along y) array.
+
+        """
+        res = np.zeros(self.shape[0] * self.shape[1], dtype=np.int64)
+        if g is None:
+            np.add.at(res, self.tiles, self.counts)
+        else:
+            rows = self._rows(as_genome(g))
+            res[self.tiles[rows]] = self.counts[rows]
+        return res.reshape(self.shape)
+
+    def species_in(self, rect):
+        """
+        Return (genomes, counts) of species in `rect` (x0, y0, x1, y1),
+        most abundant first. Tiles fully inside are taken from histograms,
+        only cells of partly covered ones are counted.
+
+        """
+        w, h = self.genomes.shape
+        x0, y0, x1, y1 = max(rect[0], 0), max(rect[1], 0), min(rect[2], w), min(rect[3], h)
+        t = self.tile
+        tx0, ty0, tx1, ty1 = x0 // t, y0 // t, -(-x1 // t), -(-y1 // t)
+        counts = np.zeros(cpu.GENOME_MASK + 1, dtype=np.int64)
+        for tx in range(tx0, tx1):
+            for ty in range(ty0, ty1):
+                cx0, cy0, cx1, cy1 = tx * t, ty * t, (tx + 1) * t, (ty + 1) * t
+                if x0 <= cx0 and y0 <= cy0 and cx1 <= x1 and cy1 <= y1:
+                    tile = tx * self.shape[1] + ty
+                    lo, hi = np.searchsorted(self.tiles, [tile, tile + 1])
+                    counts[self.species[lo:hi]] += self.counts[lo:hi]
+                else:
+                    cells = self.genomes[max(x0, cx0):min(x1, cx1), max(y0, cy0):min(y1, cy1)]
+                    counts += np.bincount(cells.ravel(), minlength=len(counts))
+        counts[0] = 0
+        genomes = np.flatnonzero(counts)
+        order = np.argsort(-counts[genomes], kind="mergesort")
+        return genomes[order], counts[genomes][order]
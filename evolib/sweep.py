@@ -0,0 +1,199 @@
+"""
+Parameter sweeps over presets, run headless on a process pool.
+
+Each run is a (preset, DEATH_SPEED, BIRTH_COST, MAX_GENES, RANDOM_SEED)
+combination, either from a full grid or sampled at random. Finished runs
+are appended as JSON lines to a results file by the parent process only,
+so an interrupted sweep is resumed by running the same command again:
+runs already in the file are skipped.
+
+Each result holds run parameters and a summary: species count and
+population every `sample_every` steps, extinction step (None if life
+survived) and top species at the end, as [genome string, count] pairs.
+
+Usage:
+    python -m evolib.sweep big_bang conway --death-speed 0 1 23 --birth-cost 0 3 \\
+        --max-genes 9 14 --seed 1 2 3 --steps 1000 --out sweep.jsonl
+
+"""
+
+import os, sys, json, random, hashlib, argparse, itertools, traceback
+import multiprocessing
+
+from evolib import world, genome
+
+SWEPT = ("preset", "DEATH_SPEED", "BIRTH_COST", "MAX_GENES", "RANDOM_SEED")
+
+
+def run_key(run):
+    """
+    Stable id of a run, from its parameters.
+
+    """
+    data = json.dumps(run, sort_keys=True).encode("utf-8")
+    return hashlib.md5(data).hexdigest()[:16]
+
+
+def grid(presets, death_speed, birth_cost, max_genes, seeds, **fixed):
+    """
+    All combinations of given values, as a list of run dicts.
+    Extra `fixed` items (steps, sizes) are added to each run.
+
+    """
+    runs = []
+    for combo in itertools.product(presets, death_speed, birth_cost, max_genes, seeds):
+        run = dict(zip(SWEPT, combo))
+        run.update(fixed)
+        runs.append(run)
+    return runs
+
+
+def random_sample(num, presets, death_speed, birth_cost, max_genes, seed=None, **fixed):
+    """
+    `num` runs with parameters drawn uniformly from (min, max) ranges
+    and presets list, each with its own random RANDOM_SEED.
+
+    """
+    rng = random.Random(seed)
+    runs = []
+    for i in range(num):
+        run = {
+            "preset": rng.choice(presets),
+            "DEATH_SPEED": rng.randint(*death_speed),
+            "BIRTH_COST": rng.randint(*birth_cost),
+            "MAX_GENES": rng.randint(*max_genes),
+            "RANDOM_SEED": rng.randint(1, 2 ** 31 - 1),
+        }
+        run.update(fixed)
+        runs.append(run)
+    return runs
+
+
+def simulate(run):
+    """
+    Run a single simulation and return its summary.
+
+    """
+    overrides = dict((k, run[k]) for k in SWEPT[1:])
+    if run.get("width"):
+        overrides["FIELD_WIDTH"] = run["width"]
+    if run.get("height"):
+        overrides["FIELD_HEIGHT"] = run["height"]
+    w = world.World(world.load_preset(run["preset"], **overrides), world.make_backend(run.get("backend", "numpy")))
+    sample_every = run.get("sample_every", 100)
+    steps = run["steps"]
+    species_num, population = [], []
+    extinction = None
+    while True:
+        genomes, counts = w.species()
+        species_num.append(len(genomes))
+        population.append(int(counts.sum()))
+        if not len(genomes):
+            extinction = w.t
+            break
+        if w.t >= steps:
+            break
+        w.step(min(sample_every, steps - w.t))
+    top = [[str(s), int(c)] for s, c in zip(genome.genomes2strs(genomes[:10]), counts[:10])]
+    return {
+        "species": species_num,
+        "population": population,
+        "extinction": extinction,
+        "dominant": top,
+        "steps": w.t,
+    }
+
+
+def _worker(job):
+    key, run = job
+    try:
+        return key, run, simulate(run), None
+    except Exception:
+        return key, run, None, traceback.format_exc()
+
+
+def load_results(path):
+    """
+    List of result rows stored in `path`.
+
+    """
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path) as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # line cut by an interrupted sweep
+                pass
+    return rows
+
+
+def sweep(runs, path, workers=None):
+    """
+    Run all `runs` not yet in `path` results file on a process pool.
+
+    """
+    done = set(row["key"] for row in load_results(path))
+    jobs = [(run_key(run), run) for run in runs]
+    jobs = [job for job in jobs if job[0] not in done]
+    print("%d runs, %d already done, %d to go." % (len(runs), len(runs) - len(jobs), len(jobs)))
+    if not jobs:
+        return
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            incomplete = f.read() != b"\n"
+        if incomplete:
+            with open(path, "a") as f:
+                f.write("\n")
+    pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+    try:
+        with open(path, "a") as f:
+            for i, (key, run, summary, error) in enumerate(pool.imap_unordered(_worker, jobs)):
+                if error:
+                    print("Run %s failed:\n%s" % (run, error))
+                    continue
+                row = dict(run, key=key, summary=summary)
+                f.write(json.dumps(row, sort_keys=True) + "\n")
+                f.flush()
+                print("[%d/%d] %s: SN=%s, extinction=%s" % (i + 1, len(jobs), key, summary["species"][-1],
+                                                           summary["extinction"]))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="EvoLife parameter sweep.")
+    parser.add_argument("presets", nargs="+", help="preset names from experiments2 folder")
+    parser.add_argument("--death-speed", type=int, nargs="+", default=[0])
+    parser.add_argument("--birth-cost", type=int, nargs="+", default=[0])
+    parser.add_argument("--max-genes", type=int, nargs="+", default=[9])
+    parser.add_argument("--seed", type=int, nargs="+", default=[1], help="RANDOM_SEED values")
+    parser.add_argument("--random", type=int, default=0, metavar="N",
+                        help="sample N runs at random instead of a grid, "
+                             "using min and max of each parameter's values as a range")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--width", type=int, help="override preset's field width")
+    parser.add_argument("--height", type=int, help="override preset's field height")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--backend", choices=["numpy", "active", "cuda"], default="numpy",
+                        help="backend for each run (default: numpy)")
+    parser.add_argument("--out", default="sweep.jsonl", help="results file (default: sweep.jsonl)")
+    args = parser.parse_args(argv)
+    fixed = dict(steps=args.steps, sample_every=args.sample_every, width=args.width, height=args.height)
+    if args.backend != "numpy":
+        fixed["backend"] = args.backend
+    if args.random:
+        ranges = [(min(v), max(v)) for v in (args.death_speed, args.birth_cost, args.max_genes)]
+        runs = random_sample(args.random, args.presets, *ranges, seed=args.seed[0], **fixed)
+    else:
+        runs = grid(args.presets, args.death_speed, args.birth_cost, args.max_genes, args.seed, **fixed)
+    sweep(runs, args.out, args.workers)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
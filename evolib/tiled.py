@@ -0,0 +1,202 @@
+"""
+Multi-core CPU backend. Torus is split into horizontal strips (ranges of x),
+each strip is stepped by its own worker process with `evolib.cpu` routines.
+
+Field buffers live in shared memory, so workers read a one-row halo of their
+neighbours directly. BIRTH_COST charges landing on halo rows can't be written
+to `bufs` of a foreign strip without a race, so each worker keeps them in its
+own halo slots, and owners add them to `bufs` on `ca_flush` phase, before
+applying. Output is bit-identical to `evolib.cpu` and CUDA kernels,
+with the counter-based crossover RNG too, as cells keep their field indices.
+
+Workers are forked on first `ca_step`, so all buffers must be allocated with
+`to_device` before. Registering a new buffer later restarts the pool.
+
+Benchmark:
+    python -m evolib.tiled [width height steps [max_workers]]
+
+"""
+
+import sys, time, ctypes, signal, traceback
+import multiprocessing
+
+import numpy as np
+
+from evolib import cpu
+
+if hasattr(multiprocessing, "get_context"):
+    mp = multiprocessing.get_context("fork")
+else:
+    mp = multiprocessing
+
+
+def shared_zeros(shape, dtype=np.int32):
+    """
+    Allocate zero-filled array in memory shared with forked workers.
+
+    """
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    raw = mp.RawArray(ctypes.c_byte, size)
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def strips(width, workers):
+    """
+    Split [0, width) into `workers` contiguous (x0, x1) ranges.
+
+    """
+    workers = max(1, min(workers, width))
+    bounds = [width * i // workers for i in range(workers + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _worker(conn, arrays, halos, bins, wid, bounds):
+    # handlers inherited from parent (like SDL parachute) may block termination
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    x0, x1 = bounds[wid]
+    num = len(bounds)
+    prev, nxt = (wid - 1) % num, (wid + 1) % num
+    birth_cost = 0
+    while True:
+        cmd = conn.recv()
+        if cmd is None:
+            break
+        try:
+            name, args = cmd
+            if name == "step":
+                fld_id, new_id, seeds_id, bufs_id, death_speed, birth_cost, max_genes, rng = args
+                fld, bufs = arrays[fld_id], arrays[bufs_id]
+                width, height = fld.shape
+                block = fld[np.arange(x0 - 1, x1 + 1) % width]
+                seeds = arrays[seeds_id][x0:x1] if seeds_id is not None else None
+                cell_ids = np.arange(x0 * height, x1 * height).reshape(x1 - x0, height) if rng else None
+                res, charges = cpu.step_block(block, seeds, death_speed, birth_cost, max_genes, halo=1,
+                                              rng=rng, cell_ids=cell_ids)
+                arrays[new_id][x0:x1].view(np.uint32)[...] = res
+                if charges is not None:
+                    bufs[x0:x1].view(np.uint32)[...] += charges[1:-1]
+                    halos[wid] = charges[[0, -1]]
+                elif birth_cost:
+                    halos[wid] = 0
+            elif name == "flush":
+                new_id, bufs_id, img_id, fade_in, fade_out = args
+                bufs = arrays[bufs_id].view(np.uint32)
+                if birth_cost:
+                    bufs[x0] += halos[prev, 1]
+                    bufs[x1 - 1] += halos[nxt, 0]
+                cpu.ca_flush(arrays[new_id][x0:x1], bufs[x0:x1], arrays[img_id][x0:x1],
+                             x1 - x0, bufs.shape[1], fade_in, fade_out)
+            elif name == "census":
+                fld = arrays[args[0]]
+                bins[wid] = cpu.census(fld[x0:x1], x1 - x0, fld.shape[1])
+            conn.send(None)
+        except Exception:
+            conn.send(traceback.format_exc())
+
+
+class TiledBackend(object):
+    """
+    Pool of strip workers, with the same `ca_step` / `ca_flush`
+    interface as `evolib.cpu`. Arrays passed to them must come from
+    this backend's `to_device`.
+
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or mp.cpu_count()
+        self.arrays = []
+        self.pool = []
+
+    def to_device(self, arr):
+        if self.pool:
+            self.close()
+        dev = shared_zeros(arr.shape, arr.dtype)
+        dev[...] = arr
+        self.arrays.append(dev)
+        return dev
+
+    def from_device(self, arr):
+        return np.asarray(arr)
+
+    def _id(self, arr):
+        for i, a in enumerate(self.arrays):
+            if a is arr:
+                return i
+        raise ValueError("Array is not allocated with TiledBackend.to_device")
+
+    def _start(self, width, height):
+        bounds = strips(width, self.workers)
+        halos = shared_zeros((len(bounds), 2, height), np.uint32)
+        self.bins = shared_zeros((len(bounds), 1 << cpu.NUM_GENES), np.int64)
+        for wid in range(len(bounds)):
+            parent_conn, child_conn = mp.Pipe()
+            proc = mp.Process(target=_worker, args=(child_conn, self.arrays, halos, self.bins, wid, bounds))
+            proc.daemon = True
+            proc.start()
+            self.pool.append((proc, parent_conn))
+
+    def _run(self, cmd):
+        for proc, conn in self.pool:
+            conn.send(cmd)
+        errors = [conn.recv() for proc, conn in self.pool]
+        errors = [e for e in errors if e is not None]
+        if errors:
+            raise RuntimeError("Worker failed:\n" + errors[0])
+
+    def ca_step(self, fld, fld_new, seeds, bufs, img, w, h, death_speed, birth_cost, max_genes, rng=None):
+        if not self.pool:
+            self._start(int(w), int(h))
+        ids = [None if a is None else self._id(a) for a in (fld, fld_new, seeds, bufs)]
+        self._run(("step", ids + [death_speed, birth_cost, max_genes, rng]))
+
+    def ca_flush(self, fld_new, bufs, img, w, h, fade_in, fade_out):
+        ids = [self._id(a) for a in (fld_new, bufs, img)]
+        self._run(("flush", ids + [fade_in, fade_out]))
+
+    def census(self, fld, w, h):
+        if not self.pool:
+            self._start(int(w), int(h))
+        self._run(("census", [self._id(fld)]))
+        return self.bins.sum(axis=0)
+
+    def viewport(self, img, w, h, size, offset=(0, 0), zoom=1, factor=1):
+        return cpu.viewport(img, w, h, size, offset, zoom, factor)
+
+    def close(self):
+        for proc, conn in self.pool:
+            conn.send(None)
+            proc.join()
+        self.pool = []
+
+
+def benchmark(width=1280, height=720, steps=10, max_workers=None):
+    """
+    Run a random soup with DEATH_SPEED=23 on 1..max_workers workers,
+    return a list of (workers, cells/s) pairs.
+
+    """
+    rs = np.random.RandomState(0)
+    fld = (rs.randint(0, 2, (width, height)) * rs.randint(0, 256 * 512, (width, height))).astype(np.int32)
+    seeds = rs.randint(1, 50000, (width, height)).astype(np.int32)
+    results = []
+    for workers in range(1, (max_workers or mp.cpu_count()) + 1):
+        backend = TiledBackend(workers)
+        f1, f2 = backend.to_device(fld), backend.to_device(fld)
+        s, b, img = [backend.to_device(a) for a in (seeds, np.zeros_like(fld), np.zeros_like(fld))]
+        backend.ca_step(f1, f2, s, b, img, width, height, 23, 0, 14)
+        start_time = time.time()
+        for i in range(steps):
+            backend.ca_step(f1, f2, s, b, img, width, height, 23, 0, 14)
+            backend.ca_flush(f2, b, img, width, height, 6, 6)
+            f1, f2 = f2, f1
+        elapsed_time = time.time() - start_time
+        backend.close()
+        results.append((workers, width * height * steps / elapsed_time))
+    return results
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    for workers, speed in benchmark(*args):
+        print("%2d workers: %.3g cells/s" % (workers, speed))
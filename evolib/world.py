@@ -0,0 +1,170 @@
+"""
+Headless simulation, independent from the viewer's module-level setup.
+
+Presets are loaded from `experiments2` and any of their constants may be
+overridden per instance. All backends take kernel constants as arguments,
+so one process can run many configurations back to back or side by side.
+
+CROSSOVER_RNG picks the crossover RNG: 'lcg', the original per-cell seeds,
+or 'counter', a stateless hash of run key, step, cell and gene, with no
+`seeds` array at all.
+
+"""
+
+import importlib
+
+import numpy as np
+
+from evolib import cpu, tiled, active, fields, genome, census, checkpoint
+
+PRESET_PARAMS = ("DEATH_SPEED", "BIRTH_COST", "MAX_GENES", "FIELD_WIDTH", "FIELD_HEIGHT",
+                 "SAVE_FRAMES", "DOWNSCALE_FACTOR", "FRAME_SKIP", "RANDOM_SEED", "FADE_IN", "FADE_OUT",
+                 "CROSSOVER_RNG")
+# parameters presets (and older checkpoints) may leave out
+PARAM_DEFAULTS = {"CROSSOVER_RNG": "lcg"}
+CROSSOVER_RNGS = ("lcg", "counter")
+
+
+def make_backend(name, workers=0):
+    """
+    Backend by name: 'numpy', 'tiled', 'active' or 'cuda'.
+
+    """
+    if name == "numpy":
+        return cpu
+    if name == "tiled":
+        return tiled.TiledBackend(workers)
+    if name == "active":
+        return active.ActiveBackend()
+    if name == "cuda":
+        from evolib import cuda
+        return cuda
+    raise ValueError("Unknown backend '%s', use 'cuda', 'numpy', 'tiled' or 'active'." % name)
+
+
+def crossover_state(rng, shape, kind):
+    """
+    Initial crossover RNG state drawn from `rng`, as (seeds, key): per-cell
+    LCG seeds for 'lcg' `kind`, or the run key of the 'counter' one.
+
+    """
+    if kind == "counter":
+        return None, int(rng.randint(0, 1 << 31))
+    if kind == "lcg":
+        return fields.randint(rng.random_sample(shape), 1, 50000).astype(np.int32), None
+    raise ValueError("Unknown crossover RNG '%s', use %s." % (kind, " or ".join(repr(k) for k in CROSSOVER_RNGS)))
+
+
+def load_preset(name, **overrides):
+    """
+    Return preset's constants and `fld_init` as a dict, with upper-case
+    `overrides` applied, like load_preset("conway", DEATH_SPEED=1).
+
+    """
+    expmod = importlib.import_module('experiments2.' + name)
+    preset = dict(PARAM_DEFAULTS)
+    preset.update((k, getattr(expmod, k)) for k in PRESET_PARAMS if k not in PARAM_DEFAULTS or hasattr(expmod, k))
+    preset["fld_init"] = expmod.fld_init
+    preset["name"] = name
+    for k, v in overrides.items():
+        if k not in PRESET_PARAMS:
+            raise KeyError("Unknown preset parameter: %s" % k)
+        preset[k] = v
+    return preset
+
+
+class World(object):
+    """
+    Field with its state arrays, stepped by `backend` (`evolib.cpu`,
+    `evolib.cuda` module, `evolib.tiled.TiledBackend` or
+    `evolib.active.ActiveBackend` instance).
+
+    """
+
+    def __init__(self, preset, backend=cpu):
+        self.preset = preset
+        self.backend = backend
+        self.width = preset["FIELD_WIDTH"]
+        self.height = preset["FIELD_HEIGHT"]
+        seed = preset["RANDOM_SEED"]
+        self.rng = fields.make_rng(seed)
+        shape = (self.width, self.height)
+        seeds, self.rng_key = crossover_state(self.rng, shape, preset["CROSSOVER_RNG"])
+        if seed:
+            fields.sync_random(self.rng)
+        fld = np.asarray(preset["fld_init"](self), dtype=np.int32)
+        self.fld = backend.to_device(fld)
+        self.fld_new = backend.to_device(fld)
+        self.seeds = None if seeds is None else backend.to_device(seeds)
+        self.bufs = backend.to_device(np.zeros(shape, dtype=np.int32))
+        self.img = backend.to_device(np.zeros(shape, dtype=np.int32))
+        self.t = 0
+
+    @classmethod
+    def resume(cls, path, backend=cpu):
+        """
+        World restored from a checkpoint written by `save_checkpoint`.
+
+        """
+        arrays, params, t = checkpoint.load(path)
+        self = cls.__new__(cls)
+        self.preset = dict(PARAM_DEFAULTS, fld_init=None)
+        self.preset.update((k, v) for k, v in params.items() if k != "rng_key")
+        self.rng_key = params.get("rng_key")
+        self.backend = backend
+        self.width = params["FIELD_WIDTH"]
+        self.height = params["FIELD_HEIGHT"]
+        self.rng = fields.make_rng(params["RANDOM_SEED"])
+        self.fld = backend.to_device(arrays["fld"])
+        self.fld_new = backend.to_device(arrays["fld"])
+        self.seeds = backend.to_device(arrays["seeds"]) if "seeds" in arrays else None
+        self.bufs = backend.to_device(arrays["bufs"])
+        self.img = backend.to_device(arrays["img"])
+        self.t = t
+        return self
+
+    def save_checkpoint(self, path):
+        """
+        Write complete state to `path`, see `evolib.checkpoint`.
+
+        """
+        params = dict((k, v) for k, v in self.preset.items() if k != "fld_init")
+        params["rng_key"] = self.rng_key
+        arrays = dict((name, self.backend.from_device(getattr(self, name))) for name in checkpoint.STATE
+                      if getattr(self, name) is not None)
+        checkpoint.save(path, arrays, params, self.t)
+
+    def genome2str(self, g):
+        return genome.genome2str(g)
+
+    def str2genome(self, s):
+        return genome.str2genome(s)
+
+    def step(self, n=1):
+        p = self.preset
+        for i in range(n):
+            options = {} if self.rng_key is None else {"rng": (self.rng_key, self.t + i + 1)}
+            self.backend.ca_step(self.fld, self.fld_new, self.seeds, self.bufs, self.img,
+                                 self.width, self.height, p["DEATH_SPEED"], p["BIRTH_COST"], p["MAX_GENES"],
+                                 **options)
+            self.backend.ca_flush(self.fld_new, self.bufs, self.img,
+                                  self.width, self.height, p["FADE_IN"], p["FADE_OUT"])
+            self.fld, self.fld_new = self.fld_new, self.fld
+        self.t += n
+
+    def field(self):
+        return self.backend.from_device(self.fld)
+
+    def census(self):
+        """
+        Number of cells of each genome, as 2 ** 17 bins.
+
+        """
+        return self.backend.census(self.fld, self.width, self.height)
+
+    def species(self):
+        """
+        Return (genomes, counts) of living species, most abundant first.
+
+        """
+        return census.species(self.census())
@@ -27,34 +27,138 @@ Arrows    move field
 ]/[       speed up/down
 F         toggle fullscreen
 S         dump board state to a file
+G         jump to the next most abundant species
 Q/ESC     quit
 
-Prerequisites: pycuda, numpy, scipy, pygame, scikit-image
-Debian: apt-get install python-pycuda python-numpy python-pygame python-scipy python-setuptools
+HEADLESS:
+./evolife2.py run bliamba --steps 1000000 --no-display
+./evolife2.py run conway --steps 1000000 --no-display --hashlife --chart-every 100000
+./evolife2.py run bliamba --steps 10000 --no-display --compact
+./evolife2.py run bliamba --steps 100000 --no-display --record runs/bliamba.evr --record-every 1000
+./evolife2.py run bliamba --no-display --checkpoint runs/bliamba.ckpt --checkpoint-every 10000
+./evolife2.py run --resume runs/bliamba.ckpt --no-display
+./evolife2.py run coexistence --steps 10000 --no-display --metrics runs/coexistence.metrics
+./evolife2.py run crossbreeding --steps 10000 --no-display --lineage runs/crossbreeding.lineage.npz
+./evolife2.py run bliamba --no-display --crossover-rng counter
+
+MOVIE:
+SAVE_FRAMES = True in a preset writes PNG frames to movie/, or pipe them to an encoder:
+./evolife2.py bliamba --movie-encoder "ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {width}x{height} -i - bliamba.mp4"
+
+Prerequisites: numpy, pycuda (CUDA backend), pygame (display)
+Debian: apt-get install python-pycuda python-numpy python-pygame python-setuptools
+
+Without pycuda (or with EVOLIFE_BACKEND=numpy environment variable set),
+NumPy backend from `evolib.cpu` is used. It is much slower, but gives
+exactly the same fields as CUDA kernels.
+EVOLIFE_BACKEND=tiled runs NumPy backend on all CPU cores,
+set EVOLIFE_WORKERS to limit a number of worker processes.
+EVOLIFE_BACKEND=active steps only tiles around changed cells,
+much faster on mostly empty or static boards.
 
 Author: a5kin
 Copyright: MIT License.
 
 """
 
-import sys, time, math, colorsys, random, traceback
-import pygame
-from pygame.locals import *
+import sys, os, time, signal, traceback
+import argparse
 import numpy as np
-from scipy.misc import imsave
-import scipy.ndimage.interpolation
-from skimage import transform as tf
 import importlib
 
-import pycuda.driver as drv
-import pycuda.tools
-import pycuda.autoinit
-from pycuda.compiler import SourceModule
-import pycuda.gpuarray as gpuarray
-from pycuda.elementwise import ElementwiseKernel
+# imported with the display only, headless runs don't need it
+pygame = None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="EvoLife Cellular Automaton.",
+                                     usage="%(prog)s [run] [experiment] [options]")
+    parser.add_argument("experiment", nargs="?", help="preset name from experiments2 folder")
+    parser.add_argument("--steps", type=int, default=0, help="stop after N steps (default: run forever)")
+    parser.add_argument("--no-display", action="store_true", help="headless mode, simulation steps only")
+    parser.add_argument("--chart-every", type=int, default=100, metavar="N",
+                        help="print species chart every N steps, 0 to disable (default: 100)")
+    parser.add_argument("--backend", choices=["cuda", "numpy", "tiled", "active"],
+                        default=os.environ.get("EVOLIFE_BACKEND"),
+                        help="simulation backend (default: cuda if available, else numpy)")
+    parser.add_argument("--hashlife", action="store_true",
+                        help="headless only, jump with Hashlife where possible when DEATH_SPEED "
+                             "and BIRTH_COST are 0, stepping on NumPy backend elsewhere")
+    parser.add_argument("--compact", action="store_true",
+                        help="headless only, step on the compact field layout (evolib.compact) "
+                             "with NumPy, full arrays are rebuilt for charts, records and checkpoints only")
+    parser.add_argument("--gather-costs", action="store_true",
+                        help="charge BIRTH_COST by re-evaluating births around each parent "
+                             "instead of atomicAdd, cuda and numpy backends only")
+    parser.add_argument("--record", metavar="FILE",
+                        help="stream field snapshots to a recording file, see evolib.recorder")
+    parser.add_argument("--record-every", type=int, default=100, metavar="N",
+                        help="record a snapshot every N steps (default: 100)")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="save complete state to FILE at exit, on SIGUSR1, and on SIGTERM before stopping")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="N",
+                        help="also save a checkpoint every N steps")
+    parser.add_argument("--resume", metavar="FILE", help="resume a run from its checkpoint")
+    parser.add_argument("--metrics", metavar="DIR",
+                        help="stream per-step counters (population, births, deaths, energy) to DIR, "
+                             "see evolib.metrics, cuda and numpy backends only")
+    parser.add_argument("--lineage", metavar="FILE",
+                        help="track which genomes crossover made from which, save the genealogy to FILE "
+                             "(.npz) at exit, see evolib.lineage, cuda and numpy backends only")
+    parser.add_argument("--index-every", type=int, default=100, metavar="N",
+                        help="rebuild the species spatial index used by G key at most every N steps "
+                             "(default: 100), see evolib.spatial")
+    parser.add_argument("--crossover-rng", choices=["lcg", "counter"],
+                        help="crossover RNG: 'lcg' per-cell seeds, or 'counter', stateless hash of run key, "
+                             "step and cell, without seeds buffer (default: preset's CROSSOVER_RNG, else lcg)")
+    parser.add_argument("--movie-encoder", metavar="CMD",
+                        help="pipe raw RGB frames to encoder CMD instead of saving PNGs to movie/, "
+                             "{width} and {height} are replaced with frame size; implies saving frames")
+    if argv and argv[0] == "run":
+        argv = argv[1:]
+    return parser.parse_args(argv)
+
+
+ARGS = parse_args(sys.argv[1:])
+BACKEND = ARGS.backend
+if (ARGS.hashlife or ARGS.compact) and ARGS.no_display:
+    # jumps and compact steps are done on host arrays
+    BACKEND = "numpy"
+
+GPU_AVAILABLE = False
+if BACKEND in (None, "cuda"):
+    try:
+        from evolib import cuda
+        GPU_AVAILABLE = True
+    except ImportError:
+        pass
+
+from evolib import cpu, tiled, active, fields, genome, census, hashlife, compact, frames, recorder, world, checkpoint, movie, metrics, lineage, spatial
+
+if BACKEND is None:
+    BACKEND = "cuda" if GPU_AVAILABLE else "numpy"
+if BACKEND not in ("cuda", "numpy", "tiled", "active"):
+    print "Unknown backend '%s', use 'cuda', 'numpy', 'tiled' or 'active'." % BACKEND
+    sys.exit(0)
+if BACKEND == "cuda" and not GPU_AVAILABLE:
+    print "CUDA backend requested, but pycuda is not available."
+    sys.exit(0)
+if ARGS.gather_costs and BACKEND not in ("cuda", "numpy"):
+    print "Gathered BIRTH_COST is available on 'cuda' and 'numpy' backends only."
+    sys.exit(0)
+if (ARGS.metrics or ARGS.lineage) and (BACKEND not in ("cuda", "numpy") or ARGS.hashlife or ARGS.compact):
+    print "Metrics and lineage are available on 'cuda' and 'numpy' backends only, without --hashlife or --compact."
+    sys.exit(0)
+if ARGS.compact and (ARGS.hashlife or ARGS.gather_costs):
+    print "Compact layout can't be combined with --hashlife or --gather-costs."
+    sys.exit(0)
+# extra arguments of `ca_step` and `ca_flush`
+STEP_OPTIONS = {"gather": True} if ARGS.gather_costs else {}
 
 try:
-    expmod = importlib.import_module('experiments2.' + sys.argv[1])
+    if ARGS.experiment is None:
+        raise ImportError
+    expmod = importlib.import_module('experiments2.' + ARGS.experiment)
     DEATH_SPEED = expmod.DEATH_SPEED
     BIRTH_COST = expmod.BIRTH_COST
     MAX_GENES = expmod.MAX_GENES
@@ -66,9 +170,12 @@ try:
     RANDOM_SEED = expmod.RANDOM_SEED
     FADE_IN = expmod.FADE_IN
     FADE_OUT = expmod.FADE_OUT
+    CROSSOVER_RNG = getattr(expmod, "CROSSOVER_RNG", world.PARAM_DEFAULTS["CROSSOVER_RNG"])
     fld_init = expmod.fld_init
-except (ImportError, IndexError):
-    print "No experiment preset found, loading default (big_bang)."
+    PRESET = ARGS.experiment
+except ImportError:
+    if not ARGS.resume:
+        print "No experiment preset found, loading default (big_bang)."
     DEATH_SPEED = 0
     BIRTH_COST = 0
     MAX_GENES = 9
@@ -80,299 +187,289 @@ except (ImportError, IndexError):
     RANDOM_SEED = None
     FADE_IN = 6
     FADE_OUT = 6
+    CROSSOVER_RNG = world.PARAM_DEFAULTS["CROSSOVER_RNG"]
     def fld_init(a):
-        return np.asarray([[(random.choice([0, 1]) * random.randint(0, 256*512) if (i < 100 and j < 100) else 0) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
+        x, y = fields.coords((a.width, a.height))
+        return fields.populate(a.rng, (a.width, a.height), [((x < 100) & (y < 100), fields.any_genome)])
+    PRESET = "default"
 except:
     print traceback.format_exc()
     sys.exit(0)
+
+RESUME = None
+if ARGS.resume:
+    RESUME = checkpoint.load(ARGS.resume)
+    # constants of the resumed run win over the preset's
+    for k in world.PRESET_PARAMS:
+        globals()[k] = RESUME[1].get(k, world.PARAM_DEFAULTS.get(k))
+    PRESET = RESUME[1]["name"]
+elif ARGS.crossover_rng:
+    CROSSOVER_RNG = ARGS.crossover_rng
     
 
-step_gpu = ElementwiseKernel("unsigned int *fld, unsigned int *fld_new, unsigned int *seeds, unsigned int *bufs, unsigned int *img, int w, int h", """
-    int x = i / h;
-    int y = i % h;
-    // torus topology emulation
-    int xm1 = x - 1; if (xm1 < 0) xm1 = w + xm1;
-    int xp1 = x + 1; if (xp1 >= w) xp1 = xp1 - w;
-    int ym1 = y - 1; if (ym1 < 0) ym1 = h + ym1;
-    int yp1 = y + 1; if (yp1 >= h) yp1 = yp1 - h;
-    // cache neighbours values
-    uint f0 = fld[i];
-    uint f1 = fld[xm1 * h + ym1];
-    uint f2 = fld[x * h + ym1];
-    uint f3 = fld[xp1 * h + ym1];
-    uint f4 = fld[xm1 * h + y];
-    uint f5 = fld[xp1 * h + y];
-    uint f6 = fld[xm1 * h + yp1];
-    uint f7 = fld[x * h + yp1];
-    uint f8 = fld[xp1 * h + yp1];
-    uint energy = (f0 >> 17);
-    // total number of neighbours
-    int N = EXISTS(f1) + EXISTS(f2) + EXISTS(f3) + EXISTS(f4) +
-            EXISTS(f5) + EXISTS(f6) + EXISTS(f7) + EXISTS(f8);
-    if (energy >= 0xff || N == 0 || f0 > 0 && (((f0 >> 8) & (1 << N)) == 0)) {
-        // cell is dying
-        fld_new[i] = 0;
-        //img[i] = fadeout(img0, 5);
-    } else {
-        uint f00 = f0;
-        for (int ni = 8; ni > 0; ni--) {
-            // no re-occupation rule, breeding in empty cells only
-            //if (f0 > 0) break;
-            // cache neighbours breeding fitnesses 
-            int ff1 = FIT(f1, ni);
-            int ff2 = FIT(f2, ni);
-            int ff3 = FIT(f3, ni);
-            int ff4 = FIT(f4, ni);
-            int ff5 = FIT(f5, ni);
-            int ff6 = FIT(f6, ni);
-            int ff7 = FIT(f7, ni);
-            int ff8 = FIT(f8, ni);
-            if (ff1 + ff2 + ff3 + ff4 + ff5 + ff6 + ff7 + ff8 == ni) {
-                // neighbours able to breed, cell is born
-                f0 = 0;
-                uint gene_num = 0;
-                //int genes_count = {2};
-                //int gene;
-                uint nit = (int) (ni / 2);
-                uint seed = seeds[i];
-                uint nonzero_genes_num = 0;
-                while (gene_num < 17) {
-                    // pseudorandom cross breeding
-                    uint rng = ((((seed + gene_num) * 58321) + 11113)) % 65535;
-                    uint fg1 = (f1 >> gene_num) & ff1;
-                    uint fg2 = (f2 >> gene_num) & ff2;
-                    uint fg3 = (f3 >> gene_num) & ff3;
-                    uint fg4 = (f4 >> gene_num) & ff4;
-                    uint fg5 = (f5 >> gene_num) & ff5;
-                    uint fg6 = (f6 >> gene_num) & ff6;
-                    uint fg7 = (f7 >> gene_num) & ff7;
-                    uint fg8 = (f8 >> gene_num) & ff8;
-                    int n1 = fg1 + fg2 + fg3 + fg4 + fg5 + fg6 + fg7 + fg8;
-
-                    //if ((int) (n1 * 65535 / ni) < 65535 && (int) (n1 * 65535 / ni) > 0)
-                    //    printf("%d %d | ", rng, (int) (n1 * 65535 / ni));
-                    //if (n1 > nit) {
-                    if ((int) (n1 * 65535 / ni) > rng) {
-                        f0 += 1 << gene_num;
-                        nonzero_genes_num += 1;
-                        if ({1}) {
-                            if (fg1) atomicAdd(&bufs[xm1 * h + ym1], ({1} << 17));
-                            if (fg2) atomicAdd(&bufs[x * h + ym1], ({1} << 17));
-                            if (fg3) atomicAdd(&bufs[xp1 * h + ym1], ({1} << 17));
-                            if (fg4) atomicAdd(&bufs[xm1 * h + y], ({1} << 17));
-                            if (fg5) atomicAdd(&bufs[xp1 * h + y], ({1} << 17));
-                            if (fg6) atomicAdd(&bufs[xm1 * h + yp1], ({1} << 17));
-                            if (fg7) atomicAdd(&bufs[x * h + yp1], ({1} << 17));
-                            if (fg8) atomicAdd(&bufs[xp1 * h + yp1], ({1} << 17));
-                        }
-                    }
-                    gene_num++;
-                }
-                if (nonzero_genes_num > {2}) f0 = 0;
-                seeds[i] = (((seed * 58321) + 11113)) % 65535;
-                //if (f0 != 3076 && f0 != 31820) printf("%d ", f0);
-                break;
-            }
-        }
-        if ((f00 & 0x1ffff) == (f0 & 0x1ffff)) {
-            f0 = f00;
-            if (f0 != 0) {
-                f0 += ({0} << 17);
-            }
-        }
-        fld_new[i] = f0;
-
-    }
-""".replace("{0}", str(DEATH_SPEED)).replace("{1}", str(BIRTH_COST)).replace("{2}", str(MAX_GENES)), "ca_step", preamble="""
-#include <stdio.h>
-#define EXISTS(x) (x > 0 ? 1 : 0)
-//#define FIT(x, n) ((n == 0 || (x & (1 << (n - 1))) == 0) ? 0 : 1)
-#define FIT(x, n) ((x >> (n - 1)) & 1)
-
-__device__ uint fadeout(int val, int step) {
-    uint red   = (val & 0x00ff0000) >> 16;
-    if (red > step-1) red -= step; else red = 0;
-    uint green = (val & 0x0000ff00) >> 8;
-    if (green > step-1) green -= step; else green = 0;
-    uint blue  = (val & 0x000000ff);
-    if (blue > step-1) blue -= step; else blue = 0;
-    return blue + (green << 8) + (red << 16);
-}
-
-""")
-
-flush_bufs_gpu = ElementwiseKernel("unsigned int *fld_new, unsigned int *bufs, unsigned int *img, int w, int h", """
-    uint f0 = fld_new[i];
-    f0 += bufs[i];
-    uint energy = (f0 >> 17);
-    if (energy > 0xff) {
-        energy = 0xff;
-        f0 = 0;
-    }
-    fld_new[i] = f0;
-    bufs[i] = 0;
-    uint img0 = img[i];
-    uint tc = hsv2rgb((f0 & 0x1ffff) % 360, 0xff - energy, 255);
-    if (f0 == 0) tc = 0;
-    int tr = (tc >> 16) & 0xff;
-    int tg = (tc >> 8) & 0xff;
-    int tb = tc & 0xff;
-    int cr = (img0 >> 16) & 0xff;
-    int cg = (img0 >> 8) & 0xff;
-    int cb = img0 & 0xff;
-    cr = max(min(tr, cr + FADE_IN), cr - FADE_OUT);
-    cg = max(min(tg, cg + FADE_IN), cg - FADE_OUT);
-    cb = max(min(tb, cb + FADE_IN), cb - FADE_OUT);
-    img[i] = ((uint) cr << 16) + ((uint) cg << 8) + (uint) cb;
-""", "ca_flush", preamble="""
-#include <stdio.h>
-
-#define FADE_IN {fade_in}
-#define FADE_OUT {fade_out}
-
-__device__ uint hsv2rgb(int hue, int sat, int val) {
-	float r, g, b;
-	float h, s, v;
-	
-	h = hue;
-	s = fmin(255, (float) sat);
-        s /= 255;
-	v = fmin(255, (float) val);
-	
-	float f = ((float) h) / 60.0f;
-	float hi = floorf(f);
-	f = f - hi;
-	int p = (int) (v * (1 - s));
-	int q = (int) (v * (1 - s * f));
-	int t = (int) (v * (1 - s * (1 - f)));
-	
-	if(hi == 0.0f || hi == 6.0f) {
-		r = v; g = t; b = p;
-	} else if (hi == 1.0f) {
-		r = q; g = v; b = p;
-	} else if (hi == 2.0f) {
-		r = p; g = v; b = t;
-	} else if (hi == 3.0f) {
-		r = p; g = q; b = v;
-	} else if (hi == 4.0f) {
-		r = t; g = p; b = v;
-	} else {
-		r = v; g = p; b = q;
-	}
-	
-	unsigned int color = b + g * 256 + r * 256 * 256;
-	return color;
-}
-""".replace("{fade_in}", str(FADE_IN)).replace("{fade_out}", str(FADE_OUT)))
+if BACKEND == "numpy":
+    backend = cpu
+elif BACKEND == "tiled":
+    backend = tiled.TiledBackend(int(os.environ.get("EVOLIFE_WORKERS", 0)))
+elif BACKEND == "active":
+    backend = active.ActiveBackend()
+else:
+    backend = cuda
 
 
 class EvoLife:
 
-    def __init__(self, width=0, height=0, fullscreen=False, saveframes=False, downscale_factor=1, frame_skip=1):
-        print "Initializing PyGame...",
-        pygame.init()
+    def __init__(self, width=0, height=0, fullscreen=False, saveframes=False, downscale_factor=1, frame_skip=1, display=True):
         self.title = 'EvoLife Cellular Automaton /w CUDA'
+        self.display = display
         self.saveframes = saveframes
         self.downscale_factor = downscale_factor
-        self.movie_frame = 0
-        pygame.display.set_caption(self.title, 'CUDA Life')
-        modes = pygame.display.list_modes()
-        modes.sort()
-        modes.reverse()
-        self.width = width if width else modes[0][0]
-        self.height = height if height else modes[0][1]
+        self.width = width
+        self.height = height
         self.frame_skip = frame_skip
+        if display:
+            global pygame
+            import pygame
+            print "Initializing PyGame...",
+            pygame.init()
+            pygame.display.set_caption(self.title, 'CUDA Life')
+            modes = pygame.display.list_modes()
+            modes.sort()
+            modes.reverse()
+            self.width = width if width else modes[0][0]
+            self.height = height if height else modes[0][1]
+            print "done."
+        elif not (width and height):
+            raise ValueError("Field size must be set explicitly in headless mode.")
+        print "Initializing %s backend..." % BACKEND,
+        self.rng = fields.make_rng(RANDOM_SEED)
+        if RESUME:
+            fld, seeds, bufs, img = [RESUME[0].get(name) for name in checkpoint.STATE]
+            self.rng_key = RESUME[1].get("rng_key")
+        else:
+            seeds, self.rng_key = world.crossover_state(self.rng, (self.width, self.height), CROSSOVER_RNG)
+            bufs = np.zeros((self.width, self.height), dtype=np.int32)
+            if RANDOM_SEED:
+                fields.sync_random(self.rng)
+                key = "%s_%s_%sx%s" % (PRESET, RANDOM_SEED, self.width, self.height)
+                if CROSSOVER_RNG != "lcg":
+                    # presets draw from a different random stream without seeds
+                    key += "_" + CROSSOVER_RNG
+                fld = fields.cached(key, lambda: fld_init(self), source=fld_init)
+            else:
+                fld = fld_init(self)
+            img = np.zeros(fld.shape, dtype=np.int32)
+        # backends copy on upload, the host field is never duplicated
+        self.f1_gpu = backend.to_device(fld)
+        self.f2_gpu = backend.to_device(fld)
+        self.seeds_gpu = None if seeds is None else backend.to_device(seeds)
+        self.bufs_gpu = backend.to_device(bufs)
+        self.img_gpu = backend.to_device(img)
         print "done."
-        print "Initializing GPU stuff...",
-        if RANDOM_SEED:
-            random.seed(RANDOM_SEED)
-        seeds = np.asarray([[random.randint(1, 50000) for j in range(self.height)] for i in range(self.width)]).astype(np.int32)
-        bufs = np.zeros((self.width, self.height), dtype=np.int32)
-        fld = fld_init(self)
-        self.f1_gpu = gpuarray.to_gpu(fld)
-        self.f2_gpu = gpuarray.to_gpu(fld.copy())
-        self.seeds_gpu = gpuarray.to_gpu(seeds)
-        self.bufs_gpu = gpuarray.to_gpu(bufs)
-        self.img_gpu = gpuarray.to_gpu(np.asarray([[0 for v in row] for row in fld]).astype(np.int32))
-        print "done."
-        print "Initializing display...",
-        self.srf = pygame.display.set_mode((self.width / self.downscale_factor, self.height / self.downscale_factor))
-        if fullscreen:
-            pygame.display.toggle_fullscreen()
-        print "done: %sx%s." % (self.width / self.downscale_factor, self.height / self.downscale_factor)
-        self.t = 0
+        if display:
+            print "Initializing display...",
+            self.srf = pygame.display.set_mode((self.width / self.downscale_factor, self.height / self.downscale_factor))
+            if fullscreen:
+                pygame.display.toggle_fullscreen()
+            print "done: %sx%s." % (self.width / self.downscale_factor, self.height / self.downscale_factor)
+            # movie needs every frame, otherwise late frames are dropped
+            self.screen = (self.width / self.downscale_factor, self.height / self.downscale_factor)
+            self.frames = frames.FramePipeline(backend, self.screen + (3,), np.uint8, drop=not saveframes)
+            self.movie = None
+            if saveframes and ARGS.movie_encoder:
+                self.movie = movie.PipeWriter(ARGS.movie_encoder, self.screen)
+            elif saveframes:
+                self.movie = movie.PNGWriter("movie")
+        self.t = RESUME[2] if RESUME else 0
         self.zoom = 1
         self.dx = 0
         self.dy = 0
         self.last_checked = time.time()
         self.last_t = 0
+        self.recorder = None
+        self.metrics = metrics.MetricsStream(backend, ARGS.metrics) if ARGS.metrics else None
+        self.lineage = None
+        if ARGS.lineage:
+            self.lineage = lineage.LineageTracker(backend)
+            self.lineage.drain(self.t, self.f1_gpu, self.width, self.height)
+        self.index = None
+        self.jump_rank = 0
+        self.checkpoint_t = None
+        self.checkpoint_due = False
+        self.stopped = False
 
     def genome2str(self, g):
-        f = ""
-        for i in xrange(8):
-            if ((1 << i) & g) != 0:
-                f += str(i+1)
-        f += "/"
-        g = g >> 8
-        for i in xrange(9):
-            if ((1 << i) & g) != 0:
-                f += str(i)
-        return f
+        return genome.genome2str(g)
 
     def str2genome(self, s):
-        g = 0
-        b, s = s.split("/")
-        for i in b:
-            g += (1 << (int(i)-1))
-        for i in s:
-            g += (1 << (int(i)+8))
-        return g
+        return genome.str2genome(s)
 
     def species_chart(self):
-        world = self.f1_gpu.get()
-        species = np.unique(world & 0x1ffff, return_counts=True)
-        species = zip(species[1][1:], species[0][1:])
-        species.sort()
-        species.reverse()
-        print "SN=%s |" % len(species),
-        for s in species[:10]:
-            print "%s (%s) |" % (self.genome2str(s[1]), s[0]),
+        genomes, counts = census.species(backend.census(self.f1_gpu, self.width, self.height))
+        print "SN=%s |" % len(genomes),
+        for s, c in zip(genome.genomes2strs(genomes[:10]), counts[:10]):
+            print "%s (%s) |" % (s, c),
         print
 
         
-    def step(self):
-        start_time = time.time()
-        step_gpu(self.f1_gpu, self.f2_gpu, self.seeds_gpu, self.bufs_gpu, self.img_gpu, np.uint32(self.width), np.uint32(self.height))
-        flush_bufs_gpu(self.f2_gpu, self.bufs_gpu, self.img_gpu, np.uint32(self.width), np.uint32(self.height))
-        tmp = self.f1_gpu
-        self.f1_gpu = self.f2_gpu
-        self.f2_gpu = tmp
-        self.t += 1
-        self.last_t += 1
-        if self.t % self.frame_skip == 0:
-            dest = self.img_gpu.get()
-            dest = np.reshape(dest, (self.width, self.height), order='F')
-            if self.dx:
-                dest = np.roll(dest, self.dx, axis=1)
-            if self.dy:
-                dest = np.roll(dest, self.dy, axis=0)
-            if self.zoom > 1:
-                dest = dest[:self.width // self.zoom + 1, :self.height // self.zoom + 1]
-                dest = dest.repeat(self.zoom, axis=0).repeat(self.zoom, axis=1)
-                dest = dest[:self.width, :self.height]
-            if self.downscale_factor != 1:
-                dest = dest.view(np.uint8).reshape(dest.shape+(4,))[..., :3]
-                dest = (tf.resize(dest, (self.width / self.downscale_factor, self.height / self.downscale_factor, 3), order=1) * 255).astype(np.int32)
-                tmp = dest[:,:,0].copy()
-                dest[:,:,0] = dest[:,:,2]
-                dest[:,:,2] = tmp
-            if self.saveframes:
-                pygame.image.save(self.srf, "movie/frame%s.png" % str(self.movie_frame).zfill(8))
-                self.movie_frame += 1
+    def step(self, n=1):
+        w, h = self.width, self.height
+        f1, f2 = self.f1_gpu, self.f2_gpu
+        for i in xrange(n):
+            t = self.t + i + 1
+            flush_options = step_options = STEP_OPTIONS
+            if self.metrics:
+                flush_options = step_options = dict(STEP_OPTIONS, stats=self.metrics.slot(t))
+            if self.lineage:
+                step_options = dict(step_options, lineage=self.lineage.table(t))
+            if self.rng_key is not None:
+                step_options = dict(step_options, rng=(self.rng_key, t))
+            backend.ca_step(f1, f2, self.seeds_gpu, self.bufs_gpu, self.img_gpu, w, h, DEATH_SPEED, BIRTH_COST, MAX_GENES,
+                            **step_options)
+            backend.ca_flush(f2, self.bufs_gpu, self.img_gpu, w, h, FADE_IN, FADE_OUT, **flush_options)
+            f1, f2 = f2, f1
+            if self.lineage and self.lineage.due(t):
+                self.lineage.drain(t, f1, w, h)
+        self.f1_gpu, self.f2_gpu = f1, f2
+        self.t += n
+        self.last_t += n
+
+    def leap(self, n):
+        """
+        Same as `step`, but with Hashlife jumps where possible, NumPy backend only.
+
+        """
+        if DEATH_SPEED or BIRTH_COST:
+            return self.step(n)
+        rng = None if self.rng_key is None else (self.rng_key, self.t)
+        fld, seeds = hashlife.advance_arrays(self.f1_gpu, self.seeds_gpu, n, MAX_GENES, rng)
+        self.f1_gpu, self.f2_gpu, self.seeds_gpu = fld, fld.copy(), seeds
+        self.t += n
+        self.last_t += n
+
+    def step_compact(self, n):
+        """
+        Same as `step`, on the compact field layout, NumPy backend only.
+        Host arrays are dropped while stepping and rebuilt after it.
+
+        """
+        field = compact.CompactField(self.f1_gpu, self.seeds_gpu)
+        self.f1_gpu = self.f2_gpu = None
+        for i in xrange(n):
+            rng = None if self.rng_key is None else (self.rng_key, self.t + i + 1)
+            field.step(DEATH_SPEED, BIRTH_COST, MAX_GENES, rng)
+        self.f1_gpu = field.to_fld()
+        self.f2_gpu = self.f1_gpu.copy()
+        if field.seeds is not None:
+            self.seeds_gpu[...] = field.seeds
+        self.t += n
+        self.last_t += n
+
+    def start_recording(self, path, every):
+        """
+        Stream snapshots of the field to `path`, every `every` steps.
+
+        """
+        params = dict(preset=PRESET, DEATH_SPEED=DEATH_SPEED, BIRTH_COST=BIRTH_COST, MAX_GENES=MAX_GENES,
+                      RANDOM_SEED=RANDOM_SEED)
+        self.recorder = recorder.Recorder(path, self.width, self.height, params)
+        self.record_every = every
+        self.record()
+
+    def record(self):
+        if self.recorder and self.t % self.record_every == 0:
+            self.recorder.record(self.t, backend.from_device(self.f1_gpu))
+
+    def stop_recording(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def save_lineage(self, path):
+        """
+        Merge events counted since the last drain and save the genealogy.
+
+        """
+        self.lineage.drain(self.t, self.f1_gpu, self.width, self.height)
+        self.lineage.genealogies[0].save(path)
+        print "Genealogy of %s genomes saved to %s." % (len(self.lineage.genealogies[0].genomes), path),
+        if self.lineage.dropped:
+            print "%s events dropped on a full table." % self.lineage.dropped,
+        print
+
+    def spatial_index(self):
+        """
+        Species spatial index of the field, rebuilt once `--index-every` steps old.
+
+        """
+        if self.index is None or self.t - self.index.t >= ARGS.index_every:
+            self.index = spatial.SpatialIndex(backend.from_device(self.f1_gpu), self.t)
+        return self.index
+
+    def jump_to_species(self):
+        """
+        Center the view where the next most abundant species is densest.
+
+        """
+        index = self.spatial_index()
+        genomes, counts = index.species_in((0, 0, self.width, self.height))
+        if not len(genomes):
+            return
+        g = genomes[self.jump_rank % min(len(genomes), 10)]
+        self.jump_rank += 1
+        cx, cy = index.densest(g)
+        self.dy = self.width // (2 * self.zoom) - cx
+        self.dx = self.height // (2 * self.zoom) - cy
+        print "Step %s: %s (%s cells) around %s, %s, bounding box %s." % (
+            index.t, self.genome2str(g), counts[genomes == g][0], cx, cy, index.bbox(g))
+
+    def save_checkpoint(self, path):
+        """
+        Write complete state to `path`, see `evolib.checkpoint`.
+
+        """
+        params = dict((k, globals()[k]) for k in world.PRESET_PARAMS)
+        params.update(name=PRESET, FIELD_WIDTH=self.width, FIELD_HEIGHT=self.height, rng_key=self.rng_key)
+        arrays = {"fld": self.f1_gpu, "seeds": self.seeds_gpu, "bufs": self.bufs_gpu, "img": self.img_gpu}
+        arrays = dict((k, backend.from_device(v)) for k, v in arrays.items() if v is not None)
+        checkpoint.save(path, arrays, params, self.t)
+        self.checkpoint_t = self.t
+        print "Step %s: checkpoint saved to %s." % (self.t, path)
+
+    def check_checkpoint(self):
+        """
+        Save a checkpoint if one is due, on schedule or on signal.
+
+        """
+        every = ARGS.checkpoint_every
+        if ARGS.checkpoint and (self.checkpoint_due or every and self.t % every == 0):
+            self.save_checkpoint(ARGS.checkpoint)
+            self.checkpoint_due = False
+
+    def on_signal(self, signum, frame):
+        self.checkpoint_due = True
+        if signum == signal.SIGTERM:
+            self.stopped = True
+
+    def draw(self):
+        """
+        Start the next frame, it's shown by `show` once copied to host.
+        Pan, zoom and downscale are done by backend, on screen pixels only.
+
+        """
+        view = backend.viewport(self.img_gpu, self.width, self.height, self.screen,
+                                (self.dy, self.dx), self.zoom, self.downscale_factor)
+        self.frames.submit(view)
+
+    def show(self):
+        for dest in self.frames.poll():
+            if self.movie:
+                # the frame itself, not the surface still holding the previous one
+                self.movie.write(dest)
             pygame.surfarray.blit_array(self.srf, dest)
             pygame.display.update()
-        if self.t % 100 == 0:
-            self.species_chart()
+
+    def update_title(self):
         end_time = time.time()
         if end_time - self.last_checked > 1:
             elapsed_time = end_time - self.last_checked
@@ -380,40 +477,102 @@ class EvoLife:
             self.last_checked = time.time()
             self.last_t = 0
 
-    def run(self):
-        while True:
+    def run(self, steps=0, chart_every=100):
+        while (not steps or self.t < steps) and not self.stopped:
             self.step()
+            self.record()
+            self.check_checkpoint()
+            if self.t % self.frame_skip == 0:
+                self.draw()
+            self.show()
+            if chart_every and self.t % chart_every == 0:
+                self.species_chart()
+            self.update_title()
             events = pygame.event.get()
             need_exit = False
             for e in events:
-                if e.type==QUIT or e.type==KEYDOWN and e.key==K_ESCAPE or e.type==KEYDOWN and e.key==K_q:
+                if e.type==pygame.QUIT or e.type==pygame.KEYDOWN and e.key==pygame.K_ESCAPE or e.type==pygame.KEYDOWN and e.key==pygame.K_q:
                     need_exit = True
                     break
-                if e.type==KEYDOWN:
-                    if e.key==K_KP_PLUS or e.key==K_EQUALS:
+                if e.type==pygame.KEYDOWN:
+                    if e.key==pygame.K_KP_PLUS or e.key==pygame.K_EQUALS:
                         self.zoom *= 2
-                    if e.key==K_MINUS or e.key==K_KP_MINUS:
+                    if e.key==pygame.K_MINUS or e.key==pygame.K_KP_MINUS:
                         self.zoom = max(1, self.zoom / 2)
-                    if e.key==K_RIGHTBRACKET:
+                    if e.key==pygame.K_RIGHTBRACKET:
                         self.frame_skip += 5
-                    if e.key==K_LEFTBRACKET:
+                    if e.key==pygame.K_LEFTBRACKET:
                         self.frame_skip = max(1, self.frame_skip - 5)
-                    if e.key==K_UP:
+                    if e.key==pygame.K_UP:
                         self.dx += 10
-                    if e.key==K_DOWN:
+                    if e.key==pygame.K_DOWN:
                         self.dx -= 10
-                    if e.key==K_LEFT:
+                    if e.key==pygame.K_LEFT:
                         self.dy += 10
-                    if e.key==K_RIGHT:
+                    if e.key==pygame.K_RIGHT:
                         self.dy -= 10
-                    if e.key==K_f:
+                    if e.key==pygame.K_f:
                         pygame.display.toggle_fullscreen()
-                    if e.key==K_s:
-                        np.save("fields/field.npy", self.f1_gpu.get())
+                    if e.key==pygame.K_g:
+                        self.jump_to_species()
+                    if e.key==pygame.K_s:
+                        np.save("fields/field.npy", backend.from_device(self.f1_gpu))
             if need_exit:
                 break
+        self.frames.close()
+        self.show()
+        if self.movie:
+            self.movie.close()
+
+    def run_headless(self, steps=0, chart_every=100):
+        """
+        Simulation only loop, field is pulled from device just for charts.
+
+        """
+        while (not steps or self.t < steps) and not self.stopped:
+            n = chart_every - self.t % chart_every if chart_every else 1000
+            if steps:
+                n = min(n, steps - self.t)
+            if self.recorder:
+                n = min(n, self.record_every - self.t % self.record_every)
+            if ARGS.checkpoint_every:
+                n = min(n, ARGS.checkpoint_every - self.t % ARGS.checkpoint_every)
+            if ARGS.hashlife:
+                self.leap(n)
+            elif ARGS.compact:
+                self.step_compact(n)
+            else:
+                self.step(n)
+            self.record()
+            self.check_checkpoint()
+            if chart_every and self.t % chart_every == 0:
+                elapsed_time = time.time() - self.last_checked
+                print "Step %s: %.2f steps/s" % (self.t, float(self.last_t) / elapsed_time),
+                if ARGS.hashlife and not (DEATH_SPEED or BIRTH_COST):
+                    print "(%s)" % hashlife.field_pacer(self.width, self.height, MAX_GENES).summary(),
+                print
+                self.last_checked = time.time()
+                self.last_t = 0
+                self.species_chart()
 
 if __name__ == '__main__':
-    ca = EvoLife(FIELD_WIDTH, FIELD_HEIGHT, saveframes=SAVE_FRAMES, downscale_factor=DOWNSCALE_FACTOR, frame_skip=FRAME_SKIP)
-    ca.run()
+    ca = EvoLife(FIELD_WIDTH, FIELD_HEIGHT, saveframes=SAVE_FRAMES or bool(ARGS.movie_encoder), downscale_factor=DOWNSCALE_FACTOR, frame_skip=FRAME_SKIP, display=not ARGS.no_display)
+    if ARGS.record:
+        ca.start_recording(ARGS.record, ARGS.record_every)
+    if ARGS.checkpoint:
+        signal.signal(signal.SIGUSR1, ca.on_signal)
+        signal.signal(signal.SIGTERM, ca.on_signal)
+    try:
+        if ARGS.no_display:
+            ca.run_headless(ARGS.steps, ARGS.chart_every)
+        else:
+            ca.run(ARGS.steps, ARGS.chart_every)
+        if ARGS.checkpoint and ca.checkpoint_t != ca.t:
+            ca.save_checkpoint(ARGS.checkpoint)
+    finally:
+        ca.stop_recording()
+        if ca.metrics:
+            ca.metrics.close()
+        if ca.lineage:
+            ca.save_lineage(ARGS.lineage)
     
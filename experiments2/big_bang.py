@@ -6,8 +6,7 @@ stabilizing in a map-like design.
 
 """
 
-import numpy as np
-import random
+from evolib import fields
 
 DEATH_SPEED = 0
 BIRTH_COST = 0
@@ -23,4 +22,5 @@ RANDOM_SEED = None
 
 
 def fld_init(a):
-    return np.asarray([[(random.choice([0, 1]) * random.randint(0, 256*512) if (i < 100 and j < 100) else 0) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
+    x, y = fields.coords((a.width, a.height))
+    return fields.populate(a.rng, (a.width, a.height), [((x < 100) & (y < 100), fields.any_genome)])
@@ -4,8 +4,7 @@ Very complex behaviour. Produces stable ecosystem of many species.
 
 """
 
-import numpy as np
-import random
+from evolib import fields
 
 DEATH_SPEED = 23
 BIRTH_COST = 0
@@ -20,8 +19,5 @@ FADE_IN = 1
 FADE_OUT = 1
 
 def fld_init(a):
-    fld = np.zeros((a.width, a.height), dtype=np.int32)
-    sample = np.load("./fields/bliamba_seed.npy")
-    w, h = sample.shape
-    fld[:w,:h] = sample
-    return fld
+    # seed is memory-mapped, placed in the corner of an empty field
+    return fields.seeded((a.width, a.height), "./fields/bliamba_seed.npy")
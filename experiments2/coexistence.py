@@ -5,8 +5,8 @@ TODO: pick up good rules. This one doesn't work well with new version.
 
 """
 
-import numpy as np
 import random
+from evolib import fields
 
 DEATH_SPEED = 0
 BIRTH_COST = 15
@@ -33,6 +33,6 @@ def fld_init(a):
     #species = map(a.str2genome, ["347/23456", "3/23", "3/234"])
     #return np.asarray([[random.choice([0, 1]) * (a.str2genome("347/23456") if i < 100 and j < 100 else a.str2genome("3/23")) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
     species = map(a.str2genome, ["35678/5678", "35678/678", "23567/5678", "3567/35678", "35678/5678",  "35678/678", "35678/678"])
-    return np.asarray([[random.choice([0, 1]) * random.choice(species) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
+    return fields.populate(a.rng, (a.width, a.height), [(None, species)])
     #return np.asarray([[random.choice([0, 1]) * random.choice(species) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
     #return np.asarray([[random.choice([0, 1]) * a.str2genome(rnd_genome(3)) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
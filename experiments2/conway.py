@@ -3,8 +3,7 @@ Original Conway rules. Just to prove it works.
 
 """
 
-import numpy as np
-import random
+from evolib import fields
 
 DEATH_SPEED = 0
 BIRTH_COST = 0
@@ -20,4 +19,5 @@ FADE_OUT = 6
 
 def fld_init(a):
     conway = a.str2genome("3/23")
-    return np.asarray([[(random.choice([0, 1]) * conway) if (i > 400 and i < 800 and j > 300 and j < 500) else 0 for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
+    x, y = fields.coords((a.width, a.height))
+    return fields.populate(a.rng, (a.width, a.height), [((x > 400) & (x < 800) & (y > 300) & (y < 500), [conway])])
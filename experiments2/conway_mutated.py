@@ -5,8 +5,7 @@ DESCRIBE ME, or at least pick up better params for new engine.
 
 """
 
-import numpy as np
-import random
+from evolib import fields
 
 DEATH_SPEED = 1
 BIRTH_COST = 3
@@ -23,5 +22,5 @@ FADE_OUT = 6
 def fld_init(a):
     conway = a.str2genome("3/23")
     #return np.asarray([[random.choice([0, 1]) * (conway | (1 << random.randint(0, 17))) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
-    return np.asarray([[random.choice([0, 1]) * (conway ^ (1 << random.randint(0, 17))) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
+    return fields.populate(a.rng, (a.width, a.height), [(None, lambda u: conway ^ (1 << fields.randint(u, 0, 17)))])
     #return np.asarray([[(random.choice([0, 1]) * conway) if (i > 400 and i < 800 and j > 300 and j < 500) else 0 for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
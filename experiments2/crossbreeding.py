@@ -8,8 +8,7 @@ as well as other interesting artefacts.
 
 """
 
-import numpy as np
-import random
+from evolib import fields
 
 DEATH_SPEED = 23
 BIRTH_COST = 0
@@ -24,14 +23,12 @@ FADE_IN = 6
 FADE_OUT = 6
 
 
-def coords2seed(x, y, conway, diamoeba):
-    if (500 < x < 700 and 350 < y < 450):
-        return random.choice([0, 1]) * diamoeba
-    if (400 < x < 800 and 300 < y < 500):
-        return random.choice([0, 1]) * random.choice([conway, diamoeba])
-    return random.choice([0, 1]) * conway
-
 def fld_init(a):
     conway = a.str2genome("3/23")
     diamoeba = a.str2genome("35678/5678")
-    return np.asarray([[coords2seed(i, j, conway, diamoeba) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
+    x, y = fields.coords((a.width, a.height))
+    center = (500 < x) & (x < 700) & (350 < y) & (y < 450)
+    middle = (400 < x) & (x < 800) & (300 < y) & (y < 500)
+    return fields.populate(a.rng, (a.width, a.height), [(center, [diamoeba]),
+                                                        (middle, [conway, diamoeba]),
+                                                        (None, [conway])])
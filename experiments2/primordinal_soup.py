@@ -5,8 +5,7 @@ DESCRIBE ME!
 
 """
 
-import numpy as np
-import random
+from evolib import fields
 
 DEATH_SPEED = 23
 BIRTH_COST = 0
@@ -23,4 +22,4 @@ FADE_OUT = 6
 def fld_init(a):
     #d = a.str2genome("3/23")
     #return np.asarray([[(random.choice([0, 1]) * d) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
-    return np.asarray([[(random.choice([0, 1]) * random.randint(0, 256*512)) for j in range(a.height)] for i in range(a.width)]).astype(np.int32)
+    return fields.populate(a.rng, (a.width, a.height), [(None, fields.any_genome)])
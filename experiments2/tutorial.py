@@ -5,7 +5,6 @@ Python / NumPy experience is mandatory.
 """
 
 import numpy as np
-import random
 
 # 1. Declare main CA constants.
 
@@ -107,6 +106,12 @@ def fld_init(a):
     # Dont't forget to return our board
     return fld
 
+# For random boards, don't loop over cells with `random` module, it takes minutes on large fields.
+# Use `evolib.fields` helpers with `a.rng` instead, in example half-filled Conway soup in a corner:
+#     x, y = fields.coords((a.width, a.height))
+#     fields.populate(a.rng, (a.width, a.height), [((x < 100) & (y < 100), [conway])])
+# With RANDOM_SEED set, generated boards are also cached in `fields/cache` folder.
+
 # That's all, now you can create a copy of this file in the same folder, and roll your own masterpiece.
 # Feel free to share your findings, pull requests on experiments are welcome.
 
@@ -0,0 +1,69 @@
+"""
+Fields shared by the tests: random soups and stepped snapshots of them,
+and the scalar reference kernel.
+
+"""
+
+import os, sys
+
+import numpy as np
+import pytest
+
+from evolib import cpu
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import reference as reference_kernel
+
+
+def make_soup(w, h, genomes=12, density=0.5, energy=True, bands=False, seed=1):
+    """
+    (fld, seeds) of `genomes` (random ones if a number) at `density`,
+    with random energy unless `energy` is false. With `bands`, each genome
+    lives in its own band along x, bands apart by w / (2 * len(genomes)).
+
+    """
+    rng = np.random.RandomState(seed)
+    if isinstance(genomes, int):
+        genomes = rng.randint(1, 1 << 17, genomes)
+    genomes = np.asarray(genomes)
+    if bands:
+        band = np.arange(w) * 2 * len(genomes) // w
+        species = np.where(band % 2 == 0, genomes[band // 2], 0)[:, None]
+    else:
+        species = genomes[rng.randint(0, len(genomes), (w, h))]
+    fld = np.where(rng.random_sample((w, h)) < density, species, 0)
+    if energy:
+        fld = fld | rng.randint(0, 0x100, (w, h)) * (fld != 0) << 17
+    seeds = rng.randint(1, 50000, (w, h)).astype(np.int32)
+    return fld.astype(np.uint32).view(np.int32), seeds
+
+
+def make_snapshots(w, h, steps, params=(1, 3, 14), seed=1):
+    """
+    Copies of a 20 genomes soup before each of `steps` cpu steps.
+
+    """
+    fld, seeds = make_soup(w, h, 20, 0.4, seed=seed)
+    bufs, img, new = np.zeros_like(fld), np.zeros_like(fld), np.zeros_like(fld)
+    res = []
+    for t in range(steps):
+        res.append(fld.copy())
+        cpu.ca_step(fld, new, seeds, bufs, img, w, h, *params)
+        cpu.ca_flush(new, bufs, img, w, h, 6, 6)
+        fld, new = new, fld
+    return res
+
+
+@pytest.fixture
+def soup():
+    return make_soup
+
+
+@pytest.fixture
+def snapshots():
+    return make_snapshots
+
+
+@pytest.fixture
+def reference():
+    return reference_kernel
@@ -0,0 +1,85 @@
+"""
+Scalar reference of the CUDA kernels, a cell at a time in plain Python,
+for checking vectorized backends on small fields.
+
+"""
+
+import numpy as np
+
+U32 = 0xffffffff
+# neighbours in kernel's order, f1..f8
+NEIGHBOURS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+
+def mix32(x):
+    x ^= x >> 16
+    x = (x * 0x85ebca6b) & U32
+    x ^= x >> 13
+    x = (x * 0xc2b2ae35) & U32
+    return x ^ (x >> 16)
+
+
+def ca_step(fld, seeds, bufs, death_speed, birth_cost, max_genes, rng=None):
+    """
+    One step of (w, h) `fld`, return the new field. `seeds` and `bufs`
+    are updated in place, `rng` is (key, step) of the counter-based RNG.
+
+    """
+    w, h = fld.shape
+    f = fld.view(np.uint32)
+    res = np.zeros_like(f)
+    b = bufs.view(np.uint32)
+    s = None if seeds is None else seeds.view(np.uint32)
+    for x in range(w):
+        for y in range(h):
+            f0 = int(f[x, y])
+            cells = [((x + dx) % w, (y + dy) % h) for dx, dy in NEIGHBOURS]
+            fs = [int(f[c]) for c in cells]
+            n = sum(1 for v in fs if v)
+            if f0 >> 17 >= 0xff or n == 0 or f0 and not (f0 >> 8) & (1 << n):
+                continue
+            f00 = f0
+            for ni in range(8, 0, -1):
+                fits = [(v >> (ni - 1)) & 1 for v in fs]
+                if sum(fits) != ni:
+                    continue
+                f0, genes = 0, 0
+                if rng is None:
+                    seed = int(s[x, y])
+                else:
+                    seed = mix32(mix32(mix32(rng[1] & U32) ^ (rng[0] & U32)) ^ (x * h + y))
+                for gene in range(17):
+                    if rng is None:
+                        r = (((seed + gene) * 58321 + 11113) & U32) % 65535
+                    else:
+                        r = mix32((seed + gene * 0x9e3779b9) & U32) % 65535
+                    fgs = [(v >> gene) & fit for v, fit in zip(fs, fits)]
+                    if sum(fgs) * 65535 // ni > r:
+                        f0 |= 1 << gene
+                        genes += 1
+                        for c, fg in zip(cells, fgs):
+                            if fg and birth_cost:
+                                b[c] = (int(b[c]) + (birth_cost << 17)) & U32
+                if genes > max_genes:
+                    f0 = 0
+                if rng is None:
+                    s[x, y] = ((seed * 58321 + 11113) & U32) % 65535
+                break
+            if f00 & 0x1ffff == f0 & 0x1ffff:
+                f0 = f00
+                if f0:
+                    f0 = (f0 + (death_speed << 17)) & U32
+            res[x, y] = f0
+    return res.view(np.int32)
+
+
+def ca_flush(fld, bufs):
+    """
+    Apply `bufs` to `fld` and kill exhausted cells, in place, without `img`.
+
+    """
+    f = fld.view(np.uint32)
+    b = bufs.view(np.uint32)
+    f[...] = (f.astype(np.uint64) + b) & U32
+    f[f >> 17 > 0xff] = 0
+    b[...] = 0
@@ -0,0 +1,56 @@
+import pytest
+
+from evolib import cpu, world, tiled, active, batch
+
+PRESETS = ["bliamba", "coexistence", "conway_mutated"]
+
+
+def make_world(name, backend=cpu, rng="lcg", seed=3, **overrides):
+    preset = world.load_preset(name, FIELD_WIDTH=64, FIELD_HEIGHT=48, RANDOM_SEED=seed, CROSSOVER_RNG=rng,
+                               **overrides)
+    return world.World(preset, backend)
+
+
+def assert_same(a, b):
+    assert (a.field() == b.field()).all()
+    if a.seeds is not None:
+        assert (a.backend.from_device(a.seeds) == b.backend.from_device(b.seeds)).all()
+
+
+@pytest.mark.parametrize("name", PRESETS)
+@pytest.mark.parametrize("rng", ["lcg", "counter"])
+def test_tiled_matches_cpu(name, rng):
+    backend = tiled.TiledBackend(3)
+    try:
+        ref, res = make_world(name, rng=rng), make_world(name, backend, rng=rng)
+        ref.step(30)
+        res.step(30)
+        assert_same(ref, res)
+        assert (ref.img == backend.from_device(res.img)).all()
+        assert (ref.census() == res.census()).all()
+    finally:
+        backend.close()
+
+
+@pytest.mark.parametrize("name", PRESETS)
+@pytest.mark.parametrize("rng", ["lcg", "counter"])
+def test_active_matches_cpu(name, rng):
+    ref, res = make_world(name, rng=rng), make_world(name, active.ActiveBackend(tile=8), rng=rng)
+    for i in range(6):
+        ref.step(5)
+        res.step(5)
+        assert_same(ref, res)
+
+
+@pytest.mark.parametrize("rng", ["lcg", "counter"])
+def test_batch_matches_single_worlds(rng):
+    preset = world.load_preset("coexistence", FIELD_WIDTH=64, FIELD_HEIGHT=48, CROSSOVER_RNG=rng)
+    seeds, death_speeds, birth_costs = [1, 2, 3], [0, 1, 23], [15, 0, 3]
+    worlds = batch.EvoLifeBatch(preset, seeds, DEATH_SPEED=death_speeds, BIRTH_COST=birth_costs)
+    worlds.step(20)
+    for k, (seed, death_speed, birth_cost) in enumerate(zip(seeds, death_speeds, birth_costs)):
+        single = make_world("coexistence", rng=rng, seed=seed, DEATH_SPEED=death_speed, BIRTH_COST=birth_cost)
+        single.step(20)
+        assert (worlds.field()[k] == single.field()).all()
+        if worlds.seeds is not None:
+            assert (worlds.seeds[k] == single.seeds).all()
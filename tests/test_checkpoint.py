@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from evolib import world, checkpoint
+
+
+@pytest.mark.parametrize("name", ["bliamba", "coexistence"])
+@pytest.mark.parametrize("rng", ["lcg", "counter"])
+def test_resume_matches_uninterrupted_run(tmpdir, name, rng):
+    path = str(tmpdir.join("run.ckpt"))
+    preset = world.load_preset(name, FIELD_WIDTH=64, FIELD_HEIGHT=48, RANDOM_SEED=5, CROSSOVER_RNG=rng)
+    ref = world.World(preset)
+    ref.step(15)
+    ref.save_checkpoint(path)
+    ref.step(15)
+    res = world.World.resume(path)
+    assert res.t == 15 and res.rng_key == ref.rng_key
+    res.step(15)
+    assert res.t == ref.t
+    for name in checkpoint.STATE:
+        if getattr(ref, name) is None:
+            assert getattr(res, name) is None
+        else:
+            assert (getattr(res, name) == getattr(ref, name)).all(), name
+
+
+def test_checkpoint_round_trip(tmpdir):
+    path = str(tmpdir.join("state.ckpt"))
+    rng = np.random.RandomState(1)
+    arrays = {"fld": rng.randint(0, 1 << 25, (30, 20)).astype(np.int32),
+              "bufs": np.zeros((30, 20), dtype=np.int32)}
+    params = {"name": "test", "DEATH_SPEED": 3, "rng_key": None}
+    checkpoint.save(path, arrays, params, 1234)
+    loaded, loaded_params, t = checkpoint.load(path)
+    assert t == 1234 and loaded_params == params
+    assert sorted(loaded) == sorted(arrays)
+    for k in arrays:
+        assert loaded[k].dtype == arrays[k].dtype and (loaded[k] == arrays[k]).all()
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from evolib import cpu, compact
+
+
+@pytest.mark.parametrize("shape", [(40, 32), (37, 29)])
+def test_round_trip(shape, soup):
+    fld, seeds = soup(*shape, genomes=50, density=0.4)
+    field = compact.CompactField(fld, seeds)
+    assert (field.to_fld() == fld).all()
+    assert (field.seeds == seeds).all()
+    assert field.nbytes() < fld.nbytes + seeds.nbytes
+
+
+@pytest.mark.parametrize("shape", [(40, 32), (37, 29)])
+@pytest.mark.parametrize("death_speed, birth_cost, max_genes", [(0, 0, 9), (23, 0, 9), (7, 3000, 5)])
+@pytest.mark.parametrize("rng_key", [None, 1234])
+def test_step_matches_cpu(shape, death_speed, birth_cost, max_genes, rng_key, soup):
+    w, h = shape
+    fld, seeds = soup(w, h, 50, 0.4)
+    field = compact.CompactField(fld, None if rng_key else seeds)
+    bufs, img = np.zeros_like(fld), np.zeros_like(fld)
+    f1, f2 = fld.copy(), np.zeros_like(fld)
+    for t in range(1, 16):
+        rng = None if rng_key is None else (rng_key, t)
+        cpu.ca_step(f1, f2, seeds, bufs, img, w, h, death_speed, birth_cost, max_genes, rng=rng)
+        cpu.ca_flush(f2, bufs, img, w, h, 1, 1)
+        f1, f2 = f2, f1
+        field.step(death_speed, birth_cost, max_genes, rng)
+        assert (field.to_fld() == f1).all()
+    if rng_key is None:
+        assert (field.seeds == seeds).all()
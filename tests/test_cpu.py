@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from evolib import cpu
+
+PARAMS = [(0, 0, 9), (23, 0, 9), (1, 3, 14), (0, 15, 4)]
+
+
+def run(fld, seeds, steps, params, rng_key=None, gather=False):
+    w, h = fld.shape
+    f1, f2 = fld.copy(), np.zeros_like(fld)
+    seeds = None if rng_key is not None else seeds.copy()
+    bufs, img = np.zeros_like(fld), np.zeros_like(fld)
+    for t in range(1, steps + 1):
+        rng = None if rng_key is None else (rng_key, t)
+        cpu.ca_step(f1, f2, seeds, bufs, img, w, h, *params, gather=gather, rng=rng)
+        cpu.ca_flush(f2, bufs, img, w, h, 6, 6, gather=gather)
+        f1, f2 = f2, f1
+    return f1, seeds
+
+
+@pytest.mark.parametrize("params", PARAMS)
+@pytest.mark.parametrize("rng_key", [None, 1234])
+def test_step_matches_reference(params, rng_key, soup, reference):
+    fld, seeds = soup(14, 11)
+    res, res_seeds = run(fld, seeds, 4, params, rng_key)
+    ref, ref_seeds = fld.copy(), seeds.copy()
+    bufs = np.zeros_like(fld)
+    for t in range(1, 5):
+        rng = None if rng_key is None else (rng_key, t)
+        ref = reference.ca_step(ref, ref_seeds, bufs, *params, rng=rng)
+        reference.ca_flush(ref, bufs)
+    assert (res == ref).all()
+    if rng_key is None:
+        assert (res_seeds == ref_seeds).all()
+
+
+@pytest.mark.parametrize("params", PARAMS)
+@pytest.mark.parametrize("rng_key", [None, 1234])
+def test_gather_matches_scatter(params, rng_key, soup):
+    fld, seeds = soup(40, 30)
+    res, res_seeds = run(fld, seeds, 20, params, rng_key)
+    gathered, gathered_seeds = run(fld, seeds, 20, params, rng_key, gather=True)
+    assert (res == gathered).all()
+    if rng_key is None:
+        assert (res_seeds == gathered_seeds).all()
+
+
+def test_birth_search_matches_loop(soup):
+    fld, seeds = soup(40, 30, 200)
+    f0 = fld.view(np.uint32)
+    nbrs = cpu.neighbours(f0)
+    assert (cpu.birth_search(f0, nbrs) == cpu.birth_search_loop(f0, nbrs)).all()
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from evolib import genome
+
+STRINGS = [
+    "3/23", "B3/S23", "b3/s23", "S23/B3", "s23/b3", "3/S23", "B3/23", "36/23", "/", "B/S",
+    "12345678/012345678", "/0", "1/",
+    "3B/23", "B3/S2B3", "B3/2S3", "BB3/S23", "B3/SS23", "S23/S3", "B23/B3", "3/B23",
+    "0/23", "9/23", "3/9", "3/23/", "323", "", "B3 /S23", "x/23", u"3/23", u"B3/S\xe923",
+]
+
+
+def parse(s):
+    try:
+        return genome.str2genome(s)
+    except ValueError:
+        return None
+
+
+@pytest.mark.parametrize("s", STRINGS)
+def test_parsers_agree(s):
+    expected = parse(s)
+    if expected is None:
+        with pytest.raises(ValueError):
+            genome.strs2genomes([s])
+    else:
+        assert genome.strs2genomes([s])[0] == expected
+
+
+def test_known_genomes():
+    assert genome.str2genome("3/23") == genome.str2genome("B3/S23") == 3076
+    assert parse("B3/S2B3") is None and parse("3B/23") is None
+
+
+@pytest.mark.parametrize("letters", [False, True])
+def test_round_trip(letters):
+    genomes = np.arange(genome.NUM_GENOMES, dtype=np.uint32)
+    strs = genome.genomes2strs(genomes, letters)
+    assert (genome.strs2genomes(strs) == genomes).all()
+    for g in genomes[::997]:
+        s = genome.genome2str(g, letters)
+        assert s == strs[g] and genome.str2genome(s) == g
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from evolib import cpu, hashlife
+
+
+class AlwaysJump(hashlife.Pacer):
+
+    def jumping(self):
+        return True
+
+
+def dense(fld, seeds, steps, max_genes, rng=None):
+    fld, seeds = fld.view(np.uint32), None if seeds is None else seeds.copy().view(np.uint32)
+    for t in range(steps):
+        step_rng = None if rng is None else (rng[0], rng[1] + t + 1)
+        fld = cpu.step_block(fld, seeds, 0, 0, max_genes, rng=step_rng)[0]
+    return fld.view(np.int32), None if seeds is None else seeds.view(np.int32)
+
+
+@pytest.mark.parametrize("genomes", [(3076,), (3076, 3108)])
+@pytest.mark.parametrize("rng", [None, (1234, 7)])
+def test_advance_arrays_matches_dense(genomes, rng, soup):
+    fld, seeds = soup(256, 64, genomes, 0.35, energy=False, bands=True)
+    seeds = None if rng else seeds
+    # let the soup settle a bit, so that jumps are taken
+    fld, seeds = dense(fld, seeds, 100, 9, rng)
+    rng = None if rng is None else (rng[0], rng[1] + 100)
+    pacer = AlwaysJump()
+    res, res_seeds = hashlife.advance_arrays(fld, seeds, 200, 9, rng, pacer=pacer)
+    ref, ref_seeds = dense(fld, seeds, 200, 9, rng)
+    assert (res == ref).all()
+    if seeds is not None:
+        assert (res_seeds == ref_seeds).all()
+    assert pacer.generations["jump"] > 0
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_pacer_backs_off_slow_jumps():
+    clock = FakeClock()
+    pacer = hashlife.Pacer(overhead=10, clock=clock)
+    assert not pacer.jumping()
+    pacer.stepped(16, 0.016)
+    assert pacer.jumping()
+    # a jump 10 times slower than dense steps loses 0.144 s
+    pacer.jumped(16, 0.16, 0, 10)
+    assert not pacer.jumping()
+    assert pacer.skip == 1440 and pacer.size == hashlife.MIN_JUMP
+    pacer.stepped(1440, 1.44)
+    assert pacer.jumping()
+    # jumps paying off grow
+    pacer.jumped(16, 0.001, 9, 10)
+    pacer.jumped(32, 0.001, 10, 10)
+    assert pacer.jumping() and pacer.size == 4 * hashlife.MIN_JUMP
+    assert "cache hits" in pacer.summary()
+
+
+def test_advance_arrays_falls_back_on_soup(soup):
+    fld, seeds = soup(64, 48, (3076,), 0.5, energy=False, bands=True)
+    pacer = hashlife.Pacer(overhead=1e9)
+    res, res_seeds = hashlife.advance_arrays(fld, seeds, 300, 9, pacer=pacer)
+    ref, ref_seeds = dense(fld, seeds, 300, 9)
+    assert (res == ref).all() and (res_seeds == ref_seeds).all()
+    assert pacer.generations["dense"] > 0
@@ -0,0 +1,157 @@
+import collections
+
+import numpy as np
+import pytest
+
+from evolib import cpu, genome, lineage
+
+# crossbreeding preset: Conway and Diamoeba, without aging nor BIRTH_COST,
+# so that each child is still there in the next snapshot
+GENOMES = (genome.str2genome("3/23"), genome.str2genome("35678/5678"))
+PARAMS = (0, 0, 9)
+
+
+def run(fld, seeds, steps, tracker, t0=5):
+    """
+    Step `fld` on cpu from step `t0`, draining `tracker` as evolife2 does,
+    return snapshots of each step, starting with `fld`, and drain steps.
+
+    """
+    w, h = fld.shape
+    f1, f2 = fld.copy(), np.zeros_like(fld)
+    bufs, img = np.zeros_like(fld), np.zeros_like(fld)
+    tracker.drain(t0, f1, w, h)
+    snapshots, drains = [f1.copy()], [t0]
+    for t in range(t0 + 1, t0 + steps + 1):
+        cpu.ca_step(f1, f2, seeds, bufs, img, w, h, *PARAMS, lineage=tracker.table(t))
+        cpu.ca_flush(f2, bufs, img, w, h, 6, 6)
+        f1, f2 = f2, f1
+        snapshots.append(f1.copy())
+        if tracker.due(t) or t == t0 + steps:
+            tracker.drain(t, f1, w, h)
+            drains.append(t)
+    return snapshots, drains
+
+
+def recount(before, after):
+    """
+    Counter of (parent, child) crossover edges from `before` field to
+    `after` one, a cell at a time.
+
+    """
+    w, h = before.shape
+    f, g = before.view(np.uint32).tolist(), after.view(np.uint32).tolist()
+    edges = collections.Counter()
+    for x in range(w):
+        for y in range(h):
+            f0 = f[x][y]
+            fs = [f[(x + dx) % w][(y + dy) % h] for dx, dy in cpu.NEIGHBOURS]
+            n = sum(1 for v in fs if v)
+            if f0 >> 17 >= 0xff or n == 0 or f0 and not (f0 >> 8) & (1 << n):
+                continue
+            ni = [k for k in range(8, 0, -1) if sum((v >> (k - 1)) & 1 for v in fs) == k]
+            child = g[x][y] & cpu.GENOME_MASK
+            if not ni or not child:
+                continue
+            parents = set(v & cpu.GENOME_MASK for v in fs if (v >> (ni[0] - 1)) & 1)
+            if child not in parents:
+                edges.update((p, child) for p in parents)
+    return edges
+
+
+def expected(snapshots, t0):
+    """
+    (edges, first step of edges, first seen step of genomes) recounted from snapshots.
+
+    """
+    edges, first, seen = collections.Counter(), {}, {}
+    for t, fld in enumerate(snapshots, t0):
+        for g in np.unique(fld.view(np.uint32) & cpu.GENOME_MASK):
+            seen.setdefault(int(g), t)
+        if t > t0:
+            step = recount(snapshots[t - t0 - 1], fld)
+            edges.update(step)
+            for edge in step:
+                first.setdefault(edge, t)
+    seen.pop(0)
+    return edges, first, seen
+
+
+def edge_dict(g):
+    return dict(((int(e) >> 17, int(e) & cpu.GENOME_MASK), (int(c), int(s)))
+                for e, c, s in zip(g.edges, g.edge_counts, g.edge_first))
+
+
+@pytest.mark.parametrize("every", [1, 64])
+def test_genealogy_matches_recount(every, soup):
+    fld, seeds = soup(40, 32, GENOMES, 0.5, energy=False)
+    tracker = lineage.LineageTracker(cpu, slots=1 << 12, every=every)
+    snapshots, drains = run(fld, seeds, 130, tracker)
+    edges, first, seen = expected(snapshots, 5)
+    g = tracker.genealogies[0]
+    assert len(edges) > 10 and tracker.dropped == 0
+    assert drains == sorted(set(range(5, 135, every)) | set([135]))
+    assert edge_dict(g) == dict((e, (c, first[e])) for e, c in edges.items())
+    assert dict(zip(g.genomes.tolist(), g.first_seen.tolist())) == seen
+    # abundance of each genome, from censuses at drains only
+    counts = [np.bincount(snapshots[t - 5].view(np.uint32).ravel() & cpu.GENOME_MASK, minlength=1 << 17)
+              for t in drains]
+    for gen in g.genomes:
+        series = [c[gen] for c in counts]
+        info = g.info(gen)
+        assert info["last"] == series[-1] and info["peak"] == max(series)
+        # genomes born and gone between drains are never counted
+        assert info["peak_step"] == (drains[series.index(max(series))] if info["peak"] else 0)
+
+
+def test_full_table_drops_events(soup):
+    fld, seeds = soup(40, 32, GENOMES, 0.5, energy=False)
+    tracker = lineage.LineageTracker(cpu, slots=8, every=16)
+    snapshots, drains = run(fld, seeds, 130, tracker)
+    edges = expected(snapshots, 5)[0]
+    g = tracker.genealogies[0]
+    assert tracker.dropped > 0
+    assert g.edge_counts.sum() + tracker.dropped == sum(edges.values())
+    for edge, (count, first) in edge_dict(g).items():
+        assert count <= edges[edge]
+
+
+def test_edge_add_keeps_stored_keys():
+    keys, counts = np.zeros(4, dtype=np.uint64), np.zeros(5, dtype=np.uint32)
+    cpu.edge_add(keys, counts, np.array([8, 6, 5, 7, 6], dtype=np.uint64))
+    cpu.edge_add(keys, counts, np.array([1, 5, 9, 5, 1], dtype=np.uint64))
+    assert keys.tolist() == [5, 6, 7, 8] and counts.tolist() == [3, 2, 1, 1, 3]
+
+
+@pytest.mark.parametrize("parent, child", [(cpu.GENOME_MASK, 1), (1, cpu.GENOME_MASK)])
+def test_key_round_trip_at_limits(parent, child):
+    parents = [np.array([parent])] + [np.zeros(1, dtype=np.int64)] * 7
+    world = (1 << 20) - 1
+    keys = cpu.lineage_keys(parents, np.array([1]), np.array([child]), np.array([world]), lineage.MAX_EVERY - 1)
+    assert [a.tolist() for a in lineage.unpack(keys)] == [[lineage.MAX_EVERY - 1], [world], [parent], [child]]
+
+
+def test_genealogy_merge():
+    g = lineage.Genealogy()
+    g.observe(0, np.bincount([3, 3, 5], minlength=1 << 17))
+    g.add_edges(np.array([10, 12]), np.array([3, 3]), np.array([7, 9]), np.array([2, 1]))
+    g.add_edges(np.array([8, 11]), np.array([3, 5]), np.array([7, 7]), np.array([1, 4]))
+    g.observe(20, np.bincount([7, 7, 7, 3], minlength=1 << 17))
+    g.observe(30, np.bincount([7, 9], minlength=1 << 17))
+    assert g.parents(7) == [(5, 4, 11), (3, 3, 8)]
+    assert g.children(3) == [(7, 3, 8), (9, 1, 12)]
+    assert g.info(3) == {"first_seen": 0, "peak": 2, "peak_step": 0, "last": 0}
+    assert g.info(7) == {"first_seen": 8, "peak": 3, "peak_step": 20, "last": 1}
+    assert g.info(9) == {"first_seen": 12, "peak": 1, "peak_step": 30, "last": 1}
+    assert g.origin(7) == [3] and g.ancestry(9) == {9: 0, 3: 1}
+
+
+def test_save_load(tmpdir, soup):
+    fld, seeds = soup(24, 20, GENOMES, 0.5, energy=False)
+    tracker = lineage.LineageTracker(cpu, every=8)
+    run(fld, seeds, 30, tracker)
+    path = str(tmpdir.join("run.lineage.npz"))
+    tracker.genealogies[0].save(path)
+    loaded = lineage.Genealogy.load(path)
+    for name, values in tracker.genealogies[0].__dict__.items():
+        assert (getattr(loaded, name) == values).all()
@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pytest
+
+from evolib import cpu, metrics
+
+PARAMS = [(23, 3, 14), (9, 0, 9)]
+
+
+def recount(before, mid, bufs, after):
+    """
+    Counters of a step, a cell at a time, from the field before the step,
+    after `ca_step`, its `bufs` and the field after `ca_flush`.
+
+    """
+    res = dict((name, 0) for name in metrics.METRICS)
+    w, h = before.shape
+    f0 = before.view(np.uint32).tolist()
+    for x in range(w):
+        for y in range(h):
+            c0, c1, b, c2 = [int(a.view(np.uint32)[x, y]) for a in (before, mid, bufs, after)]
+            g0, g1, g2 = c0 & cpu.GENOME_MASK, c1 & cpu.GENOME_MASK, c2 & cpu.GENOME_MASK
+            n = sum(f0[(x + dx) % w][(y + dy) % h] != 0 for dx, dy in cpu.NEIGHBOURS)
+            starved = c0 >> 17 >= 0xff
+            if g0 and (starved or n == 0 or not (c0 >> 8 >> n) & 1):
+                assert not g1
+                res["deaths_starvation" if starved else "deaths_sustain"] += 1
+            # cells taken over by a child over MAX_GENES are emptied, but not counted as deaths
+            res["births"] += bool(g1 and not g0)
+            res["reoccupations"] += bool(g0 and g1 and g1 != g0)
+            res["birth_cost"] += b >> 17
+            # BIRTH_COST charges kill cells running out of energy on flush
+            res["deaths_starvation"] += bool(g1 and not c2)
+            if g2:
+                assert c2 == (c1 + b) & 0xffffffff
+                res["live"] += 1
+                res["energy"] += c2 >> 17
+    return np.array([res[name] for name in metrics.METRICS], dtype=np.uint64)
+
+
+def run(fld, seeds, steps, params, stats):
+    """
+    Step `fld` on cpu, yield (before, mid, bufs, after) snapshots with
+    `stats` row of each step.
+
+    """
+    w, h = fld.shape[-2:]
+    f1, f2 = fld.copy(), np.zeros_like(fld)
+    bufs, img = np.zeros_like(fld), np.zeros_like(fld)
+    for t in range(1, steps + 1):
+        row = stats(t)
+        cpu.ca_step(f1, f2, seeds, bufs, img, w, h, *params, stats=row)
+        mid, charged = f2.copy(), bufs.copy()
+        cpu.ca_flush(f2, bufs, img, w, h, 6, 6, stats=row)
+        yield f1.copy(), mid, charged, f2.copy(), row
+        f1, f2 = f2, f1
+
+
+@pytest.mark.parametrize("params", PARAMS)
+def test_counters_match_recount(params, soup):
+    fld, seeds = soup(40, 30, 20, 0.4)
+    total = metrics.empty()
+    for before, mid, bufs, after, row in run(fld, seeds, 12, params, lambda t: metrics.empty()):
+        assert (row == recount(before, mid, bufs, after)).all()
+        total += row
+    counted = dict(zip(metrics.METRICS, total))
+    assert counted["births"] and counted["reoccupations"] and counted["deaths_sustain"]
+    assert counted["deaths_starvation"] and counted["energy"]
+    assert bool(counted["birth_cost"]) == bool(params[1])
+
+
+def test_batch_counters_match_recount(soup):
+    worlds = [soup(24, 20, 20, 0.4, seed=k) for k in range(3)]
+    fld, seeds = np.array([f for f, s in worlds]), np.array([s for f, s in worlds])
+    for before, mid, bufs, after, row in run(fld, seeds, 8, PARAMS[0], lambda t: metrics.empty(3)):
+        for k in range(3):
+            assert (row[k] == recount(before[k], mid[k], bufs[k], after[k])).all()
+
+
+def test_gathered_counters_match(soup):
+    fld, seeds = soup(40, 30, 20, 0.4)
+    w, h = fld.shape
+    rows = []
+    for gather in (False, True):
+        f1, f2, s = fld.copy(), np.zeros_like(fld), seeds.copy()
+        bufs, img, stats = np.zeros_like(fld), np.zeros_like(fld), metrics.empty()
+        for t in range(10):
+            cpu.ca_step(f1, f2, s, bufs, img, w, h, *PARAMS[0], gather=gather, stats=stats)
+            cpu.ca_flush(f2, bufs, img, w, h, 6, 6, gather=gather, stats=stats)
+            f1, f2 = f2, f1
+        rows.append(stats)
+    assert (rows[0] == rows[1]).all()
+
+
+def test_stream_round_trip(tmpdir, soup):
+    directory = str(tmpdir.join("run.metrics"))
+    fld, seeds = soup(40, 30, 20, 0.4)
+    stream = metrics.MetricsStream(cpu, directory, capacity=8)
+    rows = [row.copy() for before, mid, bufs, after, row in run(fld, seeds, 20, PARAMS[0], stream.slot)]
+    stream.close()
+    assert len(os.listdir(directory)) == 3
+    columns = metrics.load(directory)
+    assert (columns["step"] == np.arange(1, 21)).all()
+    for j, name in enumerate(metrics.METRICS):
+        assert (columns[name] == [row[j] for row in rows]).all()
+    live, energy = [np.array([row[metrics.METRICS.index(name)] for row in rows]) for name in ("live", "energy")]
+    assert np.allclose(columns["mean_energy"], energy / live.astype(np.float64))
+
+
+def test_load_empty(tmpdir):
+    with pytest.raises(ValueError):
+        metrics.load(str(tmpdir))
@@ -0,0 +1,40 @@
+import numpy as np
+
+from evolib import recorder
+
+
+def test_round_trip(tmpdir, snapshots):
+    path = str(tmpdir.join("run.evr"))
+    flds = snapshots(37, 29, 12)
+    rec = recorder.Recorder(path, 37, 29, params={"preset": "test"}, keyframe_every=4)
+    for t, fld in enumerate(flds):
+        rec.record(t * 10, fld)
+    rec.close()
+    recording = recorder.Recording(path)
+    assert recording.params == {"preset": "test"} and recording.shape == (37, 29)
+    assert recording.steps == [t * 10 for t in range(len(flds))]
+    # random access order, with and without the decoding cache
+    for t in [11, 3, 4, 0, 7, 8, 9, 2]:
+        assert (recording.field(t * 10) == flds[t]).all()
+    recording.close()
+
+
+def test_rle_round_trip():
+    rng = np.random.RandomState(2)
+    diff = np.where(rng.random_sample(5000) < 0.05, rng.randint(1, 1 << 17, 5000), 0).astype(np.uint32)
+    assert (recorder.rle_decode(recorder.rle_encode(diff), len(diff)) == diff).all()
+
+
+def test_interrupted_recording(tmpdir, snapshots):
+    path = str(tmpdir.join("cut.evr"))
+    flds = snapshots(20, 16, 5)
+    rec = recorder.Recorder(path, 20, 16, keyframe_every=2)
+    for t, fld in enumerate(flds):
+        rec.record(t, fld)
+    rec.close()
+    with open(path, "r+b") as f:
+        f.seek(0, 2)
+        f.truncate(f.tell() - 3)
+    recording = recorder.Recording(path)
+    assert recording.steps == [0, 1, 2, 3]
+    assert (recording.field(3) == flds[3]).all()
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from evolib import cpu
+from evolib.spatial import SpatialIndex, as_genome
+
+
+def brute_force(genomes, rect):
+    w, h = genomes.shape
+    x0, y0, x1, y1 = rect
+    cells = genomes[max(x0, 0):min(x1, w), max(y0, 0):min(y1, h)].ravel()
+    counts = np.bincount(cells[cells > 0], minlength=cpu.GENOME_MASK + 1)
+    return dict((g, counts[g]) for g in np.flatnonzero(counts))
+
+
+@pytest.fixture
+def field():
+    rng = np.random.RandomState(1)
+    species = np.array([0, 0, 3076, 6152, 1234, 99999], dtype=np.uint32)
+    energy = rng.randint(0, 100, (300, 170)).astype(np.uint32) << cpu.NUM_GENES
+    return species[rng.randint(0, len(species), (300, 170))] | energy
+
+
+@pytest.mark.parametrize("rect", [
+    (0, 0, 300, 170),
+    (0, 0, 300, 270),
+    (10, 20, 140, 150),
+    (64, 64, 128, 128),
+    (-10, -5, 70, 400),
+    (250, 100, 1000, 1000),
+    (299, 169, 300, 170),
+    (100, 100, 100, 150),
+])
+def test_species_in_matches_brute_force(field, rect):
+    index = SpatialIndex(field, tile=64)
+    genomes, counts = index.species_in(rect)
+    assert dict(zip(genomes, counts)) == brute_force(index.genomes, rect)
+    assert (np.diff(counts) <= 0).all()
+
+
+def test_where_and_bbox(field):
+    index = SpatialIndex(field, tile=64)
+    genomes = field & cpu.GENOME_MASK
+    tiles, counts = index.where("3/23")
+    assert counts.sum() == (genomes == 3076).sum()
+    assert index.count_by_tile().sum() == (genomes > 0).sum()
+    x, y = np.nonzero(genomes == 1234)
+    assert index.bbox(1234) == (x.min(), y.min(), x.max() + 1, y.max() + 1)
+    assert index.bbox(5) is None
+
+
+def test_as_genome_text_types():
+    assert as_genome("3/23") == as_genome(u"3/23") == as_genome(u"B3/S23") == 3076
+    assert as_genome(np.uint32(3076)) == 3076